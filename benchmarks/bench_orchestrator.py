@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+Drive ``orchestrator.run_queue`` and ``monitor_queue`` against a local
+:class:`WESStub` over HTTP and report dispatch throughput and monitor
+sweep latency for queues of increasing size.
+
+Example:
+
+    python benchmarks/bench_orchestrator.py --runs 10 1000 10000 \\
+        --latency 0.01 --run-duration 5 60
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+from common import REPO_ROOT, summarize, print_table
+from wfinterop import orchestrator
+from wfinterop.stubs import WESStub
+from wfinterop.util import save_json, save_yaml
+
+QUEUE_ID = 'bench_queue'
+WES_ID = 'wes_stub'
+TESTDATA = os.path.join(REPO_ROOT, 'tests', 'testdata')
+
+
+def _write_config(workdir, stub):
+    """
+    Write app config, queue config and an empty submission queue into
+    ``workdir`` and return their paths.
+    """
+    config_path = os.path.join(workdir, 'config.yaml')
+    queues_path = os.path.join(workdir, 'queues.yaml')
+    submission_queue = os.path.join(workdir, 'submission_queue.json')
+    save_yaml(config_path, {'toolregistries': {},
+                            'workflowservices': {WES_ID: stub.config()}})
+    save_yaml(queues_path, {QUEUE_ID: {
+        'target_queue': None,
+        'trs_id': None,
+        'version_id': None,
+        'wes_default': WES_ID,
+        'wes_opts': [WES_ID],
+        'workflow_attachments': [
+            'file://' + os.path.join(TESTDATA, 'md5sum.input')],
+        'workflow_id': None,
+        'workflow_type': 'CWL',
+        'workflow_url': 'file://' + os.path.join(TESTDATA, 'md5sum.cwl')}})
+    save_json(submission_queue, {})
+    return config_path, queues_path, submission_queue
+
+
+def _seed_queue(submission_queue, runs):
+    """
+    Write ``runs`` RECEIVED submissions straight into the queue file, so
+    seeding cost is not part of the measurement.
+    """
+    params = 'file://' + os.path.join(TESTDATA, 'md5sum.cwl.json')
+    save_json(submission_queue, {QUEUE_ID: {
+        '{:012d}'.format(i): {'status': 'RECEIVED',
+                              'data': params,
+                              'wes_id': WES_ID}
+        for i in range(runs)
+    }})
+
+
+def run_benchmark(runs=10, sweeps=3, latency=0.0, failure_rate=0.0,
+                  run_duration=3600.0, error_rate=0.0, seed=0):
+    """
+    Seed a queue with ``runs`` submissions, dispatch it to a WES stub and
+    sweep it ``sweeps`` times.
+
+    Returns:
+        dict: throughput, request counts and sweep timings
+    """
+    workdir = tempfile.mkdtemp(prefix='wfinterop-bench-')
+    result = {'runs': runs}
+    with WESStub(latency=latency,
+                 failure_rate=failure_rate,
+                 run_duration=run_duration,
+                 error_rate=error_rate,
+                 seed=seed) as stub, ExitStack() as stack:
+        paths = _write_config(workdir, stub)
+        config_path, queues_path, submission_queue = paths
+        _seed_queue(submission_queue, runs)
+        stack.enter_context(mock.patch('wfinterop.config.config_path',
+                                       config_path))
+        stack.enter_context(mock.patch('wfinterop.config.queues_path',
+                                       queues_path))
+        stack.enter_context(mock.patch('wfinterop.queue.submission_queue',
+                                       submission_queue))
+        # skip the fixed post-submit wait in run_job
+        stack.enter_context(mock.patch('wfinterop.orchestrator.SUBMIT_WAIT',
+                                       0))
+
+        start = time.time()
+        try:
+            queue_log = orchestrator.run_queue(QUEUE_ID, wes_id=WES_ID)
+            dispatched = len(queue_log)
+        except Exception as err:
+            result['dispatch_error'] = str(err)
+            dispatched = stub.requests['RunWorkflow']
+        elapsed = time.time() - start
+        result['dispatch'] = {
+            'dispatched': dispatched,
+            'wall_s': round(elapsed, 4),
+            'runs_per_s': round(dispatched / elapsed, 2) if elapsed else None,
+            'wes_requests': dict(stub.requests)
+        }
+
+        latencies = []
+        sweep_requests = 0
+        for _ in range(sweeps):
+            stub.reset_counts()
+            start = time.time()
+            try:
+                orchestrator.monitor_queue(QUEUE_ID)
+            except Exception as err:
+                result['monitor_error'] = str(err)
+                break
+            latencies.append(time.time() - start)
+            sweep_requests += sum(stub.requests.values())
+        per_sweep = (round(sweep_requests / float(len(latencies)), 1)
+                     if latencies else None)
+        result['monitor'] = dict(
+            summarize(latencies),
+            sweeps=len(latencies),
+            wes_requests_per_sweep=per_sweep
+        )
+        result['final_states'] = dict(stub.state_counts())
+    return result
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, nargs='+',
+                        default=[10, 1000, 10000])
+    parser.add_argument('--sweeps', type=int, default=3)
+    parser.add_argument('--latency', type=float, nargs='+', default=[0.0],
+                        help='constant per-request latency, or low and high '
+                             'bounds of a uniform distribution')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--run-duration', type=float, nargs='+',
+                        default=[3600.0],
+                        help='constant run duration, or low and high bounds '
+                             'of a uniform distribution')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', default=False)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+
+    def _spec(values):
+        return values[0] if len(values) == 1 else tuple(values[:2])
+
+    results = [run_benchmark(runs=n,
+                             sweeps=args.sweeps,
+                             latency=_spec(args.latency),
+                             failure_rate=args.failure_rate,
+                             run_duration=_spec(args.run_duration),
+                             error_rate=args.error_rate,
+                             seed=args.seed)
+               for n in args.runs]
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+    print_table(['runs', 'dispatch_s', 'runs/s', 'sweep_p50_s',
+                 'sweep_max_s', 'wes_req/sweep'],
+                [[res['runs'],
+                  res['dispatch']['wall_s'],
+                  res['dispatch']['runs_per_s'],
+                  res['monitor'].get('p50_s', '-'),
+                  res['monitor'].get('max_s', '-'),
+                  res['monitor']['wes_requests_per_sweep']]
+                 for res in results])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
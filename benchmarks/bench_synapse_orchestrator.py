@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Drive ``synapse_orchestrator.run_queue`` and ``monitor_queue`` against an
+in-process :class:`SynapseStub` and report how many Synapse requests each
+submission costs and how long monitor sweeps take.
+
+Example:
+
+    python benchmarks/bench_synapse_orchestrator.py --submissions 1000 \\
+        --sweeps 3 --conflict-rate 0.05 --throttle-rate 0.01
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from unittest import mock
+
+from common import summarize, print_table
+from wfinterop import synapse_orchestrator
+from wfinterop.stubs import SynapseStub
+
+QUEUE_ID = '9614000'
+
+
+class InstantWES(object):
+    """
+    Minimal WES double that accepts every run and reports it COMPLETE
+    after ``run_duration`` seconds, so the benchmark isolates Synapse cost.
+    """
+    def __init__(self, run_duration=3600.0):
+        self.run_duration = run_duration
+        self.started = {}
+
+    def __call__(self, wes_id):
+        return self
+
+    def run_workflow(self, request, parts=None):
+        run_id = uuid.uuid4().hex
+        self.started[run_id] = time.time()
+        return {'run_id': run_id}
+
+    def get_run_status(self, id):
+        elapsed = time.time() - self.started.get(id, 0)
+        state = 'COMPLETE' if elapsed >= self.run_duration else 'RUNNING'
+        return {'run_id': id, 'state': state}
+
+
+def run_benchmark(submissions=100, sweeps=3, latency=0.0, conflict_rate=0.0,
+                  throttle_rate=0.0, run_duration=3600.0, seed=0):
+    """
+    Seed a queue, dispatch it once and sweep it ``sweeps`` times.
+
+    Returns:
+        dict: request counts and timings for the dispatch and sweeps
+    """
+    syn = SynapseStub(latency=latency,
+                      conflict_rate=conflict_rate,
+                      throttle_rate=throttle_rate,
+                      seed=seed)
+    for _ in range(submissions):
+        syn.add_submission(QUEUE_ID, file_path='params.json')
+
+    wes = InstantWES(run_duration=run_duration)
+    queues = {QUEUE_ID: {'workflow_url': 'file://workflow.cwl',
+                         'workflow_attachments': [],
+                         'target_queue': None}}
+    retry_waits = []
+    throttled = Counter()
+    result = {'submissions': submissions}
+
+    with ExitStack() as stack:
+        for module in ('wfinterop.orchestrator',
+                       'wfinterop.synapse_orchestrator'):
+            stack.enter_context(mock.patch(module + '.queue_config',
+                                           lambda: queues))
+            stack.enter_context(mock.patch(module + '.WES', wes))
+        stack.enter_context(mock.patch('wfinterop.orchestrator.wes_config',
+                                       lambda: {'local': {}}))
+        # skip the fixed post-submit wait in run_job
+        stack.enter_context(mock.patch('wfinterop.orchestrator.SUBMIT_WAIT',
+                                       0))
+        stack.enter_context(mock.patch('synapseclient.core.retry.doze',
+                                       retry_waits.append))
+
+        start = time.time()
+        queue_log = synapse_orchestrator.run_queue(syn, QUEUE_ID,
+                                                   wes_id='local')
+        result['dispatch'] = {
+            'dispatched': len(queue_log),
+            'wall_s': round(time.time() - start, 4),
+            'requests': dict(syn.requests),
+            'requests_per_submission': round(
+                sum(syn.requests.values()) / float(max(submissions, 1)), 2
+            )
+        }
+
+        latencies = []
+        sweep_requests = 0
+        for _ in range(sweeps):
+            throttled.update(syn.throttled)
+            syn.reset_counts()
+            start = time.time()
+            synapse_orchestrator.monitor_queue(syn, QUEUE_ID)
+            latencies.append(time.time() - start)
+            sweep_requests += sum(syn.requests.values())
+        result['monitor'] = dict(
+            summarize(latencies),
+            sweeps=sweeps,
+            requests_per_submission=round(
+                sweep_requests / float(max(submissions * sweeps, 1)), 2
+            )
+        )
+
+    throttled.update(syn.throttled)
+    result['throttled'] = sum(throttled.values())
+    result['retries'] = len(retry_waits)
+    result['retry_wait_s'] = round(sum(retry_waits), 2)
+    result['final_status'] = dict(syn.status_counts(QUEUE_ID))
+    return result
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--submissions', type=int, nargs='+',
+                        default=[10, 1000, 10000])
+    parser.add_argument('--sweeps', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every Synapse request')
+    parser.add_argument('--conflict-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--run-duration', type=float, default=3600.0,
+                        help='seconds before dispatched runs report COMPLETE')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', default=False)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    workdir = tempfile.mkdtemp(prefix='wfinterop-bench-')
+    os.chdir(workdir)
+
+    results = [run_benchmark(submissions=n,
+                             sweeps=args.sweeps,
+                             latency=args.latency,
+                             conflict_rate=args.conflict_rate,
+                             throttle_rate=args.throttle_rate,
+                             run_duration=args.run_duration,
+                             seed=args.seed)
+               for n in args.submissions]
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+    print_table(['submissions', 'dispatch_s', 'dispatch_req/sub',
+                 'sweep_p50_s', 'sweep_req/sub', 'throttled', 'retries'],
+                [[res['submissions'],
+                  res['dispatch']['wall_s'],
+                  res['dispatch']['requests_per_submission'],
+                  res['monitor'].get('p50_s', '-'),
+                  res['monitor']['requests_per_submission'],
+                  res['throttled'],
+                  res['retries']] for res in results])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
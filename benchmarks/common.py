@@ -0,0 +1,37 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def summarize(latencies):
+    """
+    Return mean, median and max of a list of durations in seconds.
+    """
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+    return {'mean_s': round(sum(latencies) / len(latencies), 4),
+            'p50_s': round(latencies[len(latencies) // 2], 4),
+            'max_s': round(latencies[-1], 4)}
+
+
+def print_table(columns, rows):
+    """
+    Print rows of values under right-aligned column headers.
+
+    Args:
+        columns (list): column headers
+        rows (list): list of lists of values, one per row
+    """
+    widths = [max(len(str(v)) for v in [col] + [row[i] for row in rows])
+              for i, col in enumerate(columns)]
+    line = ' '.join('{{:>{}}}'.format(w) for w in widths)
+    print(line.format(*columns))
+    for row in rows:
+        print(line.format(*row))
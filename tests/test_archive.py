@@ -0,0 +1,38 @@
+import gzip
+import json
+import os
+
+from wfinterop import archive
+from wfinterop.archive import find_submission, is_terminal, iter_submissions
+from wfinterop.archive import read_index, write_segments
+from wfinterop.ids import new_id
+
+
+def test_is_terminal():
+    assert is_terminal({'status': 'FAILED'})
+    assert is_terminal({'status': 'SUBMITTED',
+                        'run_log': {'status': 'CANCELED'}})
+    assert not is_terminal({'status': 'SUBMITTED',
+                            'run_log': {'status': 'RUNNING'}})
+    assert not is_terminal({'status': 'RECEIVED'})
+
+
+def test_write_segments(tmpdir, monkeypatch):
+    monkeypatch.setattr(archive, 'SEGMENT_SIZE', 2)
+    archive_dir = str(tmpdir.join('archive'))
+    sub_ids = [new_id() for _ in range(3)]
+    submissions = [(sub_id, {'status': 'COMPLETE', 'n': n})
+                   for n, sub_id in enumerate(sub_ids)]
+
+    test_entries = write_segments(archive_dir, 'mock_queue_1',
+                                  reversed(submissions))
+
+    assert [entry['count'] for entry in test_entries] == [2, 1]
+    assert test_entries[0]['min_id'] == sub_ids[0]
+    assert read_index(archive_dir) == test_entries
+    with gzip.open(os.path.join(archive_dir, test_entries[1]['segment']),
+                   'rt') as f:
+        assert json.loads(f.readline())['id'] == sub_ids[2]
+    assert find_submission(archive_dir, 'mock_queue_1', sub_ids[1])['n'] == 1
+    assert find_submission(archive_dir, 'mock_queue_2', sub_ids[1]) is None
+    assert list(iter_submissions(archive_dir, 'mock_queue_1')) == submissions
@@ -0,0 +1,44 @@
+import pytest
+import requests
+
+from wfinterop import callbacks
+
+
+@pytest.fixture()
+def receiver():
+    receiver = callbacks.serve(0, token='mock_token')
+    yield receiver
+    receiver.stop()
+
+
+def test_receive_run_states(receiver):
+    headers = {'Authorization': 'Bearer mock_token'}
+    res = requests.post(receiver.url + '/runs/mock_run',
+                        json={'state': 'RUNNING'}, headers=headers)
+    assert res.status_code == 202
+    requests.post(receiver.url + '/runs/mock_run',
+                  json={'state': 'COMPLETE'}, headers=headers)
+    requests.post(receiver.url,
+                  json={'run_id': 'mock_run_2', 'state': 'EXECUTOR_ERROR'},
+                  headers=headers)
+
+    assert receiver.wait(1)
+    assert receiver.drain() == {'mock_run': 'COMPLETE',
+                                'mock_run_2': 'EXECUTOR_ERROR'}
+    assert receiver.drain() == {}
+    assert not receiver.wait(0.01)
+
+
+def test_reject_run_states(receiver):
+    res = requests.post(receiver.url + '/runs/mock_run',
+                        json={'state': 'COMPLETE'})
+    assert res.status_code == 401
+
+    headers = {'Authorization': 'Bearer mock_token'}
+    res = requests.post(receiver.url + '/runs/mock_run',
+                        json={'state': 'DONE'}, headers=headers)
+    assert res.status_code == 400
+    res = requests.post(receiver.url + '/runs/mock_run', data='not json',
+                        headers=headers)
+    assert res.status_code == 400
+    assert receiver.drain() == {}
@@ -0,0 +1,81 @@
+import time
+
+import yaml
+
+from wfinterop import credentials
+from wfinterop.credentials import (AuthHeaders, CachedCredential,
+                                   CommandProvider, FileProvider, expand)
+from wfinterop.util import get_yaml
+
+
+class MockProvider(object):
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self.calls = 0
+
+    def fetch(self):
+        self.calls += 1
+        return 'token_{}'.format(self.calls), time.time() + self.ttl
+
+
+def test_cached_credential():
+    provider = MockProvider()
+    credential = CachedCredential(provider, refresh_margin=300)
+    assert credential.get() == 'token_1'
+    assert credential.get() == 'token_1'
+    assert provider.calls == 1
+
+    # values about to expire are fetched again
+    provider.ttl = 100
+    credential.refresh()
+    assert credential.get() == 'token_3'
+
+
+def test_background_refresh(monkeypatch):
+    monkeypatch.setattr(credentials, 'RETRY_WAIT', 0.01)
+    provider = MockProvider(ttl=0.02)
+    credential = CachedCredential(provider, refresh_margin=0)
+    credential.start_refresh()
+    try:
+        deadline = time.time() + 5
+        while provider.calls < 3 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        credential.stop_refresh()
+    assert provider.calls >= 3
+
+
+def test_providers(tmpdir):
+    token_file = tmpdir.join('token')
+    token_file.write('file_token\n')
+    assert FileProvider(str(token_file)).fetch()[0] == 'file_token'
+    assert CommandProvider(['echo', 'command_token']).fetch()[0] == \
+        'command_token'
+
+
+def test_expand(monkeypatch, tmpdir):
+    provider = MockProvider()
+    credentials.register('MOCK_TOKEN', provider)
+    monkeypatch.setenv('MOCK_VAR', 'env_value')
+    try:
+        test_value = expand('Bearer ${MOCK_TOKEN} ${MOCK_VAR} ${UNSET:x}')
+        assert test_value == 'Bearer token_1 env_value x'
+        assert test_value.template == \
+            'Bearer ${MOCK_TOKEN} ${MOCK_VAR} ${UNSET:x}'
+        # configs are saved with the reference, not the secret
+        assert yaml.dump({'auth': test_value}) == \
+            "auth: Bearer ${MOCK_TOKEN} ${MOCK_VAR} ${UNSET:x}\n"
+
+        config_file = tmpdir.join('config.yaml')
+        config_file.write("auth:\n  Authorization: Bearer ${MOCK_TOKEN}\n")
+        get_yaml(str(config_file))
+        test_auth = get_yaml(str(config_file))['auth']
+        assert test_auth['Authorization'] == 'Bearer token_1'
+        assert provider.calls == 1
+
+        test_headers = AuthHeaders(test_auth)
+        credentials.get_credential('MOCK_TOKEN')
+        credentials._credentials['MOCK_TOKEN'].refresh()
+        assert dict(test_headers) == {'Authorization': 'Bearer token_2'}
+    finally:
+        credentials.unregister('MOCK_TOKEN')
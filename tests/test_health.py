@@ -0,0 +1,84 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from wfinterop import health
+
+
+@pytest.fixture(autouse=True)
+def mock_health(monkeypatch):
+    monkeypatch.setattr('wfinterop.health._clients', {})
+    monkeypatch.setattr('wfinterop.health._health', {})
+    monkeypatch.setattr('wfinterop.health._pending', {})
+
+
+def test_check_services(monkeypatch):
+    release = threading.Event()
+    mock_trs = mock.Mock()
+    up_wes = mock.Mock()
+    down_wes = mock.Mock()
+    down_wes.get_service_info.side_effect = ConnectionError('refused')
+    slow_wes = mock.Mock()
+    slow_wes.get_service_info.side_effect = lambda: release.wait(5)
+    wes_clients = {'up': up_wes, 'down': down_wes, 'slow': slow_wes}
+    built = []
+    monkeypatch.setattr('wfinterop.health.TRS', lambda trs_id: mock_trs)
+    monkeypatch.setattr('wfinterop.health.WES',
+                        lambda wes_id: built.append(wes_id)
+                        or wes_clients[wes_id])
+
+    start = time.time()
+    status = health.check_services(
+        {health.TOOL_REGISTRIES: ['mock_trs', 'mock_trs'],
+         health.WORKFLOW_SERVICES: ['up', 'down', 'slow']},
+        timeout=0.5
+    )
+    assert time.time() - start < 2
+    assert status == {'toolregistries': {'mock_trs': True},
+                      'workflowservices': {'up': True, 'down': False,
+                                           'slow': False}}
+    assert health.get_health('workflowservices', 'up')['latency'] >= 0
+    assert 'refused' in health.get_health('workflowservices',
+                                          'down')['error']
+    assert health.SERVICE_UP.value(kind='workflowservices',
+                                   service_id='down') == 0
+
+    # the stuck probe is shared rather than started again
+    health.check_services({health.WORKFLOW_SERVICES: ['slow']}, timeout=0)
+    assert slow_wes.get_service_info.call_count == 1
+    release.set()
+
+    # healthy clients are reused; failed ones are rebuilt
+    health.check_services({health.WORKFLOW_SERVICES: ['up', 'down']},
+                          timeout=1)
+    assert built.count('up') == 1
+    assert built.count('down') == 2
+
+
+def test_is_down(monkeypatch):
+    mock_wes = mock.Mock()
+    mock_wes.get_service_info.side_effect = ConnectionError('refused')
+    monkeypatch.setattr('wfinterop.health.WES', lambda wes_id: mock_wes)
+
+    assert not health.is_down('workflowservices', 'local')
+    health.check_services({health.WORKFLOW_SERVICES: ['local']}, timeout=1)
+    assert health.is_down('workflowservices', 'local')
+    assert 'local' in health.snapshot()['workflowservices']
+
+    # stale results are ignored
+    assert not health.is_down('workflowservices', 'local', ttl=-1)
+    assert health.snapshot(ttl=-1) == {}
+
+
+def test_is_down_check(monkeypatch):
+    mock_wes = mock.Mock()
+    mock_wes.get_service_info.side_effect = ConnectionError('refused')
+    monkeypatch.setattr('wfinterop.health.WES', lambda wes_id: mock_wes)
+
+    assert health.is_down('workflowservices', 'local', check=True,
+                          timeout=1)
+    # the probe result is cached for later checks
+    assert health.is_down('workflowservices', 'local', check=True)
+    mock_wes.get_service_info.assert_called_once_with()
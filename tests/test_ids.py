@@ -0,0 +1,39 @@
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from wfinterop.ids import id_timestamp
+from wfinterop.ids import is_id
+from wfinterop.ids import min_id
+from wfinterop.ids import new_id
+
+
+def _make_ids(n):
+    return [new_id() for _ in range(n)]
+
+
+def test_new_id_ordered():
+    test_ids = _make_ids(1000)
+
+    assert all(is_id(test_id) for test_id in test_ids)
+    assert test_ids == sorted(test_ids)
+    assert len(set(test_ids)) == len(test_ids)
+
+
+def test_new_id_unique_across_threads_and_processes():
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        thread_ids = sum(pool.map(_make_ids, [500] * 8), [])
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        process_ids = sum(pool.map(_make_ids, [500] * 4), [])
+
+    test_ids = thread_ids + process_ids
+    assert len(set(test_ids)) == len(test_ids)
+
+
+def test_id_timestamp():
+    now = time.time()
+    test_id = new_id(timestamp=now)
+
+    assert abs(id_timestamp(test_id) - now) < 0.002
+    assert min_id(now - 1) < test_id < min_id(now + 1)
+    assert id_timestamp('19101912345678901234') is None
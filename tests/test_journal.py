@@ -0,0 +1,37 @@
+from wfinterop import journal
+
+
+def test_apply_event():
+    submissions = {}
+    for record in [
+        journal.event('created', 'mock_queue_1', 'mock_sub',
+                      {'status': 'RECEIVED', 'lease': {'owner': 'w'}}),
+        journal.event('updated', 'mock_queue_1', 'mock_sub',
+                      {'status': 'SUBMITTED'}, unset=['lease']),
+        journal.event('created', 'mock_queue_1', 'mock_sub_2', {}),
+        journal.event('removed', 'mock_queue_1', 'mock_sub_2')
+    ]:
+        journal.apply_event(submissions, record)
+
+    assert submissions == {'mock_queue_1': {
+        'mock_sub': {'status': 'SUBMITTED'}
+    }}
+
+
+def test_append_read(tmpdir):
+    path = str(tmpdir.join('queue.journal.jsonl'))
+    records = [journal.event('created', 'mock_queue_1', 'mock_sub'),
+               journal.event('updated', 'mock_queue_2', 'mock_sub',
+                             {'status': 'COMPLETE'})]
+    journal.append(path, records)
+    with open(path, 'a') as f:
+        f.write('{"partial')
+
+    test_records, test_offset = journal.read(path)
+    assert test_records == records
+    assert journal.read(path, test_offset) == ([], test_offset)
+    assert list(journal.history(path, queue_id='mock_queue_2')) == \
+        records[1:]
+
+    journal.write_offset(path, test_offset)
+    assert journal.read_offset(path) == test_offset
@@ -0,0 +1,40 @@
+import time
+
+from wfinterop.lease import LeaseKeeper
+from wfinterop.lease import lease_active
+from wfinterop.lease import new_lease
+
+
+def test_lease_active():
+    assert lease_active(new_lease('worker_1', ttl=60))
+    assert not lease_active(new_lease('worker_1', ttl=-1))
+    assert not lease_active(None)
+    assert not lease_active({'owner': 'worker_1', 'expires': 0})
+
+
+def test_lease_keeper_renews_and_drops_lost_leases():
+    renewed = []
+
+    def mock_renew(key, ttl):
+        renewed.append((key, ttl))
+        return key != 'lost_sub'
+
+    keeper = LeaseKeeper(renew=mock_renew, ttl=30)
+    keeper.hold('mock_sub')
+    keeper.hold('lost_sub')
+    keeper.renew_all()
+    keeper.renew_all()
+
+    assert renewed.count(('mock_sub', 30)) == 2
+    assert renewed.count(('lost_sub', 30)) == 1
+    assert keeper.lost == {'lost_sub'}
+
+
+def test_lease_keeper_thread():
+    renewed = []
+    with LeaseKeeper(renew=lambda key, ttl: renewed.append(key) or True,
+                     ttl=30, interval=0.01) as keeper:
+        keeper.hold('mock_sub')
+        time.sleep(0.1)
+        keeper.release('mock_sub')
+    assert 'mock_sub' in renewed
@@ -0,0 +1,110 @@
+import pytest
+import requests
+
+from wfinterop import metrics
+from wfinterop.metrics import Registry
+from wfinterop.stubs import WESStub
+
+
+def test_counter_and_gauge():
+    registry = Registry()
+    calls = registry.counter('calls', 'Calls', ['endpoint'])
+    calls.inc(endpoint='a')
+    calls.inc(2, endpoint='a')
+    runs = registry.gauge('runs', 'Runs', ['queue_id', 'state'])
+    runs.set(3, queue_id='q1', state='RUNNING')
+    runs.set(1, queue_id='q2', state='RUNNING')
+    runs.remove(queue_id='q1')
+
+    assert calls.value(endpoint='a') == 3
+    assert registry.counter('calls') is calls
+    assert registry.snapshot()['runs'] == {
+        (('queue_id', 'q2'), ('state', 'RUNNING')): 1
+    }
+    with pytest.raises(ValueError):
+        calls.inc(wrong='a')
+    with pytest.raises(ValueError):
+        registry.gauge('calls')
+
+
+def test_histogram_render():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', ['endpoint'],
+                                 buckets=(0.1, 1))
+    latency.observe(0.05, endpoint='a')
+    latency.observe(0.5, endpoint='a')
+    latency.observe(5, endpoint='a')
+
+    test_snapshot = registry.snapshot()['latency_seconds'][
+        (('endpoint', 'a'),)
+    ]
+    assert test_snapshot['count'] == 3
+    assert test_snapshot['sum'] == pytest.approx(5.55)
+
+    test_text = registry.render()
+    assert '# TYPE latency_seconds histogram' in test_text
+    assert 'latency_seconds_bucket{endpoint="a",le="0.1"} 1' in test_text
+    assert 'latency_seconds_bucket{endpoint="a",le="1"} 2' in test_text
+    assert 'latency_seconds_bucket{endpoint="a",le="+Inf"} 3' in test_text
+    assert 'latency_seconds_count{endpoint="a"} 3' in test_text
+
+
+def test_instrument():
+    registry = Registry()
+    calls = registry.counter('calls', labelnames=['name', 'outcome'])
+    latency = registry.histogram('seconds', labelnames=['name'])
+
+    @metrics.instrument(calls, latency, name=lambda value: value)
+    def check(value):
+        if value == 'bad':
+            raise ValueError(value)
+        return value
+
+    check('good')
+    with pytest.raises(ValueError):
+        check('bad')
+
+    assert calls.value(name='good', outcome='ok') == 1
+    assert calls.value(name='bad', outcome='error') == 1
+    assert latency.snapshot()[('good',)]['count'] == 1
+
+
+def test_record_runs():
+    metrics.record_runs('mock_queue', {'RUNNING': 2, 'COMPLETE': 5})
+    metrics.record_runs('mock_queue', {'QUEUED': 1, 'COMPLETE': 7})
+
+    assert metrics.snapshot()['wfinterop_runs_in_flight'] == {
+        (('queue_id', 'mock_queue'), ('state', 'QUEUED')): 1
+    }
+    metrics.RUNS_IN_FLIGHT.clear()
+
+
+def test_wes_calls_recorded(monkeypatch):
+    from wfinterop.wes import WES
+
+    with WESStub() as stub:
+        mock_wes_config = {'wes_stub': stub.config()}
+        monkeypatch.setattr('wfinterop.wes.client.wes_config',
+                            lambda: mock_wes_config)
+        before = metrics.WES_REQUESTS.value(wes_id='wes_stub',
+                                            endpoint='GetServiceInfo',
+                                            outcome='ok')
+        WES('wes_stub').get_service_info()
+
+        assert metrics.WES_REQUESTS.value(wes_id='wes_stub',
+                                          endpoint='GetServiceInfo',
+                                          outcome='ok') == before + 1
+
+
+def test_serve():
+    registry = Registry()
+    registry.counter('calls', 'Calls').inc()
+    server = metrics.serve(0, registry=registry)
+    try:
+        res = requests.get('http://127.0.0.1:{}/metrics'
+                           .format(server.server_address[1]))
+        assert res.status_code == 200
+        assert 'calls_total 1' in res.text
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,6 +1,6 @@
 from unittest import mock
 import pytest
-import datetime as dt
+import time
 
 from bravado.requests_client import RequestsClient
 from bravado.client import SwaggerClient, ResourceDecorator
@@ -29,8 +29,8 @@ def test_run_job(mock_queue_config,
                         lambda **kwargs: None)
     monkeypatch.setattr('wfinterop.orchestrator.WES', 
                         lambda wes_id: mock_wes)
-    monkeypatch.setattr('wfinterop.orchestrator.update_submission', 
-                        lambda w,x,y,z: None)
+    monkeypatch.setattr('wfinterop.orchestrator.update_submission_fields',
+                        lambda x, y, **kwargs: None)
 
     mock_request = {'workflow_url': None,
                     'workflow_params': mock_submission['mock_sub']['data'],
@@ -45,6 +45,38 @@ def test_run_job(mock_queue_config,
 
     mock_wes.run_workflow.assert_called_once_with(mock_request, parts=None)
     assert 'start_time' in test_run_log
+    assert 'fingerprint' not in test_run_log
+
+
+def test_run_job_reuse(mock_queue_config,
+                       mock_wes_config,
+                       mock_submission,
+                       mock_wes,
+                       monkeypatch):
+    monkeypatch.setattr('wfinterop.orchestrator.queue_config',
+                        lambda: mock_queue_config)
+    monkeypatch.setattr('wfinterop.orchestrator.wes_config',
+                        lambda: mock_wes_config)
+    monkeypatch.setattr('wfinterop.orchestrator.fetch_queue_workflow',
+                        lambda x: mock_queue_config[x])
+    monkeypatch.setattr('wfinterop.orchestrator.WES',
+                        lambda wes_id: mock_wes)
+    mock_prior_run = {'run_id': 'mock_prior_run', 'status': 'COMPLETE'}
+    monkeypatch.setattr('wfinterop.orchestrator.find_run',
+                        lambda x, y: ('mock_queue_1', 'mock_prior_sub',
+                                      mock_prior_run))
+
+    test_run_log = run_job(queue_id='mock_queue_1',
+                           wes_id='mock_wes',
+                           wf_jsonyaml=mock_submission['mock_sub']['data'],
+                           submission=True,
+                           reuse=True)
+
+    mock_wes.run_workflow.assert_not_called()
+    assert test_run_log['run_id'] == 'mock_prior_run'
+    assert test_run_log['status'] == 'COMPLETE'
+    assert test_run_log['reused_from'] == 'mock_prior_sub'
+    assert 'fingerprint' in test_run_log
 
 
 def test_run_submission(mock_submission, 
@@ -53,8 +85,8 @@ def test_run_submission(mock_submission,
                         monkeypatch):
     monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
                         lambda x,y: mock_submission['mock_sub'])
-    monkeypatch.setattr('wfinterop.orchestrator.update_submission', 
-                        lambda w,x,y,z: None)
+    monkeypatch.setattr('wfinterop.orchestrator.update_submission_fields',
+                        lambda x, y, **kwargs: None)
 
     monkeypatch.setattr('wfinterop.orchestrator.run_job', 
                         lambda **kwargs: mock_run_log)
@@ -89,6 +121,68 @@ def test_run_queue(mock_queue_config,
     assert test_queue_log == mock_queue_log
 
 
+def test_run_queue_down_wes(mock_submission, monkeypatch):
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions',
+                        lambda x,status: ['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle',
+                        lambda x,y: mock_submission['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.health.is_down',
+                        lambda kind, wes_id: wes_id == 'mock_wes')
+    mock_run = mock.Mock()
+    monkeypatch.setattr('wfinterop.orchestrator.run_submission', mock_run)
+
+    test_queue_log = run_queue(queue_id='mock_queue_1', wes_id='local')
+
+    assert test_queue_log == {}
+    mock_run.assert_not_called()
+
+
+def test_run_queue_prepare(mock_submission, monkeypatch):
+    mock_submissions = {
+        'mock_sub': {},
+        'mock_sub_leased': {'lease': {'owner': 'other_worker',
+                                      'expires': time.time() + 60}},
+        'mock_sub_down': {'wes_id': 'down_wes'},
+        'mock_sub_lost': {}
+    }
+    for sub_id, fields in mock_submissions.items():
+        fields.update(dict(mock_submission['mock_sub'], data=sub_id,
+                           **fields))
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions',
+                        lambda x,status: list(mock_submissions))
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle',
+                        lambda x,y: mock_submissions[y])
+    monkeypatch.setattr('wfinterop.orchestrator.health.is_down',
+                        lambda kind, wes_id: wes_id == 'down_wes')
+    mock_futures = {}
+    monkeypatch.setattr('wfinterop.orchestrator.prepare_job',
+                        lambda queue_id, data, opts, **kwargs:
+                        mock_futures.setdefault(data, mock.Mock()))
+    monkeypatch.setattr('wfinterop.orchestrator.claim_submission',
+                        lambda x, sub_id, **kwargs:
+                        None if sub_id in ('mock_sub_leased',
+                                           'mock_sub_lost') else {})
+    monkeypatch.setattr('wfinterop.orchestrator.release_submission',
+                        lambda *args: None)
+    monkeypatch.setattr('wfinterop.orchestrator.renew_lease',
+                        lambda *args: None)
+    mock_run = mock.Mock(return_value={'run_id': 'mock_run'})
+    monkeypatch.setattr('wfinterop.orchestrator.run_submission', mock_run)
+
+    test_queue_log = run_queue(queue_id='mock_queue_1', wes_id='local',
+                               opts={}, lease_ttl=60, worker_id='worker_1',
+                               prepare_processes=1)
+
+    assert list(test_queue_log) == ['mock_sub']
+    assert (mock_run.call_args[1]['prepared']
+            is mock_futures['mock_sub'])
+    # requests are only built for submissions this worker may send, and
+    # dropped if another worker claims the submission first
+    assert sorted(mock_futures) == ['mock_sub', 'mock_sub_lost']
+    mock_futures['mock_sub_lost'].cancel.assert_called_once_with()
+    mock_futures['mock_sub'].cancel.assert_not_called()
+
+
 def test_monitor_queue(mock_submission, 
                        mock_queue_log, 
                        mock_wes, 
@@ -99,21 +193,78 @@ def test_monitor_queue(mock_submission,
                         lambda x,y: mock_submission['mock_sub'])
     monkeypatch.setattr('wfinterop.orchestrator.WES', 
                         lambda wes_id: mock_wes)
-    monkeypatch.setattr('wfinterop.orchestrator.convert_timedelta', 
-                        lambda x: 0)
-    monkeypatch.setattr('wfinterop.orchestrator.ctime2datetime', 
-                        lambda x: dt.datetime.now())
-    monkeypatch.setattr('wfinterop.orchestrator.update_submission', 
-                        lambda w,x,y,z: None)
-    
+    mock_updates = []
+    monkeypatch.setattr('wfinterop.orchestrator.apply_updates',
+                        mock_updates.extend)
+
     mock_wes.get_run_status.return_value = {'run_id': 'mock_run', 
                                             'state': 'RUNNING'}
 
-    mock_start_time = dt.datetime.now()
+    mock_start_time = time.time()
+    mock_submission['mock_sub']['run_log']['start_time'] = mock_start_time
+    mock_queue_log['mock_sub']['start_time'] = mock_start_time
 
     test_queue_log = monitor_queue('mock_queue_1')
     assert test_queue_log == mock_queue_log
+    assert mock_updates == [('mock_queue_1', 'mock_sub',
+                             {'run_log': mock_queue_log['mock_sub']})]
 
 
+def test_monitor_queue_poll_error(mock_submission, mock_wes, monkeypatch):
+    mock_submission['mock_sub_2'] = dict(
+        mock_submission['mock_sub'],
+        run_log=dict(mock_submission['mock_sub']['run_log'],
+                     run_id='mock_run_2')
+    )
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions',
+                        lambda **kwargs: ['mock_sub', 'mock_sub_2'])
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle',
+                        lambda x,y: mock_submission[y])
+    monkeypatch.setattr('wfinterop.orchestrator.WES',
+                        lambda wes_id: mock_wes)
+    mock_updates = []
+    monkeypatch.setattr('wfinterop.orchestrator.apply_updates',
+                        mock_updates.extend)
+    mock_wes.get_run_status.side_effect = [
+        {'run_id': 'mock_run', 'state': 'RUNNING'},
+        ConnectionError('mock_error')
+    ]
+
+    with pytest.raises(ConnectionError):
+        monitor_queue('mock_queue_1')
+    assert [update[1] for update in mock_updates] == ['mock_sub']
+    assert mock_updates[0][2]['run_log']['status'] == 'RUNNING'
+
+
+def test_monitor_queue_run_states(mock_queue_config,
+                                  mock_submission,
+                                  mock_wes,
+                                  monkeypatch):
+    monkeypatch.setattr('wfinterop.orchestrator.queue_config',
+                        lambda: mock_queue_config)
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions',
+                        lambda **kwargs: ['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle',
+                        lambda x,y: mock_submission['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.WES',
+                        lambda wes_id: mock_wes)
+    monkeypatch.setattr('wfinterop.orchestrator.apply_updates',
+                        lambda updates: None)
+    mock_submission['mock_sub']['run_log'].update(status='RUNNING',
+                                                  start_time=time.time())
+
+    # pushed states are used without polling WES
+    test_queue_log = monitor_queue('mock_queue_1',
+                                   run_states={'mock_run': 'COMPLETE'},
+                                   poll_interval=300)
+    assert test_queue_log['mock_sub']['status'] == 'COMPLETE'
+    mock_wes.get_run_status.assert_not_called()
 
+    # runs learned about recently are not polled until reconciliation
+    mock_submission['mock_sub']['run_log']['status'] = 'RUNNING'
+    monitor_queue('mock_queue_1', poll_interval=300)
+    mock_wes.get_run_status.assert_not_called()
 
+    mock_wes.get_run_status.return_value = {'state': 'RUNNING'}
+    monitor_queue('mock_queue_1', poll_interval=0)
+    mock_wes.get_run_status.assert_called_once_with('mock_run')
@@ -0,0 +1,74 @@
+import json
+import os
+import pstats
+
+import yaml
+
+from wfinterop.profiling import StackSampler
+from wfinterop.profiling import profile_cycle
+
+TESTDATA = os.path.abspath(os.path.join('tests', 'testdata'))
+
+
+def test_stack_sampler(tmpdir):
+    def mock_busy_loop():
+        total = 0
+        for i in range(3 * 10 ** 6):
+            total += i
+        return total
+
+    with StackSampler(interval=0.001) as sampler:
+        mock_busy_loop()
+    sampler.write(str(tmpdir.join('mock.collapsed')))
+
+    test_lines = tmpdir.join('mock.collapsed').read().splitlines()
+    assert any('mock_busy_loop (test_profiling.py' in line
+               for line in test_lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in test_lines)
+
+
+def test_profile_cycle_stub(tmpdir, monkeypatch):
+    queues_file = tmpdir.join('queues.yaml')
+    queues_file.write(yaml.dump({'mock_queue': {
+        'target_queue': None,
+        'trs_id': None,
+        'version_id': None,
+        'wes_default': 'local',
+        'wes_opts': ['local'],
+        'workflow_attachments': [
+            'file://' + os.path.join(TESTDATA, 'md5sum.input')],
+        'workflow_id': None,
+        'workflow_type': 'CWL',
+        'workflow_url': 'file://' + os.path.join(TESTDATA, 'md5sum.cwl')
+    }}))
+    config_file = tmpdir.join('config.yaml')
+    config_file.write(yaml.dump({'toolregistries': {},
+                                 'workflowservices': {}}))
+    mock_submissions = {'mock_queue': {
+        'mock_sub_{}'.format(i): {
+            'status': 'RECEIVED',
+            'data': 'file://' + os.path.join(TESTDATA, 'md5sum.cwl.json'),
+            'wes_id': 'local'
+        } for i in range(3)
+    }}
+    # dispatched before profiling, so unknown to the stub
+    mock_submissions['mock_queue']['mock_sub_prior'] = {
+        'status': 'SUBMITTED',
+        'data': 'file://' + os.path.join(TESTDATA, 'md5sum.cwl.json'),
+        'wes_id': 'local',
+        'run_log': {'run_id': 'mock_prior_run', 'status': 'RUNNING',
+                    'start_time': 0}
+    }
+    queue_file = tmpdir.join('submission_queue.json')
+    queue_file.write(json.dumps(mock_submissions))
+    monkeypatch.setattr('wfinterop.config.config_path', str(config_file))
+    monkeypatch.setattr('wfinterop.config.queues_path', str(queues_file))
+    monkeypatch.setattr('wfinterop.queue.submission_queue', str(queue_file))
+
+    test_result = profile_cycle('monitor', 'mock_queue', stub=True,
+                                output=str(tmpdir.join('mock_profile')))
+
+    stats = pstats.Stats(test_result['pstats'])
+    assert any(func[2] == 'monitor_queue' for func in stats.stats)
+    assert os.path.exists(test_result['collapsed'])
+    assert json.loads(queue_file.read()) == mock_submissions
@@ -2,12 +2,27 @@ import logging
 from unittest import mock
 import pytest
 import json
+import time
 import datetime as dt
 
 from wfinterop.queue import create_submission
 from wfinterop.queue import get_submissions
 from wfinterop.queue import get_submission_bundle
 from wfinterop.queue import update_submission
+from wfinterop.queue import claim_submission
+from wfinterop.queue import renew_lease
+from wfinterop.queue import release_submission
+from wfinterop.queue import find_run
+from wfinterop.queue import get_submissions_since
+from wfinterop.queue import create_submissions
+from wfinterop.queue import read_manifest
+from wfinterop.queue import update_submission_fields
+from wfinterop.queue import apply_updates
+from wfinterop.queue import archive_submissions
+from wfinterop.queue import compact, get_history
+from wfinterop.queue import query_submissions
+from wfinterop.queue import get_changes, changes_cursor
+from wfinterop.ids import min_id
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -83,4 +98,308 @@ def test_update_submission(mock_submissionqueue,
     mock_submission['mock_sub']['status'] = 'COMPLETE'
     mock_bundle = json.loads(json.dumps(mock_submission['mock_sub'], 
                                         default=str))
-    assert test_queue['mock_queue_1']['mock_sub'] == mock_bundle
\ No newline at end of file
+    assert test_queue['mock_queue_1']['mock_sub'] == mock_bundle
+
+
+def test_claim_submission(mock_submissionqueue,
+                          mock_submission,
+                          monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    mock_submission['mock_sub']['status'] = 'RECEIVED'
+    mock_queue = {'mock_queue_1': mock_submission}
+    mock_submissionqueue.write(json.dumps(mock_queue, indent=4,
+                               default=str))
+
+    test_lease = claim_submission('mock_queue_1', 'mock_sub',
+                                  worker_id='worker_1', ttl=60)
+    assert test_lease['owner'] == 'worker_1'
+    assert claim_submission('mock_queue_1', 'mock_sub',
+                            worker_id='worker_2', ttl=60) is None
+    assert renew_lease('mock_queue_1', 'mock_sub', 'worker_1', ttl=60)
+    assert not renew_lease('mock_queue_1', 'mock_sub', 'worker_2', ttl=60)
+
+    # worker_1 dies without releasing; its lease runs out
+    renew_lease('mock_queue_1', 'mock_sub', 'worker_1', ttl=-1)
+    test_lease = claim_submission('mock_queue_1', 'mock_sub',
+                                  worker_id='worker_2', ttl=60)
+    assert test_lease['owner'] == 'worker_2'
+
+    assert release_submission('mock_queue_1', 'mock_sub', 'worker_2')
+    with open(str(mock_submissionqueue), 'r') as f:
+        test_queue = json.load(f)
+    assert 'lease' not in test_queue['mock_queue_1']['mock_sub']
+
+
+def test_claim_submission_status(mock_submissionqueue,
+                                 mock_submission,
+                                 monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    mock_submission['mock_sub']['status'] = 'SUBMITTED'
+    mock_queue = {'mock_queue_1': mock_submission}
+    mock_submissionqueue.write(json.dumps(mock_queue, indent=4,
+                               default=str))
+
+    assert claim_submission('mock_queue_1', 'mock_sub',
+                            worker_id='worker_1') is None
+
+
+def test_find_run(mock_submissionqueue,
+                  mock_submission,
+                  monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    mock_submission['mock_sub']['run_log']['fingerprint'] = 'mock_hash'
+    mock_submission['mock_sub']['run_log']['status'] = 'COMPLETE'
+    mock_queue = {'mock_queue_1': mock_submission}
+    mock_submissionqueue.write(json.dumps(mock_queue, indent=4,
+                               default=str))
+
+    test_run = find_run('mock_hash', 'mock_wes')
+    assert test_run[:2] == ('mock_queue_1', 'mock_sub')
+    assert test_run[2]['run_id'] == 'mock_run'
+    assert find_run('mock_hash', 'other_wes') is None
+    assert find_run('other_hash', 'mock_wes') is None
+
+    # the WES the run was sent to, for submissions without their own
+    mock_submission['mock_sub']['wes_id'] = None
+    mock_submission['mock_sub']['run_log']['wes_id'] = 'local'
+    mock_submissionqueue.write(json.dumps(mock_queue, indent=4,
+                               default=str))
+    assert find_run('mock_hash', 'local')[1] == 'mock_sub'
+    assert find_run('mock_hash', 'mock_wes') is None
+
+
+def test_get_submissions_since(mock_submissionqueue, monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    test_sub_ids = [create_submission(queue_id='mock_queue_1',
+                                      submission_data={})
+                    for _ in range(5)]
+    update_submission('mock_queue_1', test_sub_ids[4], 'status', 'COMPLETE')
+
+    assert get_submissions_since('mock_queue_1', test_sub_ids[1]) \
+        == test_sub_ids[2:]
+    assert get_submissions_since('mock_queue_1', 0) == test_sub_ids
+    assert get_submissions_since('mock_queue_1', time.time() + 1) == []
+    assert get_submissions_since('mock_queue_1', test_sub_ids[1],
+                                 status=['RECEIVED']) == test_sub_ids[2:4]
+
+
+def test_create_submissions(mock_submissionqueue, tmpdir, monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    monkeypatch.setattr('wfinterop.queue.PARALLEL_VALIDATION_MIN', 2)
+    mock_params = []
+    for i in range(3):
+        mock_params_file = tmpdir.join('params_{}.json'.format(i))
+        mock_params_file.write(json.dumps({'input': i}))
+        mock_params.append('file://' + str(mock_params_file))
+
+    test_sub_ids = create_submissions('mock_queue_1',
+                                      iter(mock_params + [{'input': 3}]),
+                                      wes_id='local', processes=2)
+
+    with open(str(mock_submissionqueue), 'r') as f:
+        test_queue = json.load(f)
+    assert list(test_queue['mock_queue_1']) == test_sub_ids
+    assert [test_queue['mock_queue_1'][sub_id]['data']
+            for sub_id in test_sub_ids] == mock_params + [{'input': 3}]
+    assert all(bundle['wes_id'] == 'local'
+               for bundle in test_queue['mock_queue_1'].values())
+
+    with pytest.raises(ValueError):
+        create_submissions('mock_queue_1',
+                           mock_params + [str(tmpdir.join('missing.json'))])
+    with open(str(mock_submissionqueue), 'r') as f:
+        assert len(json.load(f)['mock_queue_1']) == 4
+
+
+def test_read_manifest(tmpdir):
+    mock_manifest = tmpdir.join('manifest.jsonl')
+    mock_manifest.write('\n'.join([
+        json.dumps('params.json'),
+        json.dumps({'data': 'https://example.com/p.json', 'wes_id': 'wes2'}),
+        json.dumps({'input': 1}),
+        ''
+    ]))
+
+    assert list(read_manifest(str(mock_manifest))) == [
+        ('file://' + str(tmpdir.join('params.json')), None),
+        ('https://example.com/p.json', 'wes2'),
+        ({'input': 1}, None)
+    ]
+
+
+def test_apply_updates(mock_submissionqueue, monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    test_sub_ids = create_submissions('mock_queue_1', [{}, {}])
+
+    update_submission_fields('mock_queue_1', test_sub_ids[0],
+                             status='SUBMITTED', run_log={'run_id': 'run_1'})
+    apply_updates([('mock_queue_1', test_sub_ids[0], {'status': 'COMPLETE'}),
+                   ('mock_queue_1', test_sub_ids[1], {'status': 'FAILED'})])
+
+    with open(str(mock_submissionqueue), 'r') as f:
+        test_queue = json.load(f)['mock_queue_1']
+    assert test_queue[test_sub_ids[0]]['status'] == 'COMPLETE'
+    assert test_queue[test_sub_ids[0]]['run_log'] == {'run_id': 'run_1'}
+    assert test_queue[test_sub_ids[1]]['status'] == 'FAILED'
+
+    with pytest.raises(KeyError):
+        apply_updates([('mock_queue_1', test_sub_ids[1], {'status': 'X'}),
+                       ('mock_queue_1', 'missing_sub', {'status': 'X'})])
+    assert get_submission_bundle('mock_queue_1',
+                                 test_sub_ids[1])['status'] == 'FAILED'
+
+
+def test_archive_submissions(mock_submissionqueue, monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    test_sub_ids = create_submissions('mock_queue_1', [{}, {}, {}])
+    apply_updates([
+        ('mock_queue_1', test_sub_ids[0],
+         {'status': 'COMPLETE',
+          'run_log': {'status': 'COMPLETE', 'start_time': 1000,
+                      'elapsed_time': 100}}),
+        ('mock_queue_1', test_sub_ids[1],
+         {'status': 'SUBMITTED',
+          'run_log': {'status': 'RUNNING', 'start_time': 1000}})
+    ])
+
+    test_archived = archive_submissions(max_age=3600, now=1100 + 3601)
+
+    assert test_archived == {'mock_queue_1': 1}
+    assert get_submissions('mock_queue_1', status=['COMPLETE']) == []
+    assert (get_submission_bundle('mock_queue_1', test_sub_ids[0])
+            ['run_log']['elapsed_time'] == 100)
+    assert set(get_submissions('mock_queue_1',
+                               status=['RECEIVED', 'SUBMITTED'])) == \
+        set(test_sub_ids[1:])
+    with pytest.raises(KeyError):
+        get_submission_bundle('mock_queue_1', 'missing_sub')
+
+
+def test_journal(mock_submissionqueue, monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    monkeypatch.setattr('wfinterop.queue.use_journal', True)
+    monkeypatch.setattr('wfinterop.queue.SNAPSHOT_EVERY', 6)
+    with open(str(mock_submissionqueue), 'r') as f:
+        mock_queue = json.load(f)
+
+    test_sub_ids = create_submissions('mock_queue_1', [{}, {}])
+    claim_submission('mock_queue_1', test_sub_ids[0], worker_id='worker_1')
+    update_submission_fields('mock_queue_1', test_sub_ids[0],
+                             status='SUBMITTED')
+    release_submission('mock_queue_1', test_sub_ids[0], worker_id='worker_1')
+
+    # changes are only appended to the journal until the next snapshot
+    with open(str(mock_submissionqueue), 'r') as f:
+        assert json.load(f) == mock_queue
+    assert get_submission_bundle('mock_queue_1', test_sub_ids[0]) == {
+        'status': 'SUBMITTED', 'data': {}, 'wes_id': None
+    }
+    assert get_submissions('mock_queue_1', status=['RECEIVED']) == \
+        test_sub_ids[1:]
+    assert [event['type'] for event in
+            get_history(submission_id=test_sub_ids[0])] == \
+        ['created', 'updated', 'updated', 'updated']
+
+    update_submission('mock_queue_1', test_sub_ids[1], 'status', 'FAILED')
+    with open(str(mock_submissionqueue), 'r') as f:
+        test_queue = json.load(f)
+    assert test_queue['mock_queue_1'][test_sub_ids[1]]['status'] == 'FAILED'
+
+    update_submission('mock_queue_1', test_sub_ids[1], 'status', 'COMPLETE')
+    compact()
+    with open(str(mock_submissionqueue), 'r') as f:
+        test_queue = json.load(f)
+    assert test_queue['mock_queue_1'][test_sub_ids[1]]['status'] == 'COMPLETE'
+    assert len(list(get_history('mock_queue_1'))) == 7
+
+
+def test_journal_other_writers(mock_submissionqueue, monkeypatch):
+    from wfinterop import journal, queue
+
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    monkeypatch.setattr('wfinterop.queue.use_journal', True)
+    test_sub_id = create_submission('mock_queue_1', {})
+
+    # another worker's change, appended after this process's last write
+    journal.append(queue.journal_path(),
+                   [journal.event('created', 'mock_queue_1', 'mock_sub',
+                                  {'status': 'RECEIVED'})])
+    apply_updates([('mock_queue_1', 'mock_sub', {'status': 'SUBMITTED'}),
+                   ('mock_queue_1', test_sub_id, {'status': 'FAILED'})])
+
+    assert get_submission_bundle('mock_queue_1', 'mock_sub') == \
+        {'status': 'SUBMITTED'}
+    assert get_submission_bundle('mock_queue_1',
+                                 test_sub_id)['status'] == 'FAILED'
+
+
+def test_query_submissions(mock_submissionqueue, monkeypatch):
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    with mock.patch('wfinterop.queue.new_id',
+                    side_effect=[min_id(1000 + i) for i in range(6)]):
+        test_sub_ids = create_submissions(
+            'mock_queue_1', [({}, 'mock_wes' if i % 2 else None)
+                             for i in range(6)]
+        )
+    update_submission('mock_queue_1', test_sub_ids[1], 'status', 'COMPLETE')
+
+    test_page = list(query_submissions('mock_queue_1', limit=2))
+    assert [sub_id for sub_id, _ in test_page] == test_sub_ids[:2]
+    test_page = list(query_submissions('mock_queue_1', cursor=test_page[-1][0],
+                                       limit=2))
+    assert [sub_id for sub_id, _ in test_page] == test_sub_ids[2:4]
+    assert [sub_id for sub_id, _ in query_submissions(
+        'mock_queue_1', status='RECEIVED', wes_id='mock_wes'
+    )] == [test_sub_ids[3], test_sub_ids[5]]
+    assert [sub_id for sub_id, _ in query_submissions(
+        'mock_queue_1', since=1002, until=1005, offset=1
+    )] == test_sub_ids[3:5]
+
+
+def test_get_changes(mock_submissionqueue, monkeypatch):
+    import threading
+
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_submissionqueue))
+    monkeypatch.setattr('wfinterop.queue.use_journal', True)
+    test_sub_id = create_submission('mock_queue_1', {})
+    update_submission_fields('mock_queue_1', test_sub_id, status='SUBMITTED',
+                             run_log={'status': 'RUNNING'})
+    # no change of state
+    update_submission_fields('mock_queue_1', test_sub_id,
+                             run_log={'status': 'RUNNING', 'elapsed_time': 5})
+
+    test_changes, test_cursor = get_changes(0)
+    assert [(change['type'], change['status'], change['run_status'])
+            for change in test_changes] == [('created', 'RECEIVED', None),
+                                            ('updated', 'SUBMITTED',
+                                             'RUNNING')]
+    assert test_changes[1]['previous_status'] == 'RECEIVED'
+    assert test_cursor == changes_cursor()
+    assert get_changes(test_cursor, timeout=0.01) == ([], test_cursor)
+
+    timer = threading.Timer(0.1, update_submission,
+                            ('mock_queue_1', test_sub_id, 'status',
+                             'COMPLETE'))
+    timer.start()
+    start = time.time()
+    test_changes, _ = get_changes(test_cursor, timeout=10)
+    timer.join()
+    assert time.time() - start < 5
+    assert test_changes[0]['status'] == 'COMPLETE'
+    assert get_changes(0, queue_id='mock_queue_2') == ([], changes_cursor())
+
+    # without the journal there is no feed to read
+    monkeypatch.setattr('wfinterop.queue.use_journal', False)
+    with pytest.raises(ValueError):
+        get_changes(0)
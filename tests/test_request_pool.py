@@ -0,0 +1,39 @@
+import os
+from io import StringIO
+
+from wfinterop.trs2wes import build_wes_request
+from wfinterop.request_pool import RequestPool
+from wfinterop.request_pool import freeze_parts
+from wfinterop.request_pool import thaw_parts
+
+TESTDATA = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+def test_freeze_parts():
+    mock_parts = [('workflow_type', 'CWL'),
+                  ('workflow_attachment', ('mock.input', StringIO('mock')))]
+    test_descriptors = freeze_parts(mock_parts)
+
+    assert test_descriptors == [('workflow_type', 'CWL'),
+                                ('workflow_attachment',
+                                 ('mock.input', 'mock'))]
+    test_parts = thaw_parts(test_descriptors)
+    assert test_parts[0] == ('workflow_type', 'CWL')
+    assert test_parts[1][1][0] == 'mock.input'
+    assert test_parts[1][1][1].read() == 'mock'
+
+
+def test_request_pool_prepare():
+    build_kwargs = {
+        'workflow_file': os.path.join(TESTDATA, 'md5sum.cwl'),
+        'jsonyaml': 'file://' + os.path.join(TESTDATA, 'md5sum.cwl.json'),
+        'attachments': ['file://' + os.path.join(TESTDATA, 'md5sum.input')],
+        'attach_descriptor': True
+    }
+    pool = RequestPool(processes=1)
+    try:
+        test_descriptors = pool.prepare(**build_kwargs).result()
+    finally:
+        pool.shutdown()
+
+    assert test_descriptors == freeze_parts(build_wes_request(**build_kwargs))
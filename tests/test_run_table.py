@@ -0,0 +1,56 @@
+import numpy as np
+
+from wfinterop.run_table import RunTable
+
+
+def test_run_table_update_queue_log():
+    run_table = RunTable(capacity=2)
+    run_table.update_queue_log('mock_queue_1', {
+        'mock_sub_1': {'status': 'RUNNING', 'wes_id': 'mock_wes_1',
+                       'start_time': 100.0},
+        'mock_sub_2': {'status': 'QUEUED', 'wes_id': 'mock_wes_2',
+                       'start_time': 'Thu Jan  1 00:00:00 2015'},
+        'mock_sub_3': {'status': 'PENDING'}
+    }, now=200.0)
+    run_table.update_queue_log('mock_queue_2', {
+        'mock_sub_1': {'status': 'COMPLETE', 'wes_id': 'mock_wes_1',
+                       'start_time': 150.0}
+    }, now=200.0)
+
+    assert len(run_table) == 4
+    assert run_table.state_counts() == {'PENDING': 1, 'QUEUED': 1,
+                                        'RUNNING': 1, 'COMPLETE': 1}
+    assert run_table.state_counts('mock_queue_2') == {'COMPLETE': 1}
+    assert run_table.wes_state_counts() == {
+        None: {'PENDING': 1},
+        'mock_wes_1': {'RUNNING': 1, 'COMPLETE': 1},
+        'mock_wes_2': {'QUEUED': 1}
+    }
+    assert not run_table.all_terminal()
+    assert run_table.all_terminal(['mock_queue_2'])
+
+
+def test_run_table_elapsed():
+    run_table = RunTable()
+    run_table.update('mock_queue_1', 'mock_sub_1', 'RUNNING',
+                     start_time=100.0, now=110.0)
+    run_table.update('mock_queue_1', 'mock_sub_2', 'RUNNING',
+                     start_time=100.0, now=110.0)
+    run_table.update('mock_queue_1', 'mock_sub_2', 'EXECUTOR_ERROR',
+                     now=120.0)
+    run_table.update('mock_queue_1', 'mock_sub_2', 'EXECUTOR_ERROR',
+                     now=150.0)
+
+    test_elapsed = run_table.elapsed(now=200.0)
+    assert np.array_equal(test_elapsed, [100.0, 20.0])
+    assert run_table.elapsed_percentiles((50,), active=True,
+                                         now=200.0) == {50: 100.0}
+    assert 'mock_queue_1' in run_table.summary()
+
+
+def test_run_table_new_state():
+    run_table = RunTable()
+    run_table.update('mock_queue_1', 'mock_sub_1', 'SOME_NEW_STATE')
+
+    assert run_table.state_counts() == {'SOME_NEW_STATE': 1}
+    assert not run_table.all_terminal()
@@ -0,0 +1,84 @@
+import threading
+
+from wfinterop.sharding import HashRing
+from wfinterop.sharding import ShardedWorker
+from wfinterop.sharding import get_members
+from wfinterop.sharding import join
+from wfinterop.sharding import leave
+from wfinterop.sharding import shard_metrics
+
+
+def test_hash_ring_assign():
+    queue_ids = ['queue_{}'.format(i) for i in range(200)]
+    ring = HashRing(['worker_1', 'worker_2', 'worker_3'])
+    shards = ring.assign(queue_ids)
+
+    assert sorted(sum(shards.values(), [])) == sorted(queue_ids)
+    assert all(len(queues) > 30 for queues in shards.values())
+    assert HashRing().owner('queue_1') is None
+
+
+def test_hash_ring_rebalance_moves_few_keys():
+    queue_ids = ['queue_{}'.format(i) for i in range(200)]
+    before = HashRing(['worker_1', 'worker_2', 'worker_3'])
+    after = HashRing(['worker_1', 'worker_2', 'worker_3', 'worker_4'])
+
+    moved = [queue_id for queue_id in queue_ids
+             if before.owner(queue_id) != after.owner(queue_id)]
+    assert all(after.owner(queue_id) == 'worker_4' for queue_id in moved)
+    assert len(moved) < 100
+
+
+def test_membership(tmpdir, monkeypatch):
+    monkeypatch.setattr('wfinterop.sharding.membership_path',
+                        str(tmpdir.join('workers.json')))
+    join('worker_1', ttl=60)
+    join('worker_2', ttl=60, metrics={'queues': 1})
+    join('worker_3', ttl=-1)
+
+    assert sorted(get_members()) == ['worker_1', 'worker_2']
+    assert shard_metrics()['worker_2'] == {'queues': 1}
+
+    leave('worker_1')
+    assert sorted(get_members()) == ['worker_2']
+
+
+def test_get_members_concurrent_heartbeats(tmpdir, monkeypatch):
+    monkeypatch.setattr('wfinterop.sharding.membership_path',
+                        str(tmpdir.join('workers.json')))
+    join('worker_1', ttl=60)
+    done = threading.Event()
+
+    def _heartbeat():
+        while not done.is_set():
+            join('worker_2', ttl=60, metrics={'queues': list(range(100))})
+
+    heartbeat = threading.Thread(target=_heartbeat)
+    heartbeat.start()
+    try:
+        for _ in range(200):
+            assert 'worker_1' in get_members()
+    finally:
+        done.set()
+        heartbeat.join()
+
+
+def test_sharded_worker(tmpdir, monkeypatch):
+    monkeypatch.setattr('wfinterop.sharding.membership_path',
+                        str(tmpdir.join('workers.json')))
+    queue_ids = ['queue_{}'.format(i) for i in range(20)]
+    worker_1 = ShardedWorker('worker_1')
+    worker_2 = ShardedWorker('worker_2')
+
+    assert worker_1.heartbeat(queue_ids) == queue_ids
+    owned_2 = worker_2.heartbeat(queue_ids)
+    owned_1 = worker_1.heartbeat(queue_ids)
+    assert sorted(owned_1 + owned_2) == sorted(queue_ids)
+    assert owned_1 and owned_2
+
+    worker_1.record({'queue_0': {'mock_sub': {}}}, 0.5)
+    worker_1.heartbeat(queue_ids)
+    assert shard_metrics()['worker_1']['submissions'] == 1
+
+    worker_2.leave()
+    assert worker_1.heartbeat(queue_ids) == queue_ids
@@ -0,0 +1,81 @@
+import pytest
+
+from synapseclient.core.exceptions import SynapseHTTPError
+from wes_client.util import WESClient
+
+from wfinterop.stubs import SynapseStub
+from wfinterop.stubs import WESStub
+
+
+def test_synapse_stub_bundles_paginate():
+    syn = SynapseStub(page_size=2)
+    sub_ids = [syn.add_submission('mock_queue') for _ in range(5)]
+    syn.add_submission('other_queue')
+
+    test_ids = [sub.id for sub, _ in
+                syn.getSubmissionBundles('mock_queue', status='RECEIVED')]
+
+    assert test_ids == sub_ids
+    # three full or partial pages plus the terminating empty page
+    assert syn.requests['getSubmissionBundles'] == 4
+
+
+def test_synapse_stub_store_rejects_stale_etag():
+    syn = SynapseStub()
+    sub_id = syn.add_submission('mock_queue')
+    status = syn.getSubmissionStatus(sub_id)
+    stale_status = syn.getSubmissionStatus(sub_id)
+
+    status.status = 'EVALUATION_IN_PROGRESS'
+    stored_status = syn.store(status)
+    assert stored_status.etag != status.etag
+
+    stale_status.status = 'EVALUATION_IN_PROGRESS'
+    with pytest.raises(SynapseHTTPError) as err:
+        syn.store(stale_status)
+    assert err.value.response.status_code == 412
+    assert syn.status_counts('mock_queue') == {'EVALUATION_IN_PROGRESS': 1}
+
+
+def test_synapse_stub_throttle():
+    syn = SynapseStub(throttle_rate=1.0, retries=2)
+    sub_id = syn.add_submission('mock_queue')
+
+    with pytest.raises(SynapseHTTPError) as err:
+        syn.getSubmission(sub_id)
+    assert err.value.response.status_code == 429
+    assert syn.requests['getSubmission'] == 3
+    assert syn.throttled['getSubmission'] == 3
+
+
+def test_wes_stub_run_lifecycle():
+    with WESStub(run_duration=0.0) as stub:
+        wes_client = WESClient(stub.config())
+        run_id = wes_client.run('tests/testdata/md5sum.cwl',
+                                '{"input_file": "md5sum.input"}',
+                                [])['run_id']
+
+        test_status = wes_client.get_run_status(run_id)
+        test_run_log = wes_client.get_run_log(run_id)
+        test_runs = wes_client.list_runs()
+
+    assert test_status == {'run_id': run_id, 'state': 'COMPLETE'}
+    assert 'workflow_params' in test_run_log['request']['fields']
+    assert test_run_log['run_log']['exit_code'] == 0
+    assert test_runs['runs'] == [{'run_id': run_id, 'state': 'COMPLETE'}]
+    assert stub.requests == {'RunWorkflow': 1, 'GetRunStatus': 1,
+                             'GetRunLog': 1, 'ListRuns': 1}
+
+
+def test_wes_stub_cancel_and_failures():
+    with WESStub(run_duration=60.0) as stub:
+        wes_client = WESClient(stub.config())
+        run_id = wes_client.run('tests/testdata/md5sum.cwl', '{}',
+                                [])['run_id']
+        assert wes_client.get_run_status(run_id)['state'] == 'RUNNING'
+        wes_client.cancel(run_id)
+        assert wes_client.get_run_status(run_id)['state'] == 'CANCELED'
+
+        stub.failure_rate = 1.0
+        with pytest.raises(Exception, match='Injected failure'):
+            wes_client.get_service_info()
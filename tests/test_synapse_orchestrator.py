@@ -2,7 +2,7 @@
 from unittest import mock
 from unittest.mock import Mock, patch
 import pytest
-import datetime as dt
+import time
 
 from bravado.requests_client import RequestsClient
 from bravado.client import SwaggerClient, ResourceDecorator
@@ -136,6 +136,8 @@ def test_run_queue(mock_queue_config,
                         lambda: mock_queue_config)
     monkeypatch.setattr('wfinterop.synapse_orchestrator.get_submissions',
                         lambda **kwargs: ['mock_sub'])
+    monkeypatch.setattr('wfinterop.synapse_orchestrator.health.is_down',
+                        lambda kind, wes_id, check: False)
 
     mock_run_log = mock_submission['mock_sub']['run_log']
     monkeypatch.setattr('wfinterop.synapse_orchestrator.run_submission',
@@ -149,6 +151,24 @@ def test_run_queue(mock_queue_config,
     assert test_queue_log == mock_queue_log
 
 
+def test_run_queue_down_wes(monkeypatch):
+    monkeypatch.setattr('wfinterop.synapse_orchestrator.get_submissions',
+                        lambda **kwargs: ['mock_sub'])
+    monkeypatch.setattr('wfinterop.synapse_orchestrator.health.is_down',
+                        lambda kind, wes_id, check: (wes_id == 'local'
+                                                     and check))
+    mock_run = Mock()
+    monkeypatch.setattr('wfinterop.synapse_orchestrator.run_submission',
+                        mock_run)
+
+    # submissions run on the dispatch WES whatever ID is passed
+    test_queue_log = run_queue(syn=Mock(),
+                               queue_id='mock_queue_1',
+                               wes_id=None)
+    assert test_queue_log == {}
+    mock_run.assert_not_called()
+
+
 def test_monitor_queue(mock_submission,
                        mock_queue_log,
                        mock_wes,
@@ -164,17 +184,13 @@ def test_monitor_queue(mock_submission,
                         lambda x: mock_queue_log['mock_sub'])
     monkeypatch.setattr('wfinterop.synapse_orchestrator.WES',
                         lambda wes_id: mock_wes)
-    monkeypatch.setattr('wfinterop.synapse_orchestrator.convert_timedelta',
-                        lambda x: 0)
-    monkeypatch.setattr('wfinterop.synapse_orchestrator.ctime2datetime',
-                        lambda x: dt.datetime.now())
-    monkeypatch.setattr('wfinterop.synapse_orchestrator.update_submission',
-                        lambda **kwargs: None)
+    monkeypatch.setattr('wfinterop.synapse_orchestrator.apply_updates',
+                        lambda syn, updates: None)
 
     mock_wes.get_run_status.return_value = {'run_id': 'mock_run', 
                                             'state': 'RUNNING'}
 
-    mock_start_time = dt.datetime.now()
+    mock_queue_log['mock_sub']['start_time'] = time.time()
 
     test_queue_log = monitor_queue(mock_syn, 'mock_queue_1')
     assert test_queue_log == mock_queue_log
@@ -9,8 +9,12 @@ import synapseclient
 from synapseclient.core.retry import with_retry
 
 from wfinterop import util
+from wfinterop.stubs import SynapseStub
 from wfinterop.synapse_queue import (create_submission, get_submissions,
-                                     get_submission_bundle, update_submission)
+                                     get_submission_bundle, update_submission,
+                                     claim_submission, renew_lease,
+                                     release_submission, apply_updates,
+                                     query_submissions)
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -66,3 +70,60 @@ def test_update_submission(mock_syn):
     # TODO: Not sure how to test this function
     update_submission(mock_syn, 'mock_sub', {'foo': 'bar'}, 'ACCEPTED')
 
+
+def test_claim_submission():
+    syn = SynapseStub()
+    sub_id = syn.add_submission('mock_queue_1')
+
+    test_status = claim_submission(syn, sub_id, worker_id='worker_1', ttl=60)
+    assert test_status.status == 'EVALUATION_IN_PROGRESS'
+    # worker identities are not shown to participants
+    assert all(annotation['isPrivate']
+               for annotations in test_status.annotations.values()
+               for annotation in annotations)
+    assert claim_submission(syn, sub_id, worker_id='worker_2') is None
+    assert renew_lease(syn, sub_id, worker_id='worker_1', ttl=60)
+    assert not renew_lease(syn, sub_id, worker_id='worker_2', ttl=60)
+
+    # worker_1 dies before dispatching; its lease runs out
+    renew_lease(syn, sub_id, worker_id='worker_1', ttl=-1)
+    test_status = claim_submission(syn, sub_id, worker_id='worker_2', ttl=60)
+    assert test_status is not None
+
+    update_submission(syn, sub_id, {'run_id': 'mock_run'})
+    assert release_submission(syn, sub_id, worker_id='worker_2')
+    # dispatched submissions are never reclaimed
+    assert claim_submission(syn, sub_id, worker_id='worker_3') is None
+
+
+def test_apply_updates():
+    syn = SynapseStub()
+    sub_ids = [syn.add_submission('mock_queue_1') for _ in range(2)]
+
+    apply_updates(syn, [(sub_ids[0], {'run_id': 'mock_run'}, None),
+                        (sub_ids[1], {'run_id': 'mock_run_2'}, None),
+                        (sub_ids[0], {'status': 'COMPLETE'}, 'ACCEPTED')])
+
+    assert syn.requests['store'] == 2
+    test_status = syn.getSubmissionStatus(sub_ids[0])
+    assert test_status.status == 'ACCEPTED'
+
+
+def test_query_submissions():
+    syn = SynapseStub(page_size=5)
+    sub_ids = [syn.add_submission('mock_queue_1') for _ in range(20)]
+    syn.add_submission('mock_queue_1', status='ACCEPTED')
+    apply_updates(syn, [(sub_id, {'wes_id': 'mock_wes'}, None)
+                        for sub_id in sub_ids[:4]])
+    syn.reset_counts()
+
+    test_page = query_submissions(syn, 'mock_queue_1', status='RECEIVED',
+                                  offset=10, limit=3, page_size=5)
+    assert [sub.id for sub, _ in test_page] == sub_ids[10:13]
+    # the offset is passed to Synapse and only one page is fetched
+    assert syn.requests['getSubmissionBundles'] == 1
+
+    test_page = query_submissions(syn, 'mock_queue_1',
+                                  status={'RECEIVED', 'ACCEPTED'},
+                                  wes_id='mock_wes', offset=1)
+    assert [sub.id for sub, _ in test_page] == sub_ids[1:4]
@@ -1,3 +1,4 @@
+import json
 from unittest import mock
 import pytest
 
@@ -5,6 +6,9 @@ from wfinterop.testbed import poll_services
 from wfinterop.testbed import get_checker_id
 from wfinterop.testbed import check_workflow
 from wfinterop.testbed import check_all
+from wfinterop.testbed import run_matrix
+from wfinterop.testbed import get_opts
+from wfinterop.testbed import iter_opts
 
 
 def test_poll_services(mock_queue_config, 
@@ -13,10 +17,13 @@ def test_poll_services(mock_queue_config,
                        monkeypatch):
     monkeypatch.setattr('wfinterop.testbed.queue_config', 
                         lambda: mock_queue_config)
-    monkeypatch.setattr('wfinterop.testbed.TRS', 
+    monkeypatch.setattr('wfinterop.health.TRS', 
                         lambda trs_id: mock_trs) 
-    monkeypatch.setattr('wfinterop.testbed.WES', 
+    monkeypatch.setattr('wfinterop.health.WES', 
                         lambda wes_id: mock_wes)  
+    monkeypatch.setattr('wfinterop.health._clients', {})
+    monkeypatch.setattr('wfinterop.health._health', {})
+    monkeypatch.setattr('wfinterop.health._pending', {})
 
     test_service_status = poll_services()
     assert test_service_status == {'toolregistries': {'mock_trs': True},
@@ -102,6 +109,9 @@ def test_check_all(mock_queue_config, monkeypatch):
         }
     }
     
+    monkeypatch.setattr('wfinterop.testbed.CheckerCache.get',
+                        lambda self, queue_id: ('mock_queue_1_checker',
+                                                'mock_test.json'))
     monkeypatch.setattr('wfinterop.testbed.check_workflow', 
                         lambda **kwargs: mock_testbed_status)
     monkeypatch.setattr('wfinterop.testbed.monitor_testbed', 
@@ -111,4 +121,101 @@ def test_check_all(mock_queue_config, monkeypatch):
         'mock_queue_1': ['mock_wes_1']
     }
     test_testbed_status = check_all(mock_workflow_wes_map)
-    assert test_testbed_status == mock_testbed_status
\ No newline at end of file
+    assert test_testbed_status == mock_testbed_status
+
+
+def test_run_matrix(mock_testbedlog, mock_queue_config, monkeypatch):
+    import itertools
+    import threading
+    import time
+
+    monkeypatch.setattr('wfinterop.testbed.testbed_log',
+                        str(mock_testbedlog))
+    monkeypatch.setattr('wfinterop.testbed.queue_config',
+                        lambda: mock_queue_config)
+    checker_calls = []
+    monkeypatch.setattr('wfinterop.testbed.get_checker_job',
+                        lambda queue_id: checker_calls.append(queue_id) or
+                        ('mock_queue_1_checker', 'mock_test.json'))
+    fetch_calls = []
+    monkeypatch.setattr('wfinterop.testbed.fetch_queue_workflow',
+                        fetch_calls.append)
+    sub_ids = itertools.count()
+    submissions = {}
+
+    def mock_create_submission(queue_id, submission_data, wes_id):
+        sub_id = 'mock_sub_{}'.format(next(sub_ids))
+        submissions[sub_id] = wes_id
+        return sub_id
+    monkeypatch.setattr('wfinterop.testbed.create_submission',
+                        mock_create_submission)
+
+    lock = threading.Lock()
+    running = {'mock_wes_1': 0, 'mock_wes_2': 0}
+    peak = {'mock_wes_1': 0, 'mock_wes_2': 0}
+
+    def mock_run_submission(queue_id, submission_id, opts):
+        wes_id = submissions[submission_id]
+        with lock:
+            running[wes_id] += 1
+            peak[wes_id] = max(peak[wes_id], running[wes_id])
+        time.sleep(0.02)
+        with lock:
+            running[wes_id] -= 1
+        return {'run_id': 'mock_run_' + submission_id}
+    monkeypatch.setattr('wfinterop.testbed.run_submission',
+                        mock_run_submission)
+
+    mock_opts = [{'attach_descriptor': state} for state in (True, False)] * 2
+    errors = run_matrix({'mock_queue_1': ['mock_wes_1', 'mock_wes_2']},
+                        mock_opts, max_per_wes=2)
+
+    assert errors == []
+    assert checker_calls == ['mock_queue_1']
+    assert fetch_calls == ['mock_queue_1_checker']
+    assert peak == {'mock_wes_1': 2, 'mock_wes_2': 2}
+    with open(str(mock_testbedlog)) as f:
+        test_testbed_status = json.load(f)
+    test_cells = test_testbed_status['mock_queue_1_checker']
+    assert len(test_cells['mock_wes_1']) == 4
+    assert len(test_cells['mock_wes_2']) == 4
+    assert all(cell['run_id'] == 'mock_run_' + sub_id
+               for wes_cells in test_cells.values()
+               for sub_id, cell in wes_cells.items())
+
+
+def test_get_opts():
+    assert get_opts() == [{'attach_descriptor': False,
+                           'resolve_params': False,
+                           'attach_imports': False,
+                           'pack_descriptor': False}]
+
+    test_opts = get_opts(permute=True)
+    assert len(test_opts) == 10
+    assert not any(opts['pack_descriptor'] and
+                   (opts['attach_imports'] or not opts['attach_descriptor'])
+                   for opts in test_opts)
+
+
+def test_get_opts_equivalent():
+    test_opts = get_opts(permute=True, workflow_type='WDL')
+    assert len(test_opts) == 8
+    assert not any(opts['pack_descriptor'] for opts in test_opts)
+
+    test_opts = get_opts(permute=True,
+                         workflow_type='CWL',
+                         attachments=['file://md5sum.input'])
+    assert len(test_opts) == 6
+    assert not any(opts['attach_imports'] for opts in test_opts)
+
+
+def test_iter_opts_extensible():
+    test_opts = list(iter_opts(
+        names=['attach_descriptor', 'new_flag'],
+        constraints=[lambda opts, **context: not opts['new_flag'] or
+                     opts['attach_descriptor']],
+        reducers=[]
+    ))
+    assert test_opts == [{'attach_descriptor': False, 'new_flag': False},
+                         {'attach_descriptor': True, 'new_flag': False},
+                         {'attach_descriptor': True, 'new_flag': True}]
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from wfinterop import tracing
+from wfinterop.stubs import WESStub
+
+pytest.importorskip('opentelemetry.sdk')
+
+
+@pytest.fixture()
+def span_file(tmpdir):
+    path = str(tmpdir.join('spans.jsonl'))
+    tracing.configure('file', path=path)
+    yield path
+    tracing.reset()
+
+
+def _read_spans(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_span_submission_attribute(span_file):
+    @tracing.traced('mock_stage', 'queue_id')
+    def mock_stage(queue_id, value):
+        with tracing.span('mock_inner', detail=value):
+            pass
+
+    with tracing.span('mock_submission', submission_id='mock_sub'):
+        mock_stage('mock_queue', value=1)
+    with tracing.span('mock_other'):
+        pass
+    tracing.reset()
+
+    test_spans = {span['name']: span for span in _read_spans(span_file)}
+    assert test_spans['mock_inner']['attributes'] == {
+        'detail': 1, 'submission.id': 'mock_sub'
+    }
+    assert test_spans['mock_stage']['attributes']['queue_id'] == 'mock_queue'
+    assert (test_spans['mock_inner']['context']['trace_id']
+            == test_spans['mock_submission']['context']['trace_id'])
+    assert test_spans['mock_inner']['parent_id'] == \
+        test_spans['mock_stage']['context']['span_id']
+    assert 'submission.id' not in test_spans['mock_other']['attributes']
+
+
+def test_set_submission_id(span_file):
+    with tracing.span('mock_job'):
+        with tracing.span('mock_create'):
+            pass
+        tracing.set_submission_id('mock_sub')
+        with tracing.span('mock_run'):
+            pass
+    tracing.reset()
+
+    test_spans = {span['name']: span for span in _read_spans(span_file)}
+    assert 'submission.id' not in test_spans['mock_create']['attributes']
+    assert test_spans['mock_run']['attributes']['submission.id'] == 'mock_sub'
+    assert test_spans['mock_job']['attributes']['submission.id'] == 'mock_sub'
+
+
+def test_wes_call_span(span_file, monkeypatch):
+    from wfinterop.wes import WES
+
+    with WESStub() as stub:
+        mock_wes_config = {'wes_stub': stub.config()}
+        monkeypatch.setattr('wfinterop.wes.client.wes_config',
+                            lambda: mock_wes_config)
+        with tracing.span('mock_submission', submission_id='mock_sub'):
+            WES('wes_stub').get_service_info()
+    tracing.reset()
+
+    test_span = {span['name']: span
+                 for span in _read_spans(span_file)}['WES.GetServiceInfo']
+    assert test_span['attributes'] == {'wes_id': 'wes_stub',
+                                       'submission.id': 'mock_sub'}
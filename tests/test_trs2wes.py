@@ -16,6 +16,7 @@ from wfinterop.trs2wes import get_wf_params
 from wfinterop.trs2wes import get_wf_attachments
 from wfinterop.trs2wes import expand_globs
 from wfinterop.trs2wes import build_wes_request
+from wfinterop.trs2wes import fingerprint_request
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -201,4 +202,39 @@ def test_build_wes_request(cwl_descriptor,
     test_parts = build_wes_request(cwl_descriptor,
                                    cwl_jsonyaml,
                                    cwl_attachments)
-    assert test_parts == []
\ No newline at end of file
+    assert test_parts == []
+
+
+def test_fingerprint_request():
+    from io import StringIO
+
+    mock_parts = [('workflow_type', 'CWL'),
+                  ('workflow_attachment', ('a.input', StringIO('a'))),
+                  ('workflow_attachment', ('b.input', StringIO('b')))]
+    test_fingerprint = fingerprint_request(parts=mock_parts)
+
+    assert (fingerprint_request(parts=list(reversed(mock_parts)))
+            == test_fingerprint)
+    assert mock_parts[1][1][1].read() == 'a'
+
+    mock_parts[2] = ('workflow_attachment', ('b.input', StringIO('c')))
+    assert fingerprint_request(parts=mock_parts) != test_fingerprint
+
+
+def test_fingerprint_request_local_files(tmpdir):
+    mock_params = tmpdir.join('params.json')
+    mock_params.write('{"input": 1}')
+    mock_request = {'workflow_url': 'https://example.org/wf.cwl',
+                    'workflow_params': 'file://' + str(mock_params),
+                    'attachment': []}
+    test_fingerprint = fingerprint_request(request=mock_request)
+
+    assert fingerprint_request(request=dict(mock_request)) == test_fingerprint
+    mock_params.write('{"input": 2}')
+    assert fingerprint_request(request=mock_request) != test_fingerprint
+
+    mock_parts = [('workflow_url', str(mock_params)),
+                  ('workflow_params', 'https://example.org/params.json')]
+    test_fingerprint = fingerprint_request(parts=mock_parts)
+    mock_params.write('{"input": 3}')
+    assert fingerprint_request(parts=mock_parts) != test_fingerprint
@@ -112,6 +112,20 @@ def test_save_json(tmpdir):
     assert(mock_file.read() == textwrap.dedent(mock_string))
 
 
+def test_save_json_failed_write(tmpdir):
+    mock_object = {'section': {'key': {}}}
+    mock_object['section']['key']['loop'] = mock_object
+
+    mock_file = tmpdir.join('mock.json')
+    mock_file.write('{}')
+
+    with pytest.raises(ValueError):
+        util.save_json(str(mock_file), mock_object)
+
+    assert(mock_file.read() == '{}')
+    assert(tmpdir.listdir() == [mock_file])
+
+
 def test_ctime2datetime():
     mock_string = 'Sun Jan 01 00:00:00 2000'
 
@@ -128,6 +142,30 @@ def test_convert_timedelta():
     assert(test_string == '1h:1m:0s')
 
 
+def test_convert_timedelta_days():
+    mock_duration = datetime(2000, 1, 3, 1, 1) - datetime(2000, 1, 1, 0, 0)
+
+    assert(util.convert_timedelta(mock_duration) == '49h:1m:0s')
+    assert(util.convert_timedelta(3661.5) == '1h:1m:1s')
+
+
+def test_to_timestamp():
+    mock_datetime = datetime(2000, 1, 1, 0, 0)
+
+    assert(util.to_timestamp(946684800) == 946684800.0)
+    assert(util.to_timestamp('946684800.5') == 946684800.5)
+    assert(util.to_timestamp(mock_datetime) == mock_datetime.timestamp())
+    assert(util.to_timestamp('Sat Jan 01 00:00:00 2000') ==
+           mock_datetime.timestamp())
+    assert(util.to_timestamp('') is None)
+
+
+def test_to_seconds():
+    assert(util.to_seconds(None) == 0)
+    assert(util.to_seconds(90.5) == 90)
+    assert(util.to_seconds('49h:1m:5s') == 176465)
+
+
 def test_annotate_submission(mock_syn):
     sub_status = Mock(synapseclient.SubmissionStatus)
     sub_status.status = "RECEIVED"
@@ -0,0 +1,85 @@
+import pytest
+
+from wfinterop.stubs import WESStub
+from wfinterop.wes.logs import LogStream
+from wfinterop.wes.logs import truncate_log
+
+
+@pytest.fixture(params=[True, False], ids=['range', 'no_range'])
+def mock_log_stream(request):
+    with WESStub(log_size=1000, ranges=request.param) as stub:
+        stub.runs['mock_run'] = {}
+        log_url = '{}/runs/mock_run/logs/stderr'.format(stub.url)
+        line = 'mock_run stderr line\n'
+        mock_text = (line * 100)[:1000]
+        yield LogStream(log_url), mock_text
+
+
+def test_log_stream_read(mock_log_stream):
+    log_stream, mock_text = mock_log_stream
+
+    assert log_stream.read() == mock_text
+    assert log_stream.offset == 1000
+    assert log_stream.read(offset=10, limit=20) == mock_text[10:30]
+    assert log_stream.read() == mock_text[30:]
+    assert log_stream.read() == ''
+
+
+def test_log_stream_tail(mock_log_stream):
+    log_stream, mock_text = mock_log_stream
+
+    assert log_stream.tail(50) == mock_text[-50:]
+    assert log_stream.tail(5000) == mock_text
+
+
+def test_log_stream_follow(mock_log_stream):
+    log_stream, mock_text = mock_log_stream
+
+    test_chunks = list(log_stream.follow(offset=900, stop=lambda: True))
+    assert ''.join(test_chunks) == mock_text[900:]
+
+
+def test_log_stream_spool(mock_log_stream, tmpdir):
+    log_stream, mock_text = mock_log_stream
+    spool_path = str(tmpdir.join('stderr.log'))
+
+    assert log_stream.spool(spool_path) == 1000
+    assert log_stream.spool(spool_path, offset=1000) == 0
+    with open(spool_path) as f:
+        assert f.read() == mock_text
+
+
+def test_truncate_log():
+    mock_text = ''.join(str(i % 10) for i in range(1000))
+
+    assert truncate_log(mock_text, 2000) == mock_text
+    for policy in ['tail', 'head', 'head_tail']:
+        assert len(truncate_log(mock_text, 100, policy=policy)) <= 100
+    assert truncate_log(mock_text, 100).endswith(mock_text[-50:])
+    assert truncate_log(mock_text, 100,
+                        policy='head').startswith(mock_text[:50])
+    with pytest.raises(ValueError):
+        truncate_log(mock_text, 100, policy='middle')
+
+
+def test_get_run_logs(monkeypatch):
+    from wfinterop.wes import WES
+
+    with WESStub(log_size=100) as stub:
+        mock_wes_config = {'wes_stub': stub.config()}
+        monkeypatch.setattr('wfinterop.wes.wrapper.wes_config',
+                            lambda: mock_wes_config)
+        monkeypatch.setattr('wfinterop.wes.client.wes_config',
+                            lambda: mock_wes_config)
+        stub.runs['mock_run'] = {'submitted': 0, 'queue_time': 0,
+                                 'duration': 0, 'outcome': 'EXECUTOR_ERROR',
+                                 'canceled': None, 'request': {}}
+
+        wes_instance = WES('wes_stub')
+        test_run_logs = wes_instance.get_run_logs('mock_run', task_logs=True)
+
+        assert test_run_logs['stdout'].startswith('mock_run stdout line')
+        assert test_run_logs['stderr'].startswith('mock_run stderr line')
+        assert test_run_logs['task_logs'] == []
+        assert stub.requests['GetRunLog'] == 1
+        assert stub.requests['GetRunStream'] == 2
@@ -4,15 +4,124 @@ import sys
 import argparse
 import pkg_resources  # part of setuptools
 import logging
+from wfinterop import metrics, queue, tracing
 from wfinterop.orchestrator import monitor
 
 logging.basicConfig(level=logging.INFO)
 
 
+def profile(args):
+    from wfinterop.profiling import print_hotspots, profile_cycle
+
+    result = profile_cycle(args.cycle, args.queue,
+                           wes_id=args.wes_id,
+                           output=args.output,
+                           stub=args.stub,
+                           interval=args.interval)
+    print_hotspots(result['pstats'], limit=args.top)
+    print("Wrote {pstats} and {collapsed} ({samples} stack samples, "
+          "{wall_s}s)".format(**result))
+
+
+def enqueue(args):
+    import glob
+    import itertools
+    from wfinterop.queue import create_submissions, params_url, read_manifest
+
+    # quoted patterns are expanded here, to avoid shell argument limits
+    paths = itertools.chain.from_iterable(sorted(glob.glob(pattern))
+                                          or [pattern]
+                                          for pattern in args.params)
+    sources = [((params_url(path), None) for path in paths)]
+    sources += [read_manifest(path) for path in args.manifest]
+    submission_ids = create_submissions(args.queue,
+                                        itertools.chain(*sources),
+                                        wes_id=args.wes_id,
+                                        validate=not args.no_validate,
+                                        processes=args.processes)
+    print("Queued {} submissions in '{}'".format(len(submission_ids),
+                                                 args.queue))
+
+
+def archive(args):
+    from wfinterop.queue import archive_submissions
+
+    archived = archive_submissions(args.queue,
+                                   max_age=args.max_age_days * 24 * 3600)
+    print("Archived {} submissions".format(sum(archived.values())))
+
+
 def main(argv=sys.argv[1:]):
 
     parser = argparse.ArgumentParser(description='Synapse Workflow Orchestrator')
     parser.add_argument("--version", action="store_true", default=False)
+    parser.add_argument("--shard", action="store_true", default=False,
+                        help="share queues with other workers using this "
+                             "state directory")
+    parser.add_argument("--worker-id", default=None,
+                        help="worker name in the shard pool "
+                             "(default: host:pid)")
+    parser.add_argument("--journal", action="store_true", default=False,
+                        help="append queue changes to an event journal "
+                             "instead of rewriting the queue file")
+    parser.add_argument("--callback-port", type=int, default=None,
+                        help="receive run states POSTed by workflow "
+                             "engines on this local port")
+    parser.add_argument("--callback-token", default=None,
+                        help="shared secret engines must send with "
+                             "run state callbacks")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on this local port")
+    parser.add_argument("--trace", choices=['console', 'file'], default=None,
+                        help="export tracing spans to the console or a file")
+    parser.add_argument("--trace-file", default='spans.jsonl',
+                        help="file for '--trace file' (default: spans.jsonl)")
+    subparsers = parser.add_subparsers(dest='command')
+    profile_parser = subparsers.add_parser(
+        'profile', help="profile one dispatch or monitor cycle for a queue"
+    )
+    profile_parser.add_argument("cycle", choices=['dispatch', 'monitor'])
+    profile_parser.add_argument("--queue", required=True,
+                                help="workflow queue to profile")
+    profile_parser.add_argument("--wes-id", default=None,
+                                help="workflow service for dispatch")
+    profile_parser.add_argument("--stub", action="store_true", default=False,
+                                help="run against a local WES stub and a "
+                                     "copy of the submission queue")
+    profile_parser.add_argument("--output", default=None,
+                                help="path prefix for the .pstats and "
+                                     ".collapsed files")
+    profile_parser.add_argument("--interval", type=float, default=0.005,
+                                help="seconds between stack samples")
+    profile_parser.add_argument("--top", type=int, default=20,
+                                help="number of functions to print")
+    enqueue_parser = subparsers.add_parser(
+        'enqueue', help="add submissions to a queue in one transaction"
+    )
+    enqueue_parser.add_argument("params", nargs='*',
+                                help="workflow parameter files (JSON/YAML) "
+                                     "or quoted glob patterns")
+    enqueue_parser.add_argument("--queue", required=True,
+                                help="workflow queue to add submissions to")
+    enqueue_parser.add_argument("--manifest", action='append', default=[],
+                                help="JSON Lines manifest of submissions; "
+                                     "may be repeated")
+    enqueue_parser.add_argument("--wes-id", default=None,
+                                help="workflow service for the submissions")
+    enqueue_parser.add_argument("--no-validate", action="store_true",
+                                default=False,
+                                help="skip checking parameter files")
+    enqueue_parser.add_argument("--processes", type=int, default=None,
+                                help="number of validation processes")
+    archive_parser = subparsers.add_parser(
+        'archive', help="move old finished submissions out of the live queue"
+    )
+    archive_parser.add_argument("--queue", default=None,
+                                help="workflow queue to archive "
+                                     "(default: all queues)")
+    archive_parser.add_argument("--max-age-days", type=float, default=30,
+                                help="days since a submission finished "
+                                     "before it is archived (default: 30)")
     args = parser.parse_args(argv)
 
     if args.version:
@@ -20,7 +129,26 @@ def main(argv=sys.argv[1:]):
         print(u"%s %s" % (sys.argv[0], pkg[0].version))
         exit(0)
 
-    monitor()
+    if args.journal:
+        queue.use_journal = True
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+    if args.trace is not None:
+        tracing.configure(args.trace, path=args.trace_file)
+
+    if args.command == 'profile':
+        profile(args)
+        return
+    if args.command == 'enqueue':
+        enqueue(args)
+        return
+    if args.command == 'archive':
+        archive(args)
+        return
+
+    monitor(shard=args.shard, worker_id=args.worker_id,
+            callback_port=args.callback_port,
+            callback_token=args.callback_token)
 
 
 if __name__ == '__main__':
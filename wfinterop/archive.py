@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Cold storage for finished submissions. Archived submissions are written
+to immutable, gzip-compressed JSON Lines segments in an archive folder;
+an append-only ``index.jsonl`` file records each segment's queue, number
+of submissions and range of submission IDs, so a lookup only opens the
+segments that can hold an ID. The queue modules decide what to archive
+and remove it from the live queue; this module holds the parts that do
+not depend on the store.
+"""
+import functools
+import gzip
+import json
+import logging
+import os
+import tempfile
+
+from wfinterop.ids import new_id
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'index.jsonl'
+SEGMENT_SIZE = 10000
+
+# submissions in these states do not change anymore
+TERMINAL_STATUSES = ('COMPLETE', 'VALIDATED', 'FAILED')
+TERMINAL_RUN_STATES = ('COMPLETE', 'CANCELED', 'EXECUTOR_ERROR',
+                       'SYSTEM_ERROR')
+
+
+def is_terminal(bundle):
+    """
+    Return True if a submission has finished: its status or the state of
+    its run is final.
+
+    Args:
+        bundle (dict): submission info, as stored in the queue
+    """
+    run_log = bundle.get('run_log') or {}
+    return (bundle.get('status') in TERMINAL_STATUSES
+            or run_log.get('status') in TERMINAL_RUN_STATES)
+
+
+def write_segments(archive_dir, queue_id, submissions):
+    """
+    Write submissions to new segments and add them to the index. Each
+    segment is written to a temporary file and renamed into place before
+    its index entry is appended, so readers never see a partial segment.
+
+    Args:
+        archive_dir (str): archive folder; created if missing
+        queue_id (str): string identifying the workflow queue
+        submissions (list): ``(submission_id, bundle)`` tuples
+
+    Returns:
+        list: index entries of the new segments
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    submissions = sorted(submissions, key=lambda item: item[0])
+    entries = []
+    for start in range(0, len(submissions), SEGMENT_SIZE):
+        chunk = submissions[start:start + SEGMENT_SIZE]
+        name = '{}.jsonl.gz'.format(new_id())
+        fd, tmp_path = tempfile.mkstemp(dir=archive_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as raw, \
+                gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for submission_id, bundle in chunk:
+                f.write((json.dumps({'id': submission_id, 'bundle': bundle},
+                                    default=str) + '\n').encode('utf-8'))
+        os.replace(tmp_path, os.path.join(archive_dir, name))
+        entry = {'segment': name,
+                 'queue_id': queue_id,
+                 'count': len(chunk),
+                 'min_id': chunk[0][0],
+                 'max_id': chunk[-1][0]}
+        with open(os.path.join(archive_dir, INDEX_NAME), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        entries.append(entry)
+    return entries
+
+
+def read_index(archive_dir):
+    """
+    Return the index entries of an archive folder, oldest first.
+
+    Args:
+        archive_dir (str): archive folder
+
+    Returns:
+        list: dicts with 'segment', 'queue_id', 'count', 'min_id' and
+        'max_id' keys
+    """
+    try:
+        with open(os.path.join(archive_dir, INDEX_NAME)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except IOError:
+        return []
+
+
+@functools.lru_cache(maxsize=8)
+def _read_segment(path):
+    # segments are never modified, so caching by path is safe
+    with gzip.open(path, 'rt') as f:
+        return {record['id']: record['bundle']
+                for record in map(json.loads, f)}
+
+
+def find_submission(archive_dir, queue_id, submission_id):
+    """
+    Look up an archived submission. If a submission was archived more
+    than once, the most recent copy is returned.
+
+    Args:
+        archive_dir (str): archive folder
+        queue_id (str): string identifying the workflow queue
+        submission_id (str): submission to look up
+
+    Returns:
+        dict: submission info, or None if it is not archived
+    """
+    for entry in reversed(read_index(archive_dir)):
+        if (entry['queue_id'] == queue_id
+                and entry['min_id'] <= submission_id <= entry['max_id']):
+            segment = _read_segment(os.path.join(archive_dir,
+                                                 entry['segment']))
+            if submission_id in segment:
+                return segment[submission_id]
+    return None
+
+
+def iter_submissions(archive_dir, queue_id):
+    """
+    Iterate over the archived submissions of a queue, one segment at a
+    time, in the order they were archived.
+
+    Args:
+        archive_dir (str): archive folder
+        queue_id (str): string identifying the workflow queue
+
+    Yields:
+        tuple: submission ID and submission info
+    """
+    for entry in read_index(archive_dir):
+        if entry['queue_id'] == queue_id:
+            path = os.path.join(archive_dir, entry['segment'])
+            with gzip.open(path, 'rt') as f:
+                for record in map(json.loads, f):
+                    yield record['id'], record['bundle']
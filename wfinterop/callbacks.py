@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Receive run state changes pushed by workflow engines, so monitors learn
+about finished runs without polling WES for every run. Engines (or a
+sidecar watching engine logs) POST JSON to the receiver:
+
+    POST /runs/<run_id>   {"state": "COMPLETE"}
+    POST /                {"run_id": "<run_id>", "state": "COMPLETE"}
+
+States are the WES run states. If the receiver has a token, requests
+must send it as ``Authorization: Bearer <token>``. Received states are
+queued for the monitor, which applies them on its next sweep and wakes
+up early to do so; see :func:`wfinterop.orchestrator.monitor`.
+"""
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from wfinterop import metrics
+
+logger = logging.getLogger(__name__)
+
+RUN_STATES = ('UNKNOWN', 'QUEUED', 'INITIALIZING', 'RUNNING', 'PAUSED',
+              'COMPLETE', 'EXECUTOR_ERROR', 'SYSTEM_ERROR', 'CANCELED',
+              'CANCELING')
+# largest request body accepted, in bytes
+MAX_BODY = 64 * 1024
+
+CALLBACKS = metrics.counter('wfinterop_run_callbacks_total',
+                            'Run state callbacks received',
+                            ['outcome'])
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _reply(self, code, message):
+        payload = json.dumps({'message': message}).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _reject(self, code, message):
+        CALLBACKS.inc(outcome='rejected')
+        self._reply(code, message)
+
+    def do_POST(self):
+        receiver = self.server.receiver
+        if (receiver.token is not None and self.headers.get('Authorization')
+                != 'Bearer {}'.format(receiver.token)):
+            self._reject(401, 'Missing or invalid token')
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY:
+            self._reject(413, 'Request body too large')
+            return
+        try:
+            body = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+        except ValueError:
+            self._reject(400, 'Request body is not JSON')
+            return
+        if not isinstance(body, dict):
+            self._reject(400, 'Request body must be a JSON object')
+            return
+        path = self.path.split('?')[0].rstrip('/')
+        if path.startswith('/runs/'):
+            body['run_id'] = path[len('/runs/'):]
+        elif path:
+            self._reject(404, 'Unknown path')
+            return
+        if not body.get('run_id') or body.get('state') not in RUN_STATES:
+            self._reject(400, "Expected a 'run_id' and a WES run 'state'")
+            return
+        receiver.put(str(body['run_id']), body['state'])
+        CALLBACKS.inc(outcome='accepted')
+        self._reply(202, 'Accepted')
+
+
+class CallbackReceiver(object):
+    """
+    Collect run states posted by workflow engines.
+
+    Args:
+        token (str): shared secret callers must send; None accepts any
+            caller (bind to a local interface in that case)
+    """
+    def __init__(self, token=None):
+        self.token = token
+        self.server = None
+        self._states = {}
+        self._received = threading.Condition()
+
+    def put(self, run_id, state):
+        """Record the latest state of a run and wake any waiter."""
+        with self._received:
+            self._states[run_id] = state
+            self._received.notify_all()
+
+    def drain(self):
+        """
+        Return the states received since the last call.
+
+        Returns:
+            dict: run ID -> latest state
+        """
+        with self._received:
+            states, self._states = self._states, {}
+        return states
+
+    def wait(self, timeout):
+        """
+        Wait until a state is received or ``timeout`` seconds pass.
+
+        Returns:
+            bool: True if states are waiting to be drained
+        """
+        with self._received:
+            return self._received.wait_for(lambda: bool(self._states),
+                                           timeout)
+
+    def start(self, port=8765, host='127.0.0.1'):
+        """
+        Serve callbacks from a background thread.
+
+        Args:
+            port (int): port to bind; 0 picks a free port
+            host (str): interface to bind
+
+        Returns:
+            CallbackReceiver: self
+        """
+        self.server = _ThreadingHTTPServer((host, port), _CallbackHandler)
+        self.server.receiver = self
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  name='run-callbacks', daemon=True)
+        thread.start()
+        logger.info("Receiving run callbacks on http://{}:{}/runs/<run_id>"
+                    .format(*self.server.server_address[:2]))
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    @property
+    def url(self):
+        """Base URL of the running receiver."""
+        return 'http://{}:{}'.format(*self.server.server_address[:2])
+
+
+def serve(port=8765, host='127.0.0.1', token=None):
+    """
+    Start a :class:`CallbackReceiver` serving from a background thread.
+
+    :param int port: Port to bind; 0 picks a free port.
+    :param str host: Interface to bind.
+    :param str token: Shared secret callers must send.
+    :return: the running :class:`CallbackReceiver`; call its ``stop()``
+        to stop serving
+    """
+    return CallbackReceiver(token=token).start(port, host)
@@ -11,7 +11,7 @@ This provides functions to save and get values into these three sections.
 import logging
 import os
 
-from wfinterop.util import get_yaml, save_yaml, heredoc
+from wfinterop.util import file_lock, get_yaml, save_yaml, heredoc
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -246,13 +246,15 @@ def set_yaml(section, service, var2add):
             or queue (previous config will be overwritten)
     """
     if section == 'queues':
-        orchestrator_queues = get_yaml(queues_path)
-        orchestrator_queues[service] = var2add
-        save_yaml(queues_path, orchestrator_queues)
+        with file_lock(queues_path):
+            orchestrator_queues = get_yaml(queues_path)
+            orchestrator_queues[service] = var2add
+            save_yaml(queues_path, orchestrator_queues)
     else:
-        orchestrator_config = get_yaml(config_path)
-        orchestrator_config.setdefault(section, {})[service] = var2add
-        save_yaml(config_path, orchestrator_config)
+        with file_lock(config_path):
+            orchestrator_config = get_yaml(config_path)
+            orchestrator_config.setdefault(section, {})[service] = var2add
+            save_yaml(config_path, orchestrator_config)
 
 
 def show():
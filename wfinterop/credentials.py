@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+"""
+Credentials for service configs. Values like ``${GCLOUD_TOKEN}`` in the
+app config are filled in from a provider registered under that name
+(environment variable, file or command), and the result is cached until
+it expires, so reading the config does not run a command each time.
+Names without a provider fall back to environment variables.
+
+Filled-in config values remember their template, and the WES and TRS
+clients send auth headers through :class:`AuthHeaders`, which fills them
+in again for every request: long-lived clients pick up refreshed tokens
+without being rebuilt. E.g., to read a token from a file:
+
+    from wfinterop import credentials
+    credentials.register('WES_TOKEN', credentials.FileProvider(path))
+"""
+import collections.abc
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# refresh cached values this many seconds before they expire
+REFRESH_MARGIN = 300
+# seconds to wait before retrying a failed background refresh
+RETRY_WAIT = 30
+
+_PATTERN = re.compile(r"\$\{([^}:\s]+):?([^}]+)?\}")
+
+
+class EnvProvider(object):
+    """
+    Read a credential from an environment variable each time.
+
+    Args:
+        name (str): environment variable
+        default (str): value if the variable is not set
+    """
+    def __init__(self, name, default=None):
+        self.name = name
+        self.default = default
+
+    def fetch(self):
+        return os.environ.get(self.name, self.default), None
+
+
+class FileProvider(object):
+    """
+    Read a credential from a file (e.g., a mounted secret).
+
+    Args:
+        path (str): file holding the credential
+        ttl (float): seconds before the file is read again
+    """
+    def __init__(self, path, ttl=300):
+        self.path = path
+        self.ttl = ttl
+
+    def fetch(self):
+        with open(self.path) as f:
+            return f.read().strip(), time.time() + self.ttl
+
+
+class CommandProvider(object):
+    """
+    Get a credential from the output of a command.
+
+    Args:
+        args (list): command and arguments
+        ttl (float): seconds the output stays valid, e.g., the lifetime
+            of an access token
+    """
+    def __init__(self, args, ttl=3000):
+        self.args = list(args)
+        self.ttl = ttl
+
+    def fetch(self):
+        output = subprocess.check_output(self.args)
+        return output.decode('utf-8').strip(), time.time() + self.ttl
+
+
+class CachedCredential(object):
+    """
+    Cache a provider's value until shortly before it expires.
+
+    Args:
+        provider: object with a ``fetch()`` method returning the value
+            and its expiry in epoch seconds (None if it does not expire
+            and should be fetched on every use)
+        refresh_margin (float): seconds before expiry to fetch again
+    """
+    def __init__(self, provider, refresh_margin=REFRESH_MARGIN):
+        self.provider = provider
+        self.refresh_margin = refresh_margin
+        self._value = None
+        self._expires = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fresh(self):
+        return (self._expires is not None
+                and time.time() < self._expires - self.refresh_margin)
+
+    def refresh(self):
+        """Fetch a new value from the provider and cache it."""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        value, expires = self.provider.fetch()
+        self._value, self._expires = value, expires
+        return value
+
+    def get(self):
+        """Return the cached value, fetching it first if it is stale."""
+        if self._fresh():
+            return self._value
+        with self._lock:
+            if self._fresh():
+                return self._value
+            return self._refresh()
+
+    def _run(self):
+        wait = 0
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Could not refresh credential")
+                wait = RETRY_WAIT
+                continue
+            if self._expires is None:
+                return
+            wait = max(self._expires - self.refresh_margin - time.time(),
+                       RETRY_WAIT)
+
+    def start_refresh(self):
+        """
+        Keep the value fresh from a background thread, so that callers
+        never wait for the provider.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='credential-refresh',
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def stop_refresh(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_credentials = {}
+
+
+def register(name, provider, refresh_margin=REFRESH_MARGIN,
+             background=False):
+    """
+    Provide the value for ``${name}`` in configs.
+
+    :param str name: Name used in configs, e.g., 'GCLOUD_TOKEN'.
+    :param provider: :class:`EnvProvider`, :class:`FileProvider`,
+        :class:`CommandProvider` or another object with a ``fetch()``
+        method.
+    :param float refresh_margin: Seconds before expiry to fetch again.
+    :param bool background: If True, refresh from a background thread.
+    :return: the :class:`CachedCredential`
+    """
+    unregister(name)
+    credential = CachedCredential(provider, refresh_margin)
+    _credentials[name] = credential
+    if background:
+        credential.start_refresh()
+    return credential
+
+
+def unregister(name):
+    """Remove the provider for ``name``, stopping any refresh thread."""
+    credential = _credentials.pop(name, None)
+    if credential is not None:
+        credential.stop_refresh()
+
+
+def get_credential(name, default=None):
+    """
+    Return the current value for ``name``: from its provider if one is
+    registered, otherwise from the environment variable of that name.
+
+    :param str name: Credential name.
+    :param str default: Value if there is no provider or variable.
+    """
+    credential = _credentials.get(name)
+    if credential is None:
+        return os.environ.get(name, default)
+    return credential.get()
+
+
+class ResolvedValue(str):
+    """
+    Config string with ``${NAME}`` references filled in, remembering the
+    original ``template`` so it can be filled in again later.
+    """
+    def __new__(cls, value, template):
+        resolved = super(ResolvedValue, cls).__new__(cls, value)
+        resolved.template = template
+        return resolved
+
+    def resolve(self):
+        """Fill in the template again with current values."""
+        return expand(self.template)
+
+
+def _replace(match):
+    name, default = match.groups()
+    try:
+        value = get_credential(name, default)
+    except (OSError, subprocess.CalledProcessError) as err:
+        logger.warning("Could not get credential '{}': {}".format(name, err))
+        return '!! {} not available !!'.format(name)
+    return '' if value is None else value
+
+
+def expand(template):
+    """
+    Fill in ``${NAME}`` and ``${NAME:default}`` references in a string.
+
+    :param str template: String with references.
+    :return: :class:`ResolvedValue`
+    """
+    return ResolvedValue(_PATTERN.sub(_replace, template), template)
+
+
+def _represent_resolved(dumper, data):
+    # save the reference rather than the secret it resolved to, as the
+    # plain scalar that is filled in again when loaded
+    return dumper.represent_scalar('!env_var', str(data.template))
+
+
+yaml.add_representer(ResolvedValue, _represent_resolved)
+
+
+class AuthHeaders(collections.abc.Mapping):
+    """
+    Request headers whose values are filled in again each time they are
+    read, so every request sends current credentials.
+
+    :param dict headers: Header names and values, e.g., the 'auth' entry
+        of a service config.
+    """
+    def __init__(self, headers):
+        self._headers = dict(headers or {})
+
+    def __getitem__(self, key):
+        value = self._headers[key]
+        if isinstance(value, ResolvedValue):
+            return value.resolve()
+        return value
+
+    def __iter__(self):
+        return iter(self._headers)
+
+    def __len__(self):
+        return len(self._headers)
+
+
+register('GCLOUD_TOKEN', CommandProvider(['gcloud', 'auth',
+                                          'print-access-token']))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+Health of the testbed's services. Every TRS and WES endpoint is probed
+in parallel (``metadataGet`` for TRS, ``GetServiceInfo`` for WES) with
+an overall deadline, so one slow or unreachable service neither holds up
+the others nor the caller. Results are cached for ``HEALTH_TTL`` seconds
+along with each probe's latency, and published as metrics:
+
+- ``wfinterop_service_up``: 1 if the last probe succeeded, else 0
+- ``wfinterop_health_probe_seconds``: latency of probes
+
+Probes reuse one client per service, so they do not load the service
+config and API spec every time. Dispatch consults the cached state (see
+:func:`is_down`), probing on a miss where asked to, and holds back runs
+for services known to be down.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from wfinterop import metrics
+from wfinterop.trs import TRS
+from wfinterop.wes import WES
+
+logger = logging.getLogger(__name__)
+
+# seconds a probe result stays valid
+HEALTH_TTL = 60
+# seconds to wait for all probes of a check to finish
+PROBE_TIMEOUT = 10
+# most probes running at once
+MAX_PROBES = 16
+
+# service kinds, as named in the testbed's service status
+TOOL_REGISTRIES = 'toolregistries'
+WORKFLOW_SERVICES = 'workflowservices'
+
+SERVICE_UP = metrics.gauge(
+    'wfinterop_service_up',
+    'Whether a service answered its last health probe',
+    ['kind', 'service_id'])
+PROBE_SECONDS = metrics.histogram(
+    'wfinterop_health_probe_seconds',
+    'Latency of service health probes',
+    ['kind', 'service_id'])
+
+_lock = threading.Lock()
+_clients = {}
+_health = {}
+_pending = {}
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_PROBES,
+                                           thread_name_prefix='health-probe')
+        return _executor
+
+
+def _client(kind, service_id):
+    key = (kind, service_id)
+    with _lock:
+        client = _clients.get(key)
+    if client is None:
+        if kind == TOOL_REGISTRIES:
+            client = TRS(trs_id=service_id)
+        elif kind == WORKFLOW_SERVICES:
+            client = WES(wes_id=service_id)
+        else:
+            raise ValueError("Unknown service kind: {}".format(kind))
+        with _lock:
+            client = _clients.setdefault(key, client)
+    return client
+
+
+def _record(kind, service_id, healthy, latency, error=None):
+    state = {'healthy': healthy,
+             'latency': latency,
+             'checked': time.time(),
+             'error': error}
+    with _lock:
+        _health[(kind, service_id)] = state
+    SERVICE_UP.set(int(healthy), kind=kind, service_id=service_id)
+    PROBE_SECONDS.observe(latency, kind=kind, service_id=service_id)
+    if not healthy:
+        logger.warning("Service '{}' is down: {}".format(service_id, error))
+    return state
+
+
+def probe(kind, service_id):
+    """
+    Check whether a service answers, and cache the result.
+
+    :param str kind: 'toolregistries' or 'workflowservices'.
+    :param str service_id: String identifying the TRS or WES.
+    :return: dict with 'healthy', 'latency' (seconds), 'checked' (epoch
+        seconds) and 'error' keys
+    """
+    start = time.perf_counter()
+    try:
+        client = _client(kind, service_id)
+        if kind == TOOL_REGISTRIES:
+            client.get_metadata()
+        else:
+            client.get_service_info()
+    except Exception as err:
+        # rebuild the client next time, e.g., after a config change
+        with _lock:
+            _clients.pop((kind, service_id), None)
+        return _record(kind, service_id, False,
+                       time.perf_counter() - start, str(err))
+    return _record(kind, service_id, True, time.perf_counter() - start)
+
+
+def _submit(kind, service_id):
+    # a probe still waiting on an unresponsive service is shared rather
+    # than piling up more of them
+    key = (kind, service_id)
+    with _lock:
+        future = _pending.get(key)
+    if future is None or future.done():
+        future = _get_executor().submit(probe, kind, service_id)
+        with _lock:
+            _pending[key] = future
+    return future
+
+
+def check_services(services, timeout=PROBE_TIMEOUT):
+    """
+    Probe services in parallel. Services that have not answered when
+    ``timeout`` seconds pass are recorded as down.
+
+    :param dict services: Service kind -> service IDs, e.g.,
+        ``{'workflowservices': ['local']}``.
+    :param float timeout: Seconds to wait for all probes.
+    :return: dict of service kind -> {service ID: True if healthy}
+    """
+    futures = {(kind, service_id): _submit(kind, service_id)
+               for kind, service_ids in services.items()
+               for service_id in set(service_ids)}
+    wait(list(futures.values()), timeout=timeout)
+    status = {kind: {} for kind in services}
+    for (kind, service_id), future in futures.items():
+        if future.done():
+            state = future.result()
+        else:
+            state = _record(kind, service_id, False, timeout,
+                            'No answer within {}s'.format(timeout))
+        status[kind][service_id] = state['healthy']
+    return status
+
+
+def get_health(kind, service_id, ttl=None):
+    """
+    Return the cached health of a service, if checked within ``ttl``
+    seconds.
+
+    :param str kind: 'toolregistries' or 'workflowservices'.
+    :param str service_id: String identifying the TRS or WES.
+    :param float ttl: Seconds a result stays valid; defaults to
+        ``HEALTH_TTL``.
+    :return: dict like :func:`probe` returns, or None if unknown
+    """
+    ttl = HEALTH_TTL if ttl is None else ttl
+    with _lock:
+        state = _health.get((kind, service_id))
+    if state is None or time.time() - state['checked'] > ttl:
+        return None
+    return dict(state)
+
+
+def is_down(kind, service_id, ttl=None, check=False, timeout=PROBE_TIMEOUT):
+    """
+    Return True if a recent probe found the service down. Services not
+    checked recently are probed first if ``check`` is set; otherwise
+    they are not considered down, so this never waits on the network.
+
+    :param str kind: 'toolregistries' or 'workflowservices'.
+    :param str service_id: String identifying the TRS or WES.
+    :param float ttl: Seconds a result stays valid.
+    :param bool check: If True, probe the service when there is no
+        recent result, e.g., in a worker that does not poll services.
+    :param float timeout: Seconds to wait for that probe.
+    """
+    state = get_health(kind, service_id, ttl)
+    if state is None and check:
+        check_services({kind: [service_id]}, timeout=timeout)
+        state = get_health(kind, service_id, ttl)
+    return state is not None and not state['healthy']
+
+
+def snapshot(ttl=None):
+    """
+    Return the cached health of every probed service.
+
+    :param float ttl: Seconds a result stays valid; older results are
+        left out.
+    :return: dict of service kind -> {service ID: health dict}
+    """
+    with _lock:
+        keys = list(_health)
+    status = {}
+    for kind, service_id in keys:
+        state = get_health(kind, service_id, ttl)
+        if state is not None:
+            status.setdefault(kind, {})[service_id] = state
+    return status
+
+
+def reset():
+    """Forget cached health and clients."""
+    with _lock:
+        _health.clear()
+        _clients.clear()
+        _pending.clear()
+    SERVICE_UP.clear()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Time-ordered, collision-free identifiers for submissions, in the ULID
+format: 26 Crockford base32 characters encoding a 48-bit millisecond
+timestamp followed by 80 random bits. IDs sort lexicographically by
+creation time. Within a process, IDs created in the same millisecond
+increment the random part, so they stay unique and ordered across
+threads; separate processes draw independent random parts, so a
+collision would require two processes to pick the same 80 random bits
+in the same millisecond.
+"""
+import base64
+import os
+import threading
+import time
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ID_LENGTH = 26
+
+_TIME_CHARS = 10
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+_DECODE = {char: value for value, char in enumerate(ALPHABET)}
+_TO_CROCKFORD = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', ALPHABET)
+
+_lock = threading.Lock()
+_last = {'pid': None, 'ms': -1, 'random': 0}
+
+
+def _encode(value, length):
+    # base32-encode as 20 bytes (32 characters) and keep the low digits
+    text = base64.b32encode(value.to_bytes(20, 'big')).decode('ascii')
+    return text[-length:].translate(_TO_CROCKFORD)
+
+
+def _decode(text):
+    value = 0
+    for char in text:
+        value = value * 32 + _DECODE[char]
+    return value
+
+
+def new_id(timestamp=None):
+    """
+    Create a new identifier.
+
+    Args:
+        timestamp (float): creation time in epoch seconds; defaults to now
+
+    Returns:
+        str: 26 character ID that sorts after every ID previously created
+        by this process for the same or an earlier time
+    """
+    ms = int((time.time() if timestamp is None else timestamp) * 1000)
+    with _lock:
+        pid = os.getpid()
+        if _last['pid'] != pid:
+            # a forked child must not continue its parent's sequence
+            _last.update(pid=pid, ms=-1)
+        if ms <= _last['ms'] and _last['random'] < _RANDOM_MAX:
+            ms = _last['ms']
+            random_part = _last['random'] + 1
+        else:
+            ms = max(ms, _last['ms'] + 1)
+            random_part = int.from_bytes(os.urandom(10), 'big')
+        _last.update(ms=ms, random=random_part)
+    return _encode((ms << _RANDOM_BITS) | random_part, ID_LENGTH)
+
+
+def is_id(value):
+    """Return True if ``value`` is an identifier from :func:`new_id`."""
+    return (isinstance(value, str) and len(value) == ID_LENGTH
+            and value[0] <= '7' and all(char in _DECODE for char in value))
+
+
+def id_timestamp(value):
+    """
+    Return the creation time of an identifier in epoch seconds, or None
+    if ``value`` is not an identifier from :func:`new_id` (e.g., a legacy
+    submission ID).
+    """
+    if not is_id(value):
+        return None
+    return _decode(value[:_TIME_CHARS]) / 1000.0
+
+
+def min_id(timestamp):
+    """
+    Return the lowest identifier that can be created at ``timestamp``;
+    every ID created at or after that time sorts at or after it.
+
+    Args:
+        timestamp (float): epoch seconds
+    """
+    return (_encode(int(timestamp * 1000), _TIME_CHARS)
+            + '0' * (ID_LENGTH - _TIME_CHARS))
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+Append-only journal of submission events. Instead of rewriting the whole
+queue document for every change, each change is appended to a JSON Lines
+journal as an event:
+
+- 'created': a submission was added; ``fields`` holds its info
+- 'updated': ``fields`` were set (e.g., ``status``, ``run_log`` when a
+  run is dispatched or changes state, ``lease``) and ``unset`` fields
+  were removed
+- 'removed': the submission left the live queue (e.g., it was archived)
+
+Updates that change a submission's status or the state of its run also
+record the ``transition``, so readers can follow state changes without
+knowing the earlier state.
+
+Every event records when it happened, so the journal is also an audit
+trail of each submission's history. The current state is a snapshot plus
+the events appended after it; a small ``.offset`` file records how far
+into the journal the snapshot goes. Events only set values, so replaying
+events a snapshot already includes gives the same state. The queue
+modules decide when to snapshot; this module holds the parts that do not
+depend on the store.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('created', 'updated', 'removed')
+
+
+def event(event_type, queue_id, submission_id, fields=None, unset=None,
+          transition=None):
+    """
+    Create an event record.
+
+    Args:
+        event_type (str): one of 'created', 'updated' or 'removed'
+        queue_id (str): string identifying the workflow queue
+        submission_id (str): submission the event applies to
+        fields (dict): submission info ('created') or fields to set
+            ('updated')
+        unset (list): field names to remove ('updated')
+        transition (dict): status and run state before and after the
+            event, if they changed (see :func:`transition`)
+
+    Returns:
+        dict: event record
+    """
+    if event_type not in EVENT_TYPES:
+        raise ValueError("Unknown event type: {}".format(event_type))
+    record = {'type': event_type,
+              'time': time.time(),
+              'queue_id': queue_id,
+              'submission_id': submission_id}
+    if fields:
+        record['fields'] = fields
+    if unset:
+        record['unset'] = list(unset)
+    if transition:
+        record['transition'] = transition
+    return record
+
+
+def state(bundle):
+    """
+    Return the status of a submission and the state of its run.
+
+    Args:
+        bundle (dict): submission info, or None
+
+    Returns:
+        tuple: status and run state (either may be None)
+    """
+    bundle = bundle or {}
+    return bundle.get('status'), (bundle.get('run_log') or {}).get('status')
+
+
+def transition(before, after):
+    """
+    Describe a change of state for an event record.
+
+    Args:
+        before (tuple): :func:`state` before the change
+        after (tuple): :func:`state` after the change
+
+    Returns:
+        dict: 'status', 'run_status', 'previous_status' and
+        'previous_run_status' keys, or None if the state did not change
+    """
+    if before == after:
+        return None
+    return {'status': after[0], 'run_status': after[1],
+            'previous_status': before[0], 'previous_run_status': before[1]}
+
+
+def apply_event(submissions, record):
+    """
+    Apply an event to a queue document, in place.
+
+    Args:
+        submissions (dict): queue document mapping queue IDs to their
+            submissions
+        record (dict): event record
+    """
+    queue_submissions = submissions.setdefault(record['queue_id'], {})
+    submission_id = record['submission_id']
+    if record['type'] == 'created':
+        queue_submissions[submission_id] = dict(record.get('fields') or {})
+    elif record['type'] == 'removed':
+        queue_submissions.pop(submission_id, None)
+    else:
+        bundle = queue_submissions.setdefault(submission_id, {})
+        bundle.update(record.get('fields') or {})
+        for field in record.get('unset') or []:
+            bundle.pop(field, None)
+
+
+def append(path, records):
+    """
+    Append events to a journal in one write.
+
+    Args:
+        path (str): journal file
+        records (list): event records
+    """
+    if not records:
+        return
+    lines = ''.join(json.dumps(record, default=str) + '\n'
+                    for record in records)
+    with open(path, 'a') as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read(path, offset=0):
+    """
+    Read events from a journal, starting at a byte offset. A partly
+    written last line (from a write in progress or interrupted) is left
+    out.
+
+    Args:
+        path (str): journal file
+        offset (int): byte offset to start from
+
+    Returns:
+        tuple: list of event records and the byte offset after the last
+        complete one
+    """
+    records = []
+    for record, offset in follow(path, offset):
+        records.append(record)
+    return records, offset
+
+
+def follow(path, offset=0):
+    """
+    Iterate over the events in a journal from a byte offset, like
+    :func:`read`, along with the offset after each event.
+
+    Args:
+        path (str): journal file
+        offset (int): byte offset to start from
+
+    Yields:
+        tuple: event record and the byte offset after it
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                yield json.loads(line.decode('utf-8')), offset
+    except IOError:
+        return
+
+
+def size(path):
+    """Return the size of a journal in bytes, or 0 if it does not exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def read_offset(path):
+    """
+    Return how far into the journal the snapshot goes, in bytes, from
+    the journal's ``.offset`` file (0 if there is none).
+
+    Args:
+        path (str): journal file
+    """
+    try:
+        with open(path + '.offset') as f:
+            return int(f.read().strip() or 0)
+    except (IOError, ValueError):
+        return 0
+
+
+def write_offset(path, offset):
+    """
+    Record how far into the journal the snapshot goes, replacing the
+    ``.offset`` file atomically.
+
+    Args:
+        path (str): journal file
+        offset (int): byte offset
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(offset))
+    os.replace(tmp_path, path + '.offset')
+
+
+def history(path, queue_id=None, submission_id=None):
+    """
+    Iterate over the events in a journal, oldest first, e.g., to review
+    everything that happened to one submission.
+
+    Args:
+        path (str): journal file
+        queue_id (str): only return events for this queue
+        submission_id (str): only return events for this submission
+
+    Yields:
+        dict: event records
+    """
+    try:
+        with open(path) as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                record = json.loads(line)
+                if queue_id is not None and record['queue_id'] != queue_id:
+                    continue
+                if (submission_id is not None
+                        and record['submission_id'] != submission_id):
+                    continue
+                yield record
+    except IOError:
+        return
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Time-limited leases that let several orchestrator workers share a queue.
+A worker claims a submission for ``ttl`` seconds before dispatching it and
+keeps renewing the lease while it works; if the worker dies, the lease
+expires and another worker can reclaim the submission. The queue modules
+store leases alongside submissions; this module holds the parts that do
+not depend on the store.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_TTL = 300
+
+
+def get_worker_id():
+    """
+    Return an identifier for the current worker process.
+
+    Returns:
+        str: string formatted as '<hostname>:<pid>'
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def new_lease(owner, ttl=DEFAULT_LEASE_TTL):
+    """
+    Create a lease record.
+
+    Args:
+        owner (str): string identifying the worker holding the lease
+        ttl (float): seconds until the lease expires
+
+    Returns:
+        dict: dict with 'owner' and 'expires' (epoch seconds) keys
+    """
+    return {'owner': owner, 'expires': time.time() + ttl}
+
+
+def lease_active(lease, now=None):
+    """
+    Check whether a lease is still held.
+
+    Args:
+        lease (dict): lease record, or None
+        now (float): current epoch time; defaults to :func:`time.time`
+
+    Returns:
+        bool: True if the lease exists and has not expired
+    """
+    if not lease or not lease.get('owner'):
+        return False
+    now = time.time() if now is None else now
+    return float(lease.get('expires') or 0) > now
+
+
+class LeaseKeeper(object):
+    """
+    Renew held leases from a background thread.
+
+    Args:
+        renew (function): callable taking a lease key and a TTL and
+            returning True if the lease was renewed
+        ttl (float): seconds each renewal extends a lease by
+        interval (float): seconds between renewals; defaults to a third
+            of ``ttl``
+    """
+    def __init__(self, renew, ttl=DEFAULT_LEASE_TTL, interval=None):
+        self.renew = renew
+        self.ttl = ttl
+        self.interval = ttl / 3.0 if interval is None else interval
+        self.lost = set()
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def hold(self, key):
+        """Start renewing the lease identified by ``key``."""
+        with self._lock:
+            self._held.add(key)
+            self.lost.discard(key)
+
+    def release(self, key):
+        """Stop renewing the lease identified by ``key``."""
+        with self._lock:
+            self._held.discard(key)
+
+    def renew_all(self):
+        """Renew every held lease once, dropping any that were lost."""
+        with self._lock:
+            keys = list(self._held)
+        for key in keys:
+            try:
+                renewed = self.renew(key, self.ttl)
+            except Exception as err:
+                logger.warning("Failed to renew lease on '{}': {}"
+                               .format(key, err))
+                continue
+            if not renewed:
+                logger.warning("Lost lease on '{}'".format(key))
+                with self._lock:
+                    self._held.discard(key)
+                    self.lost.add(key)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.renew_all()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='lease-keeper', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+"""
+In-process metrics for the orchestrator: counters, gauges and latency
+histograms keyed by label values, in the style of Prometheus. Metrics can
+be read as a dict (:func:`snapshot`) or scraped over HTTP in the
+Prometheus text format (:func:`serve`), e.g.:
+
+    python -m wfinterop --metrics-port 9100
+    curl localhost:9100/metrics
+"""
+import abc
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from wfinterop.run_table import TERMINAL_STATES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric(abc.ABC):
+    kind = None
+
+    def __init__(self, name, documentation='', labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("Metric '{}' expects labels {}, got {}"
+                             .format(self.name, self.labelnames,
+                                     tuple(labels)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def remove(self, **labels):
+        """Drop every series whose labels match ``labels``."""
+        idx = [(self.labelnames.index(name), str(value))
+               for name, value in labels.items()]
+        with self._lock:
+            for key in [key for key in self._values
+                        if all(key[i] == value for i, value in idx)]:
+                del self._values[key]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    @abc.abstractmethod
+    def _samples(self):
+        """Return ``(name, labels, value)`` tuples for :meth:`render`."""
+
+    @abc.abstractmethod
+    def snapshot(self):
+        """Return values keyed by tuples of label values."""
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(
+            name, value.replace('\\', r'\\').replace('"', r'\"')
+                       .replace('\n', r'\n'))
+            for name, value in pairs) + '}'
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name + '_total', self._format_labels(key), value)
+                    for key, value in sorted(self._values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return {key: value for key, value in self._values.items()}
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, self._format_labels(key), value)
+                    for key, value in sorted(self._values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return {key: value for key, value in self._values.items()}
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (e.g., latencies in seconds)."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation='', labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {
+                    'counts': [0] * (len(self.buckets) + 1),
+                    'sum': 0.0,
+                    'count': 0
+                }
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),),
+                                        series['counts']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    samples.append((self.name + '_bucket',
+                                    self._format_labels(key, [('le', le)]),
+                                    cumulative))
+                samples.append((self.name + '_sum',
+                                self._format_labels(key), series['sum']))
+                samples.append((self.name + '_count',
+                                self._format_labels(key), series['count']))
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {'count': series['count'],
+                          'sum': series['sum'],
+                          'buckets': dict(zip(self.buckets + (float('inf'),),
+                                              series['counts']))}
+                    for key, series in self._values.items()}
+
+
+class Registry(object):
+    """Collection of named metrics."""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation,
+                                                   labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError("Metric '{}' already registered as a {}"
+                                 .format(name, metric.kind))
+            return metric
+
+    def counter(self, name, documentation='', labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation='', labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation='', labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation,
+                                   labelnames, buckets=buckets)
+
+    def reset(self):
+        """Clear recorded values, keeping metric definitions."""
+        with self._lock:
+            for metric in self._metrics.values():
+                metric.clear()
+
+    def snapshot(self):
+        """
+        Return current values of every metric.
+
+        Returns:
+            dict: metric name -> dict of label dict (as a tuple of
+            (name, value) pairs) -> value
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: {tuple(zip(metric.labelnames, key)): value
+                              for key, value in metric.snapshot().items()}
+                for metric in metrics}
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name,
+                                               metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            lines.extend('{}{} {}'.format(name, labels, value)
+                         for name, labels, value in metric._samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+snapshot = REGISTRY.snapshot
+render = REGISTRY.render
+
+WES_REQUESTS = counter(
+    'wfinterop_wes_requests', 'WES API calls',
+    ['wes_id', 'endpoint', 'outcome'])
+WES_REQUEST_SECONDS = histogram(
+    'wfinterop_wes_request_seconds', 'Latency of WES API calls',
+    ['wes_id', 'endpoint'])
+TRS_REQUESTS = counter(
+    'wfinterop_trs_requests', 'TRS API calls',
+    ['trs_id', 'endpoint', 'outcome'])
+TRS_REQUEST_SECONDS = histogram(
+    'wfinterop_trs_request_seconds', 'Latency of TRS API calls',
+    ['trs_id', 'endpoint'])
+QUEUE_SECONDS = histogram(
+    'wfinterop_queue_operation_seconds',
+    'Duration of submission queue reads and writes',
+    ['backend', 'operation'])
+REQUEST_BUILD_SECONDS = histogram(
+    'wfinterop_request_build_seconds',
+    'Time spent building WES run requests in the orchestrator process',
+    ['queue_id'])
+SWEEP_SECONDS = histogram(
+    'wfinterop_monitor_sweep_seconds',
+    'Duration of a monitor sweep over one queue',
+    ['queue_id'])
+RUNS_IN_FLIGHT = gauge(
+    'wfinterop_runs_in_flight',
+    'Runs not yet in a terminal state, by queue and state',
+    ['queue_id', 'state'])
+
+
+def instrument(calls, latency, **static_labels):
+    """
+    Decorator counting calls (by outcome) and timing them.
+
+    :param Counter calls: Counter with an 'outcome' label plus the labels
+        in ``static_labels``.
+    :param Histogram latency: Histogram with the labels in
+        ``static_labels``.
+    :param static_labels: Label values, or callables taking the wrapped
+        function's arguments and returning a label value.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            labels = {name: (value(*args, **kwargs) if callable(value)
+                             else value)
+                      for name, value in static_labels.items()}
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                latency.observe(time.perf_counter() - start, **labels)
+                calls.inc(outcome=outcome, **labels)
+        return wrapper
+    return decorator
+
+
+def record_runs(queue_id, state_counts):
+    """
+    Publish the number of in-flight runs in each state for a queue,
+    dropping states that no longer have any runs.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param dict state_counts: state -> count, e.g., from
+        :meth:`wfinterop.run_table.RunTable.state_counts`
+    """
+    RUNS_IN_FLIGHT.remove(queue_id=queue_id)
+    for state, count in state_counts.items():
+        if state not in TERMINAL_STATES:
+            RUNS_IN_FLIGHT.set(count, queue_id=queue_id, state=state)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        payload = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def serve(port=9100, host='127.0.0.1', registry=REGISTRY):
+    """
+    Serve metrics at ``http://host:port/metrics`` from a background
+    thread.
+
+    :param int port: Port to bind; 0 picks a free port.
+    :param str host: Interface to bind.
+    :return: the running :class:`http.server.HTTPServer`; call its
+        ``shutdown()`` to stop serving
+    """
+    server = _ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever,
+                              name='metrics', daemon=True)
+    thread.start()
+    logger.info("Serving metrics on http://{}:{}/metrics"
+                .format(*server.server_address[:2]))
+    return server
@@ -11,93 +11,205 @@ import sys
 import time
 import os
 import json
-import datetime as dt
 
-from IPython.display import display, clear_output
+from IPython.display import clear_output
 
+from wfinterop import callbacks, health, metrics, tracing
 from wfinterop.config import queue_config, wes_config
-from wfinterop.util import ctime2datetime, convert_timedelta
+from wfinterop.lease import LeaseKeeper, get_worker_id, lease_active
+from wfinterop.run_table import RunTable
+from wfinterop.request_pool import get_request_pool, thaw_parts
+from wfinterop.sharding import ShardedWorker
+from wfinterop.util import to_seconds, to_timestamp
 from wfinterop.wes import WES
 from wfinterop.trs2wes import store_verification
 from wfinterop.trs2wes import build_wes_request
+from wfinterop.trs2wes import fingerprint_request
 from wfinterop.trs2wes import fetch_queue_workflow
 from wfinterop.queue import get_submission_bundle
 from wfinterop.queue import get_submissions
 from wfinterop.queue import create_submission
-from wfinterop.queue import update_submission
+from wfinterop.queue import find_run
+from wfinterop.queue import update_submission_fields
+from wfinterop.queue import apply_updates
+from wfinterop.queue import claim_submission
+from wfinterop.queue import renew_lease
+from wfinterop.queue import release_submission
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# seconds to wait after dispatch before the first status check
+SUBMIT_WAIT = 10
 
+# with run callbacks, seconds between reconciliation polls of each run
+RECONCILE_INTERVAL = 300
+
+
+def _get_workflow(queue_id, add_attachments=None):
+    """
+    Look up the workflow URL and attachments for a queue.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param list add_attachments:
+    """
+    wf_config = queue_config()[queue_id]
+    if wf_config['workflow_url'] is None:
+        wf_config = fetch_queue_workflow(queue_id)
+    wf_attachments = wf_config['workflow_attachments']
+    if add_attachments is not None:
+        wf_attachments += add_attachments
+        wf_attachments = list(set(wf_attachments))
+    return wf_config['workflow_url'], wf_attachments
+
+
+def _finished_status(queue_id):
+    """
+    Return the status for a submission whose run completed: 'VALIDATED'
+    for checker queues with a target queue, otherwise 'COMPLETE'.
+
+    :param str queue_id: String identifying the workflow queue.
+    """
+    if queue_config()[queue_id].get('target_queue'):
+        return 'VALIDATED'
+    return 'COMPLETE'
+
+
+def prepare_job(queue_id, wf_jsonyaml, opts, add_attachments=None,
+                processes=None):
+    """
+    Start building the request parts for a job in the request
+    preparation pool.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param str wf_jsonyaml:
+    :param dict opts:
+    :param list add_attachments:
+    :param int processes: Size of the preparation pool.
+    :return: Future resolving to part descriptors, to pass to
+        :func:`run_job` as ``prepared``.
+    """
+    workflow_url, wf_attachments = _get_workflow(queue_id, add_attachments)
+    return get_request_pool(processes).prepare(
+        workflow_file=workflow_url,
+        jsonyaml=wf_jsonyaml,
+        attachments=wf_attachments,
+        **opts
+    )
+
+
+def _discard(prepared, submission_id):
+    """
+    Cancel the request preparation for a submission that will not be
+    dispatched, if it has not started yet.
+    """
+    future = prepared.pop(submission_id, None)
+    if future is not None:
+        future.cancel()
+
+
+@tracing.traced('run_job', 'queue_id', 'wes_id')
 def run_job(queue_id,
             wes_id,
             wf_jsonyaml,
             opts=None,
             add_attachments=None,
-            submission=False):
+            submission=False,
+            prepared=None,
+            reuse=False):
     """
     Put a workflow in the queue and immmediately run it.
 
+    With ``reuse``, the run log records a fingerprint of the request, and
+    if a prior run of an identical request already completed on the same
+    WES, the job is linked to that run instead of being executed again.
+    Fingerprinting may fetch remote descriptors, so it is skipped
+    otherwise; only runs dispatched with ``reuse`` can be reused later.
+
     :param str queue_id: String identifying the workflow queue.
     :param str wes_id:
     :param str wf_jsonyaml:
     :param dict opts:
     :param list add_attachments:
     :param bool submission:
+    :param prepared: Future from :func:`prepare_job` holding the request
+        parts; if given, parts are not built here.
+    :param bool reuse: If True, reuse a prior COMPLETE run with the same
+        request fingerprint on the same WES.
     """
-    wf_config = queue_config()[queue_id]
-    if wf_config['workflow_url'] is None:
-        wf_config = fetch_queue_workflow(queue_id)
-    wf_attachments = wf_config['workflow_attachments']
-    if add_attachments is not None:
-        wf_attachments += add_attachments
-        wf_attachments = list(set(wf_attachments))
+    workflow_url, wf_attachments = _get_workflow(queue_id, add_attachments)
 
     if not submission:
         submission_id = create_submission(queue_id=queue_id,
                                           submission_data=wf_jsonyaml,
                                           wes_id=wes_id)
+        tracing.set_submission_id(submission_id)
     wes_instance = WES(wes_id)
     service_config = wes_config()[wes_id]
-    request = {'workflow_url': wf_config['workflow_url'],
+    request = {'workflow_url': workflow_url,
                'workflow_params': wf_jsonyaml,
                'attachment': wf_attachments}
     parts = []
-    if opts is not None:
-        parts = build_wes_request(
-            workflow_file=request['workflow_url'],
-            jsonyaml=request['workflow_params'],
-            attachments=request['attachment'],
-            **opts
-        )
+    if prepared is not None:
+        with tracing.span('wait_for_request'):
+            parts = thaw_parts(prepared.result())
+    elif opts is not None:
+        with metrics.REQUEST_BUILD_SECONDS.time(queue_id=queue_id):
+            parts = build_wes_request(
+                workflow_file=request['workflow_url'],
+                jsonyaml=request['workflow_params'],
+                attachments=request['attachment'],
+                **opts
+            )
     if 'workflow_engine_parameters' in service_config:
         parts.append(('workflow_engine_parameters',
                       json.dumps(service_config['workflow_engine_parameters'])))
     parts = parts if len(parts) else None
-
-    run_log = wes_instance.run_workflow(request, parts=parts)
-    if run_log['run_id'] == 'failed':
-        logger.info("Job submission failed for WES '{}'"
-                    .format(wes_id))
-        run_status = 'FAILED'
-        sub_status = 'FAILED'
+    fingerprint = None
+    prior_run = None
+    if reuse:
+        fingerprint = fingerprint_request(parts=parts, request=request)
+        prior_run = find_run(fingerprint, wes_id)
+    if prior_run is not None:
+        prior_queue_id, prior_submission_id, prior_run_log = prior_run
+        logger.info("Identical request already completed on WES '{}' "
+                    "(submission '{}' in queue '{}'); reusing run ID: {}"
+                    .format(wes_id, prior_submission_id, prior_queue_id,
+                            prior_run_log['run_id']))
+        run_log = dict(prior_run_log, reused_from=prior_submission_id)
+        run_status = run_log['status']
+        sub_status = _finished_status(queue_id)
     else:
-        logger.info("Job received by WES '{}', run ID: {}"
-                    .format(wes_id, run_log['run_id']))
-        run_log['start_time'] = dt.datetime.now().ctime()
-        time.sleep(10)
-        run_status = wes_instance.get_run_status(run_log['run_id'])['state']
-        sub_status = 'SUBMITTED'
+        run_log = wes_instance.run_workflow(request, parts=parts)
+        if run_log['run_id'] == 'failed':
+            logger.info("Job submission failed for WES '{}'"
+                        .format(wes_id))
+            run_status = 'FAILED'
+            sub_status = 'FAILED'
+        else:
+            logger.info("Job received by WES '{}', run ID: {}"
+                        .format(wes_id, run_log['run_id']))
+            run_log['start_time'] = time.time()
+            with tracing.span('wait_for_run_start'):
+                time.sleep(SUBMIT_WAIT)
+            run_status = wes_instance.get_run_status(
+                run_log['run_id']
+            )['state']
+            sub_status = 'SUBMITTED'
     run_log['status'] = run_status
+    if fingerprint is not None:
+        run_log['fingerprint'] = fingerprint
+    run_log['wes_id'] = wes_id
 
     if not submission:
-        update_submission(queue_id, submission_id, 'run_log', run_log)
-        update_submission(queue_id, submission_id, 'status', sub_status)
+        update_submission_fields(queue_id, submission_id,
+                                 run_log=run_log, status=sub_status)
     return run_log
 
 
-def run_submission(queue_id, submission_id, wes_id=None, opts=None):
+@tracing.traced('run_submission', 'queue_id', 'submission_id')
+def run_submission(queue_id, submission_id, wes_id=None, opts=None,
+                   prepared=None, reuse=False):
     """
     For a single submission to a single evaluation queue, run
     the workflow in a single environment.
@@ -106,6 +218,8 @@ def run_submission(queue_id, submission_id, wes_id=None, opts=None):
     :param str submission_id:
     :param str wes_id:
     :param dict opts:
+    :param prepared: Future from :func:`prepare_job`.
+    :param bool reuse: If True, reuse a prior identical COMPLETE run.
     """
     submission = get_submission_bundle(queue_id, submission_id)
     if submission['wes_id'] is not None:
@@ -121,135 +235,273 @@ def run_submission(queue_id, submission_id, wes_id=None, opts=None):
                       wes_id=wes_id,
                       wf_jsonyaml=wf_jsonyaml,
                       submission=True,
-                      opts=opts)
-
-    update_submission(queue_id, submission_id, 'run_log', run_log)
-    update_submission(queue_id, submission_id, 'status', 'SUBMITTED')
+                      opts=opts,
+                      prepared=prepared,
+                      reuse=reuse)
+
+    sub_status = 'SUBMITTED'
+    if 'reused_from' in run_log:
+        sub_status = _finished_status(queue_id)
+    update_submission_fields(queue_id, submission_id,
+                             run_log=run_log, status=sub_status)
     return run_log
 
 
-def run_queue(queue_id, wes_id=None, opts=None):
+def run_queue(queue_id, wes_id=None, opts=None, lease_ttl=None,
+              worker_id=None, prepare_processes=None, reuse=False):
     """
     Run all submissions in a queue in a single environment.
 
+    When ``lease_ttl`` is set, each submission is claimed with a lease
+    before it is dispatched and the lease is renewed until dispatch
+    finishes, so several workers can run the same queue; submissions
+    leased by other live workers are skipped.
+
+    When ``prepare_processes`` is set (and ``opts`` is given), request
+    parts for every submission are built up front in a pool of worker
+    processes, and each submission is dispatched as soon as its parts
+    are ready. Requests are not built for submissions leased by other
+    workers or meant for a WES known to be down, and any not sent are
+    cancelled.
+
+    Submissions for a WES that a recent health probe found down (see
+    :mod:`wfinterop.health`) are left RECEIVED for a later run.
+
     :param str queue_id: String identifying the workflow queue.
     :param str wes_id:
     :param dict opts:
+    :param float lease_ttl: Seconds each claim lasts without renewal;
+        None disables claiming.
+    :param str worker_id: String identifying this worker in leases.
+    :param int prepare_processes: Number of request preparation
+        processes; None builds requests inline.
+    :param bool reuse: If True, link submissions to prior identical
+        COMPLETE runs instead of running them again.
     """
     queue_log = {}
-    for submission_id in get_submissions(queue_id, status='RECEIVED'):
-        submission = get_submission_bundle(queue_id, submission_id)
-        if submission['wes_id'] is not None:
-            wes_id = submission['wes_id']
-        run_log = run_submission(queue_id=queue_id,
-                                 submission_id=submission_id,
-                                 wes_id=wes_id,
-                                 opts=opts)
-        run_log['wes_id'] = wes_id
-        queue_log[submission_id] = run_log
+    prepared = {}
+    if lease_ttl is not None:
+        worker_id = get_worker_id() if worker_id is None else worker_id
+    if prepare_processes is not None and opts is not None:
+        for submission_id in get_submissions(queue_id, status='RECEIVED'):
+            submission = get_submission_bundle(queue_id, submission_id)
+            # don't build requests this worker is not going to send
+            lease = submission.get('lease')
+            if (lease_ttl is not None and lease_active(lease)
+                    and lease['owner'] != worker_id):
+                continue
+            if health.is_down(health.WORKFLOW_SERVICES,
+                              submission['wes_id'] or wes_id):
+                continue
+            prepared[submission_id] = prepare_job(
+                queue_id, submission['data'], opts,
+                processes=prepare_processes
+            )
+    keeper = None
+    if lease_ttl is not None:
+        keeper = LeaseKeeper(
+            renew=lambda sub_id, ttl: renew_lease(queue_id, sub_id,
+                                                  worker_id, ttl),
+            ttl=lease_ttl
+        ).start()
+    try:
+        for submission_id in get_submissions(queue_id, status='RECEIVED'):
+            if keeper is not None:
+                if claim_submission(queue_id, submission_id,
+                                    worker_id=worker_id,
+                                    ttl=lease_ttl) is None:
+                    _discard(prepared, submission_id)
+                    continue
+                keeper.hold(submission_id)
+            try:
+                submission = get_submission_bundle(queue_id, submission_id)
+                if submission['wes_id'] is not None:
+                    wes_id = submission['wes_id']
+                if health.is_down(health.WORKFLOW_SERVICES, wes_id):
+                    logger.info("WES '{}' is down; leaving submission {} "
+                                "for a later run".format(wes_id,
+                                                         submission_id))
+                    _discard(prepared, submission_id)
+                    continue
+                run_log = run_submission(queue_id=queue_id,
+                                         submission_id=submission_id,
+                                         wes_id=wes_id,
+                                         opts=opts,
+                                         prepared=prepared.pop(submission_id,
+                                                               None),
+                                         reuse=reuse)
+            finally:
+                if keeper is not None:
+                    keeper.release(submission_id)
+                    release_submission(queue_id, submission_id, worker_id)
+            run_log['wes_id'] = wes_id
+            queue_log[submission_id] = run_log
+    finally:
+        if keeper is not None:
+            keeper.stop()
+        # requests built for submissions that were not dispatched
+        for submission_id in list(prepared):
+            _discard(prepared, submission_id)
 
     return queue_log
 
 
-def monitor_queue(queue_id):
+def monitor_queue(queue_id, run_states=None, poll_interval=None):
     """
-    Update the status of all submissions for a queue.
+    Update the status of all submissions for a queue. Changes are
+    written to the queue in a single update at the end of the sweep,
+    which also saves the changes already seen if polling a submission
+    fails.
 
     :param str queue_id: String identifying the workflow queue.
+    :param dict run_states: Run ID -> state pushed by workflow engines
+        (see :mod:`wfinterop.callbacks`); used instead of polling WES.
+    :param float poll_interval: Only poll WES for runs whose state was
+        last learned at least this many seconds ago; None polls every
+        run in every sweep.
     """
-    current = dt.datetime.now()
+    run_states = run_states or {}
+    current = time.time()
     queue_log = {}
-    for sub_id in get_submissions(queue_id=queue_id):
-        submission = get_submission_bundle(queue_id, sub_id)
-        if submission['status'] == 'RECEIVED':
-            queue_log[sub_id] = {'status': 'PENDING'}
-            continue
-        run_log = submission['run_log']
-        if run_log['run_id'] == 'failed':
-            queue_log[sub_id] = {'status': 'FAILED'}
-            continue
-        run_log['wes_id'] = submission['wes_id']
-        if run_log['status'] in ['COMPLETE', 'CANCELED', 'EXECUTOR_ERROR']:
-            queue_log[sub_id] = run_log
-            continue
-        wes_instance = WES(submission['wes_id'])
-        run_status = wes_instance.get_run_status(run_log['run_id'])
-
-        if run_status['state'] in ['QUEUED', 'INITIALIZING', 'RUNNING']:
-            etime = convert_timedelta(
-                current - ctime2datetime(run_log['start_time'])
-            )
-        elif 'elapsed_time' not in run_log:
-            etime = 0
-        else:
-            etime = run_log['elapsed_time']
-
-        run_log['status'] = run_status['state']
-        run_log['elapsed_time'] = etime
-
-        update_submission(queue_id, sub_id, 'run_log', run_log)
-
-        if run_log['status'] == 'COMPLETE':
-            wf_config = queue_config()[queue_id]
-            sub_status = run_log['status']
-            if wf_config['target_queue']:
-                # store_verification(wf_config['target_queue'],
-                #                    submission['wes_id'])
-                sub_status = 'VALIDATED'
-            update_submission(queue_id, sub_id, 'status', sub_status)
-
-        queue_log[sub_id] = run_log
+    updates = []
+    try:
+        for sub_id in get_submissions(queue_id=queue_id):
+            with tracing.span('poll_submission', submission_id=sub_id):
+                submission = get_submission_bundle(queue_id, sub_id)
+                if submission['status'] == 'RECEIVED':
+                    queue_log[sub_id] = {'status': 'PENDING'}
+                    continue
+                run_log = submission['run_log']
+                if run_log['run_id'] == 'failed':
+                    queue_log[sub_id] = {'status': 'FAILED'}
+                    continue
+                # runs record the WES they were sent to; older runs use the
+                # submission's
+                run_log['wes_id'] = (run_log.get('wes_id')
+                                     or submission['wes_id'])
+                if run_log['status'] in ['COMPLETE', 'CANCELED',
+                                         'EXECUTOR_ERROR']:
+                    queue_log[sub_id] = run_log
+                    continue
+                learned = True
+                if run_log['run_id'] in run_states:
+                    state = run_states[run_log['run_id']]
+                elif (poll_interval is not None
+                        and current - run_log.get('status_time', 0)
+                        < poll_interval):
+                    # rely on callbacks until the next reconciliation poll
+                    state = run_log['status']
+                    learned = False
+                else:
+                    wes_instance = WES(run_log['wes_id'])
+                    state = wes_instance.get_run_status(
+                        run_log['run_id']
+                    )['state']
+                if learned and poll_interval is not None:
+                    run_log['status_time'] = current
+
+                if state in ['QUEUED', 'INITIALIZING', 'RUNNING']:
+                    etime = int(current - to_timestamp(run_log['start_time']))
+                else:
+                    etime = to_seconds(run_log.get('elapsed_time'))
+
+                run_log['status'] = state
+                run_log['elapsed_time'] = etime
+
+                fields = {'run_log': run_log}
+                if run_log['status'] == 'COMPLETE':
+                    wf_config = queue_config()[queue_id]
+                    fields['status'] = run_log['status']
+                    if wf_config['target_queue']:
+                        # store_verification(wf_config['target_queue'],
+                        #                    submission['wes_id'])
+                        fields['status'] = 'VALIDATED'
+                updates.append((queue_id, sub_id, fields))
+
+                queue_log[sub_id] = run_log
+    finally:
+        # one write for every submission polled in this sweep
+        apply_updates(updates)
 
     return queue_log
 
 
-def monitor():
+def monitor(shard=False, worker_id=None, shard_ttl=60, callback_port=None,
+            callback_token=None):
     """
     Monitor progress of workflow jobs.
-    """
-    import pandas as pd
-    pd.set_option('display.width', 1000)
-    pd.set_option('display.max_columns', 10)
-    pd.set_option('display.expand_frame_repr', False)
 
+    :param bool shard: If True, join the pool of sharded workers and only
+        monitor the queues this worker owns on the hash ring.
+    :param str worker_id: String identifying this worker in the pool.
+    :param float shard_ttl: Seconds before a silent worker is dropped
+        from the pool and its queues rebalanced.
+    :param int callback_port: If given, receive run states pushed by
+        workflow engines on this local port (see
+        :mod:`wfinterop.callbacks`); WES is then only polled every
+        ``RECONCILE_INTERVAL`` seconds per run, to catch missed
+        callbacks.
+    :param str callback_token: Shared secret engines must send with
+        callbacks.
+    """
+    run_table = RunTable()
+    worker = ShardedWorker(worker_id, ttl=shard_ttl) if shard else None
+    receiver = None
+    poll_interval = None
+    if callback_port is not None:
+        receiver = callbacks.serve(callback_port, token=callback_token)
+        poll_interval = RECONCILE_INTERVAL
     try:
         while True:
-            statuses = []
+            shard_statuses = {}
+            run_states = receiver.drain() if receiver is not None else None
 
             clear_output(wait=True)
 
-            for queue_id in queue_config():
-                queue_status = monitor_queue(queue_id)
-                if len(queue_status):
-                    statuses.append(queue_status)
-                    print("\nWorkflow queue: {}".format(queue_id))
-                    status_tracker = pd.DataFrame.from_dict(
-                        queue_status,
-                        orient='index')
-
-                    display(status_tracker)
-
-            terminal_statuses = ['FAILED',
-                                 'COMPLETE',
-                                 'CANCELED',
-                                 'EXECUTOR_ERROR']
-            if all([sub['status'] in terminal_statuses
-                    for queue in statuses
-                    for sub in queue.values()]):
+            queue_ids = list(queue_config())
+            if worker is not None:
+                owned = worker.heartbeat(queue_ids)
+                print("\nWorker {} monitoring {} of {} queues ({} workers)"
+                      .format(worker.worker_id, len(owned), len(queue_ids),
+                              len(worker.ring.members)))
+                queue_ids = owned
+            start = time.time()
+            for queue_id in queue_ids:
+                with metrics.SWEEP_SECONDS.time(queue_id=queue_id):
+                    queue_status = monitor_queue(queue_id,
+                                                 run_states=run_states,
+                                                 poll_interval=poll_interval)
+                shard_statuses[queue_id] = queue_status
+                run_table.update_queue_log(queue_id, queue_status)
+                metrics.record_runs(queue_id,
+                                    run_table.state_counts(queue_id))
+            print(run_table.summary(queue_ids))
+
+            if run_table.all_terminal(queue_ids):
                 print("\nNo jobs running...")
+            if worker is not None:
+                worker.record(shard_statuses, time.time() - start)
             print("\n(Press CTRL+C to quit)")
-            time.sleep(2)
+            if receiver is not None:
+                # a callback ends the wait early
+                receiver.wait(2)
+            else:
+                time.sleep(2)
             os.system('clear')
             sys.stdout.flush()
 
     except KeyboardInterrupt:
         print("\nDone")
         return
+    finally:
+        if worker is not None:
+            worker.leave()
+        if receiver is not None:
+            receiver.stop()
 
 
 def get_run_log(wes_id, run_id):
     """Gets a workflows run logs"""
     wes_instance = WES(wes_id)
-    stderr = wes_instance.get_run_stderr(run_id)
-    stdout = wes_instance.get_run_stdout(run_id)
-    return stderr, stdout
+    run_logs = wes_instance.get_run_logs(run_id)
+    return run_logs['stderr'], run_logs['stdout']
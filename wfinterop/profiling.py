@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""
+Profile a single dispatch (``run_queue``) or monitor (``monitor_queue``)
+cycle. The cycle runs under :mod:`cProfile`, written as a pstats file,
+while a sampling profiler records the call stack of the same thread at a
+fixed interval, written in the collapsed-stack format read by flame graph
+tools (e.g., ``flamegraph.pl`` or speedscope). Cycles can run against the
+configured services or, with ``stub=True``, against a local
+:class:`wfinterop.stubs.WESStub` and copies of the config and submission
+queue, e.g.:
+
+    python -m wfinterop profile dispatch --queue test_cwl_queue --stub
+"""
+import cProfile
+import logging
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from wfinterop import config
+from wfinterop import orchestrator
+from wfinterop import queue
+from wfinterop.stubs import WESStub
+from wfinterop.util import get_yaml, save_yaml
+
+logger = logging.getLogger(__name__)
+
+CYCLES = ('dispatch', 'monitor')
+DEFAULT_INTERVAL = 0.005
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return '{} ({}:{})'.format(code.co_name,
+                               os.path.basename(code.co_filename),
+                               code.co_firstlineno)
+
+
+class StackSampler(object):
+    """
+    Sample one thread's call stack from a background thread.
+
+    Args:
+        thread_id (int): identifier of the thread to sample; defaults to
+            the thread creating the sampler
+        interval (float): seconds between samples
+    """
+    def __init__(self, thread_id=None, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def write(self, path):
+        """
+        Write samples as collapsed stacks: one line per distinct stack,
+        frames from the outermost call separated by ';', then the number
+        of samples.
+        """
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
+
+
+@contextmanager
+def _swapped(module, **values):
+    """
+    Set module attributes for the duration of the block, restoring the
+    original values afterwards.
+    """
+    saved = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+@contextmanager
+def stub_services(run_duration=3600.0):
+    """
+    Run with every workflow service replaced by a local WES stub. The
+    app config, queue config and submission queue are copied into a
+    temporary directory, so the real submission queue is not modified,
+    and the post-dispatch wait in ``run_job`` is skipped. Runs already
+    recorded in the queue are started on the stub too.
+
+    Args:
+        run_duration (float): seconds stub runs stay RUNNING, so monitor
+            cycles have work to do
+
+    Yields:
+        :class:`wfinterop.stubs.WESStub`: the running stub
+    """
+    workdir = tempfile.mkdtemp(prefix='wfinterop-profile-')
+    try:
+        with WESStub(run_duration=run_duration) as stub, ExitStack() as stack:
+            app_config = get_yaml(config.config_path)
+            wes_ids = set(app_config.get('workflowservices') or {})
+            for wf_config in config.queue_config().values():
+                wes_ids.update(wf_config.get('wes_opts') or [])
+                wes_ids.add(wf_config.get('wes_default'))
+            app_config['workflowservices'] = {
+                wes_id: stub.config() for wes_id in wes_ids if wes_id
+            }
+            config_path = os.path.join(workdir, 'config.yaml')
+            queues_path = os.path.join(workdir, 'queues.yaml')
+            submission_queue = os.path.join(workdir, 'submission_queue.json')
+            save_yaml(config_path, app_config)
+            shutil.copy(config.queues_path, queues_path)
+            shutil.copy(queue.submission_queue, submission_queue)
+            journal_path = queue.journal_path()
+            for suffix in ('', '.offset'):
+                if os.path.exists(journal_path + suffix):
+                    shutil.copy(journal_path + suffix,
+                                os.path.join(workdir,
+                                             'submission_queue.journal.jsonl'
+                                             + suffix))
+
+            stack.enter_context(_swapped(config, config_path=config_path,
+                                         queues_path=queues_path))
+            stack.enter_context(_swapped(queue,
+                                         submission_queue=submission_queue))
+            stack.enter_context(_swapped(orchestrator, SUBMIT_WAIT=0))
+            # runs dispatched before profiling are unknown to the stub;
+            # serve them as new runs so monitor cycles can poll them
+            for queue_id in config.queue_config():
+                for _, bundle in queue.query_submissions(queue_id):
+                    run_id = (bundle.get('run_log') or {}).get('run_id')
+                    if run_id and run_id != 'failed':
+                        stub.add_run(run_id)
+            yield stub
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def profile_cycle(cycle, queue_id, wes_id=None, opts=None, output=None,
+                  stub=False, interval=DEFAULT_INTERVAL):
+    """
+    Run one dispatch or monitor cycle for a queue under the profilers.
+
+    Args:
+        cycle (str): 'dispatch' to run ``run_queue`` or 'monitor' to run
+            ``monitor_queue``
+        queue_id (str): string identifying the workflow queue
+        wes_id (str): workflow service for dispatch
+        opts (dict): request building options for dispatch
+        output (str): path prefix for the '.pstats' and '.collapsed'
+            files; defaults to 'wfinterop-<cycle>-<queue_id>'
+        stub (bool): if True, run against a local WES stub and copies of
+            the config (see :func:`stub_services`); monitor cycles first
+            dispatch the queue, unprofiled, so the stub has runs to report
+        interval (float): seconds between stack samples
+
+    Returns:
+        dict: output paths, wall time and number of stack samples
+    """
+    if cycle not in CYCLES:
+        raise ValueError("Unknown cycle '{}'; expected one of {}"
+                         .format(cycle, CYCLES))
+    output = output or 'wfinterop-{}-{}'.format(cycle, queue_id)
+    with ExitStack() as stack:
+        if stub:
+            stack.enter_context(stub_services())
+        if cycle == 'dispatch':
+            def target():
+                return orchestrator.run_queue(queue_id, wes_id=wes_id,
+                                              opts=opts)
+        else:
+            if stub:
+                orchestrator.run_queue(queue_id, wes_id=wes_id, opts=opts)
+
+            def target():
+                return orchestrator.monitor_queue(queue_id)
+
+        profiler = cProfile.Profile()
+        sampler = StackSampler(interval=interval)
+        start = time.time()
+        with sampler:
+            profiler.enable()
+            try:
+                target()
+            finally:
+                profiler.disable()
+        wall = time.time() - start
+
+    result = {'pstats': output + '.pstats',
+              'collapsed': output + '.collapsed',
+              'wall_s': round(wall, 4),
+              'samples': sum(sampler.stacks.values())}
+    profiler.dump_stats(result['pstats'])
+    sampler.write(result['collapsed'])
+    logger.info("Profiled {} cycle for queue '{}' in {}s; wrote {} and {}"
+                .format(cycle, queue_id, result['wall_s'],
+                        result['pstats'], result['collapsed']))
+    return result
+
+
+def print_hotspots(pstats_path, limit=20, sort='cumulative', stream=None):
+    """Print the top entries of a pstats file."""
+    stats = pstats.Stats(pstats_path, stream=stream or sys.stdout)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
@@ -1,11 +1,26 @@
 #!/usr/bin/env python
 """
 """
+import bisect
+import itertools
+import json
 import logging
 import os
-import datetime as dt
+import threading
+import time
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
-from wfinterop.util import get_json, save_json
+from wfinterop.lease import DEFAULT_LEASE_TTL
+from wfinterop.lease import get_worker_id, lease_active, new_lease
+from wfinterop import archive
+from wfinterop import journal
+from wfinterop import tracing
+from wfinterop.ids import id_timestamp, is_id, min_id, new_id
+from wfinterop.metrics import QUEUE_SECONDS
+from wfinterop.util import file_lock, get_json, save_json
+from wfinterop.util import to_seconds, to_timestamp
 
 logger = logging.getLogger(__name__)
 
@@ -15,11 +30,267 @@ submission_queue = os.path.join(os.path.dirname(__file__),
 if not os.path.exists(submission_queue):
     save_json(submission_queue, {})
 
+_index = {'stamp': None, 'queues': {}}
+_state = {'stamp': None, 'submissions': None, 'pending': 0, 'end': 0}
+# notified when this process appends to the journal
+_changed = threading.Condition()
+
+# batches smaller than this are validated in the calling process
+PARALLEL_VALIDATION_MIN = 256
+
+# finished submissions older than this (seconds) are archived
+ARCHIVE_AFTER = 30 * 24 * 3600
+
+# if True, changes are appended to the event journal (see
+# wfinterop.journal) and the queue file is only rewritten as a snapshot
+# every SNAPSHOT_EVERY events
+use_journal = False
+SNAPSHOT_EVERY = 1000
+
 
 def create_queue():
     pass
 
 
+@contextmanager
+def queue_lock():
+    """
+    Hold an exclusive lock on the submission queue file so that
+    read-modify-write cycles from several workers do not interleave.
+    """
+    with file_lock(submission_queue):
+        yield
+
+
+def journal_path():
+    """
+    Return the event journal file, next to the submission queue file.
+    """
+    return os.path.splitext(submission_queue)[0] + '.journal.jsonl'
+
+
+def _read_state():
+    """
+    Return the queue document, i.e., the queue file with any journal
+    events appended after it was last written replayed on top, the
+    number of replayed events and the journal offset after them.
+    """
+    path = journal_path()
+    # read the offset before the snapshot: a snapshot written in between
+    # only means replaying events it already includes
+    offset = journal.read_offset(path)
+    submissions = get_json(submission_queue)
+    if journal.size(path) <= offset:
+        return submissions, 0, offset
+    records, end = journal.read(path, offset)
+    for record in records:
+        journal.apply_event(submissions, record)
+    return submissions, len(records), end
+
+
+def _load():
+    return _read_state()[0]
+
+
+def _snapshot_stamp():
+    stat = os.stat(submission_queue)
+    return (submission_queue, stat.st_mtime_ns, stat.st_size,
+            journal.read_offset(journal_path()))
+
+
+def _locked_state():
+    """
+    Return the queue document for a change made while holding
+    :func:`queue_lock`. With the journal, the document is kept between
+    calls and only events appended since (e.g., by other workers) are
+    replayed, so a change costs an append rather than a full read.
+    """
+    if not use_journal:
+        return _read_state()[0]
+    stamp = _snapshot_stamp()
+    if _state['stamp'] != stamp:
+        submissions, pending, end = _read_state()
+        _state.update(stamp=stamp, submissions=submissions,
+                      pending=pending, end=end)
+    else:
+        records, end = journal.read(journal_path(), _state['end'])
+        for record in records:
+            journal.apply_event(_state['submissions'], record)
+        _state.update(pending=_state['pending'] + len(records), end=end)
+    return _state['submissions']
+
+
+def _snapshot(submissions):
+    path = journal_path()
+    end = journal.size(path)
+    save_json(submission_queue, submissions)
+    if end:
+        journal.write_offset(path, end)
+
+
+def _save(submissions, events):
+    """
+    Persist changes made while holding :func:`queue_lock`: append the
+    events to the journal, if enabled, or rewrite the queue file. With
+    the journal, the queue file is rewritten as a snapshot every
+    ``SNAPSHOT_EVERY`` events.
+
+    :param dict submissions: Changed queue document.
+    :param list events: Journal events describing the changes.
+    """
+    if not use_journal:
+        _snapshot(submissions)
+        return
+    try:
+        journal.append(journal_path(), events)
+    except Exception:
+        # the kept document may not match what was written
+        _state['stamp'] = None
+        raise
+    with _changed:
+        _changed.notify_all()
+    # the kept document still holds the callers' objects; the next change
+    # replays these events from the journal to replace them with copies
+    if _state['pending'] + len(events) >= SNAPSHOT_EVERY:
+        _snapshot(submissions)
+        _state['stamp'] = None
+
+
+@tracing.traced('compact')
+@QUEUE_SECONDS.time(backend='local', operation='compact')
+def compact():
+    """
+    Write the current state to the queue file, so that later reads do
+    not replay the journal. Call this before turning off ``use_journal``
+    or handing the queue file to other tools; the journal itself is kept
+    as an audit trail.
+    """
+    with queue_lock():
+        _snapshot(_locked_state())
+        _state['stamp'] = None
+
+
+def get_history(queue_id=None, submission_id=None):
+    """
+    Return the journal events of a queue or submission, oldest first.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param str submission_id:
+    :return: generator of event dicts (see :mod:`wfinterop.journal`)
+    """
+    return journal.history(journal_path(), queue_id, submission_id)
+
+
+def changes_cursor():
+    """
+    Return a cursor for :func:`get_changes` marking the current end of
+    the change feed, to follow only changes made from now on.
+    """
+    return journal.size(journal_path())
+
+
+def _change(record, cursor):
+    if record['type'] == 'created':
+        state = journal.state(record.get('fields'))
+        transition = journal.transition((None, None), state)
+    elif record['type'] == 'removed':
+        transition = {'status': None, 'run_status': None}
+    else:
+        transition = record.get('transition')
+        if transition is None:
+            return None
+    change = {'cursor': cursor,
+              'type': record['type'],
+              'time': record['time'],
+              'queue_id': record['queue_id'],
+              'submission_id': record['submission_id']}
+    change.update(transition)
+    return change
+
+
+def _read_changes(cursor, queue_id, limit):
+    changes = []
+    for record, end in journal.follow(journal_path(), cursor):
+        cursor = end
+        if queue_id is not None and record['queue_id'] != queue_id:
+            continue
+        change = _change(record, end)
+        if change is not None:
+            changes.append(change)
+            if limit is not None and len(changes) >= limit:
+                break
+    return changes, cursor
+
+
+def get_changes(cursor=0, queue_id=None, timeout=0, limit=None,
+                poll_interval=1.0):
+    """
+    Return the state transitions recorded after a cursor: submissions
+    created, changes of a submission's status or of its run's state, and
+    submissions removed from the live queue (e.g., archived). Changes are
+    read from the event journal, so the feed needs ``use_journal`` on
+    (a ValueError is raised otherwise). If there are none yet, wait up to
+    ``timeout`` seconds for one; changes made by this process wake the
+    wait at once, other workers' changes are noticed by polling.
+
+    Each change is a dict with 'cursor', 'type' ('created', 'updated' or
+    'removed'), 'time', 'queue_id', 'submission_id', 'status' and
+    'run_status' keys, plus 'previous_status' and 'previous_run_status'
+    for transitions of existing submissions.
+
+    :param int cursor: Position in the feed: 0 for the start, the
+        returned cursor of the previous call, or :func:`changes_cursor`.
+    :param str queue_id: Only return changes to this queue.
+    :param float timeout: Seconds to wait for a change; None waits
+        indefinitely.
+    :param int limit: Maximum number of changes to return.
+    :param float poll_interval: Seconds between checks for changes by
+        other processes.
+    :return: tuple of the list of changes and the cursor to pass next
+    """
+    if not use_journal:
+        raise ValueError("The change feed is read from the event journal; "
+                         "turn on use_journal (--journal) to record it")
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        changes, cursor = _read_changes(cursor, queue_id, limit)
+        if changes:
+            return changes, cursor
+        remaining = (poll_interval if deadline is None
+                     else deadline - time.time())
+        if remaining <= 0:
+            return changes, cursor
+        with _changed:
+            _changed.wait(min(poll_interval, remaining))
+
+
+def watch_changes(cursor=None, queue_id=None, timeout=None,
+                  poll_interval=1.0):
+    """
+    Yield state transitions as they happen (see :func:`get_changes`).
+
+    :param int cursor: Position in the feed to start from; defaults to
+        the current end, so only new changes are produced.
+    :param str queue_id: Only produce changes to this queue.
+    :param float timeout: Stop once no change arrives for this many
+        seconds; None watches indefinitely.
+    :param float poll_interval: Seconds between checks for changes by
+        other processes.
+    :return: generator of change dicts; each holds the cursor to resume
+        after it
+    :raises ValueError: if ``use_journal`` is off
+    """
+    cursor = changes_cursor() if cursor is None else cursor
+    while True:
+        changes, cursor = get_changes(cursor, queue_id, timeout=timeout,
+                                      poll_interval=poll_interval)
+        if not changes:
+            return
+        yield from changes
+
+
+@tracing.traced('create_submission', 'queue_id')
+@QUEUE_SECONDS.time(backend='local', operation='create_submission')
 def create_submission(queue_id, submission_data, wes_id=None):
     """
     Submit a new job request to an evaluation queue.
@@ -30,19 +301,153 @@ def create_submission(queue_id, submission_data, wes_id=None):
     :param dict submission_data:
     :param str wes_id:
     """
-    submissions = get_json(submission_queue)
-    submission_id = dt.datetime.now().strftime('%d%m%d%H%M%S%f')
+    with queue_lock():
+        submissions = _locked_state()
+        submission_id = new_id()
 
-    submission = {'status': 'RECEIVED',
-                  'data': submission_data,
-                  'wes_id': wes_id}
-    submissions.setdefault(queue_id, {})[submission_id] = submission
-    save_json(submission_queue, submissions)
+        submission = {'status': 'RECEIVED',
+                      'data': submission_data,
+                      'wes_id': wes_id}
+        submissions.setdefault(queue_id, {})[submission_id] = submission
+        _save(submissions,
+              [journal.event('created', queue_id, submission_id, submission)])
     logger.info(" Queueing job for '{}' endpoint:"
                 "\n - submission ID: {}".format(wes_id, submission_id))
     return submission_id
 
 
+def check_submission_data(submission_data):
+    """
+    Check that submission data can be run: workflow parameters given as
+    a dict, or the path or URL of a parameters file. Local files must
+    exist and contain a JSON or YAML mapping; remote URLs are not fetched.
+
+    :param submission_data: Workflow parameters, or a path/URL to them.
+    :return: None if valid, otherwise a message describing the problem
+    """
+    if isinstance(submission_data, dict):
+        return None
+    if not isinstance(submission_data, str):
+        return "Unsupported submission data: {!r}".format(submission_data)
+    path = submission_data
+    if path.startswith('file://'):
+        path = path[7:]
+    elif ':' in path:
+        return None
+    try:
+        with open(path) as f:
+            # JSON parses much faster than YAML and is the common case
+            params = (json.load(f) if path.endswith('.json')
+                      else yaml.safe_load(f))
+    except (IOError, ValueError, yaml.YAMLError) as err:
+        return "{}: {}".format(submission_data, err)
+    if not isinstance(params, dict):
+        return "{}: parameters must be a mapping".format(submission_data)
+    return None
+
+
+def params_url(path, base_dir=None):
+    """
+    Return the URL to store for a parameters file: local paths become
+    absolute 'file://' URLs (relative to ``base_dir``, if given); URLs
+    are returned unchanged.
+    """
+    if ':' in path and not path.startswith('file://'):
+        return path
+    path = path[7:] if path.startswith('file://') else path
+    if base_dir is not None:
+        path = os.path.join(base_dir, path)
+    return 'file://' + os.path.abspath(path)
+
+
+def read_manifest(manifest_path):
+    """
+    Stream submissions from a JSON Lines manifest. Each line is either a
+    path or URL to a parameters file (relative paths are resolved against
+    the manifest's folder), an object with 'data' and optional 'wes_id'
+    keys, or an object holding the workflow parameters themselves.
+
+    :param str manifest_path: Path to the manifest.
+    :return: generator of ``(submission_data, wes_id)`` tuples
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            wes_id = None
+            if isinstance(entry, dict) and 'data' in entry:
+                entry, wes_id = entry['data'], entry.get('wes_id')
+            if isinstance(entry, str):
+                entry = params_url(entry, base_dir)
+            yield entry, wes_id
+
+
+def _check_all(submissions_data, processes=None):
+    if len(submissions_data) < PARALLEL_VALIDATION_MIN:
+        return [check_submission_data(data) for data in submissions_data]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        chunksize = max(1, len(submissions_data)
+                        // (4 * (processes or os.cpu_count() or 1)))
+        return list(pool.map(check_submission_data, submissions_data,
+                             chunksize=chunksize))
+
+
+@tracing.traced('create_submissions', 'queue_id')
+@QUEUE_SECONDS.time(backend='local', operation='create_submissions')
+def create_submissions(queue_id, submissions_data, wes_id=None,
+                       validate=True, processes=None):
+    """
+    Submit many job requests to an evaluation queue in one write. If any
+    submission is invalid, none are queued.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param submissions_data: Iterable of submission data (see
+        :func:`check_submission_data`), or of ``(submission_data, wes_id)``
+        tuples to set the WES per submission.
+    :param str wes_id: WES for submissions without their own.
+    :param bool validate: If True, check every submission first (in
+        parallel, for large batches).
+    :param int processes: Number of validation processes.
+    :return: list of new submission IDs, in input order
+    """
+    items = [(item[0], item[1] or wes_id) if isinstance(item, tuple)
+             else (item, wes_id)
+             for item in submissions_data]
+    if validate:
+        errors = [(i, error) for i, error in enumerate(
+                      _check_all([data for data, _ in items], processes))
+                  if error is not None]
+        if errors:
+            raise ValueError(
+                "{} of {} submissions are invalid; none were queued:\n{}"
+                .format(len(errors), len(items),
+                        "\n".join(" - item {}: {}".format(i, error)
+                                  for i, error in errors[:10]))
+            )
+    with queue_lock():
+        submissions = _locked_state()
+        queue_submissions = submissions.setdefault(queue_id, {})
+        submission_ids = []
+        events = []
+        for data, item_wes_id in items:
+            submission_id = new_id()
+            submission = {'status': 'RECEIVED',
+                          'data': data,
+                          'wes_id': item_wes_id}
+            queue_submissions[submission_id] = submission
+            submission_ids.append(submission_id)
+            events.append(journal.event('created', queue_id, submission_id,
+                                        submission))
+        _save(submissions, events)
+    logger.info(" Queued {} jobs for queue '{}'"
+                .format(len(submission_ids), queue_id))
+    return submission_ids
+
+
+@tracing.traced('get_submissions', 'queue_id')
+@QUEUE_SECONDS.time(backend='local', operation='get_submissions')
 def get_submissions(queue_id,
                     status=['RECEIVED', 'SUBMITTED', 'VALIDATED', 'COMPLETE'],
                     exclude_status=[]):
@@ -53,7 +458,7 @@ def get_submissions(queue_id,
     :param list status:
     :param list exclude_status:
     """
-    submissions = get_json(submission_queue)
+    submissions = _load()
     if len(exclude_status):
         status = [s for s in status if s not in exclude_status]
     try:
@@ -63,16 +468,28 @@ def get_submissions(queue_id,
         return []
 
 
+@tracing.traced('get_submission_bundle', 'queue_id', 'submission_id')
+@QUEUE_SECONDS.time(backend='local', operation='get_submission_bundle')
 def get_submission_bundle(queue_id, submission_id):
     """
     Return the submission's info.
 
+    Submissions moved to the archive are looked up there.
+
     :param str queue_id:
     :param str submission_id:
     """
-    return get_json(submission_queue)[queue_id][submission_id]
+    try:
+        return _load()[queue_id][submission_id]
+    except KeyError:
+        bundle = archive.find_submission(archive_dir(), queue_id,
+                                         submission_id)
+        if bundle is None:
+            raise
+        return bundle
 
 
+@tracing.traced('update_submission', 'queue_id', 'submission_id', 'param')
 def update_submission(queue_id, submission_id, param, value):
     """
     Update the status of a submission.
@@ -82,6 +499,346 @@ def update_submission(queue_id, submission_id, param, value):
     :param str param:
     :param str value:
     """
-    submissions = get_json(submission_queue)
-    submissions[queue_id][submission_id][param] = value
-    save_json(submission_queue, submissions)
+    apply_updates([(queue_id, submission_id, {param: value})])
+
+
+@tracing.traced('update_submission_fields', 'queue_id', 'submission_id')
+def update_submission_fields(queue_id, submission_id, **fields):
+    """
+    Update any number of fields of a submission in one write.
+
+    :param str queue_id:
+    :param str submission_id:
+    :param fields: Field names and new values (e.g., ``status``,
+        ``run_log``).
+    """
+    apply_updates([(queue_id, submission_id, fields)])
+
+
+@tracing.traced('apply_updates')
+@QUEUE_SECONDS.time(backend='local', operation='apply_updates')
+def apply_updates(updates):
+    """
+    Apply field updates to many submissions in one read-modify-write of
+    the queue. Updates are applied in order, so later updates to the same
+    field win. If a submission does not exist, nothing is written.
+
+    :param list updates: ``(queue_id, submission_id, fields)`` tuples,
+        where ``fields`` is a dict of field names and new values.
+    """
+    updates = list(updates)
+    if not updates:
+        return
+    with queue_lock():
+        submissions = _locked_state()
+        bundles = [submissions[queue_id][submission_id]
+                   for queue_id, submission_id, _ in updates]
+        events = []
+        for bundle, (queue_id, submission_id, fields) in zip(bundles,
+                                                             updates):
+            before = journal.state(bundle)
+            bundle.update(fields)
+            events.append(journal.event(
+                'updated', queue_id, submission_id, fields,
+                transition=journal.transition(before, journal.state(bundle))
+            ))
+        _save(submissions, events)
+
+
+@tracing.traced('claim_submission', 'queue_id', 'submission_id')
+@QUEUE_SECONDS.time(backend='local', operation='claim_submission')
+def claim_submission(queue_id, submission_id, worker_id=None,
+                     ttl=DEFAULT_LEASE_TTL, status=['RECEIVED']):
+    """
+    Take a lease on a submission so that no other worker dispatches it.
+    A lease held by another worker blocks the claim until it expires.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param str submission_id:
+    :param str worker_id: String identifying the claiming worker; defaults
+        to the current host and process.
+    :param float ttl: Seconds until the lease expires unless renewed.
+    :param list status: Submission statuses that may be claimed.
+    :return: the new lease, or None if the submission was not claimed
+    """
+    worker_id = get_worker_id() if worker_id is None else worker_id
+    with queue_lock():
+        submissions = _locked_state()
+        bundle = submissions[queue_id][submission_id]
+        lease = bundle.get('lease')
+        if bundle['status'] not in status:
+            return None
+        if lease_active(lease) and lease['owner'] != worker_id:
+            return None
+        if lease is not None and lease['owner'] != worker_id:
+            logger.info(" Reclaiming submission {} from expired lease "
+                        "held by '{}'".format(submission_id, lease['owner']))
+        bundle['lease'] = new_lease(worker_id, ttl)
+        _save(submissions,
+              [journal.event('updated', queue_id, submission_id,
+                             {'lease': bundle['lease']})])
+    return bundle['lease']
+
+
+@tracing.traced('renew_lease', 'queue_id', 'submission_id')
+@QUEUE_SECONDS.time(backend='local', operation='renew_lease')
+def renew_lease(queue_id, submission_id, worker_id=None,
+                ttl=DEFAULT_LEASE_TTL):
+    """
+    Extend a lease held by this worker.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param str submission_id:
+    :param str worker_id: String identifying the worker holding the lease.
+    :param float ttl: Seconds from now until the lease expires.
+    :return: True if the lease was renewed, False if it is held by
+        another worker or no longer exists
+    """
+    worker_id = get_worker_id() if worker_id is None else worker_id
+    with queue_lock():
+        submissions = _locked_state()
+        bundle = submissions[queue_id][submission_id]
+        lease = bundle.get('lease')
+        if lease is None or lease['owner'] != worker_id:
+            return False
+        bundle['lease'] = new_lease(worker_id, ttl)
+        _save(submissions,
+              [journal.event('updated', queue_id, submission_id,
+                             {'lease': bundle['lease']})])
+    return True
+
+
+@tracing.traced('release_submission', 'queue_id', 'submission_id')
+@QUEUE_SECONDS.time(backend='local', operation='release_submission')
+def release_submission(queue_id, submission_id, worker_id=None):
+    """
+    Give up a lease held by this worker.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param str submission_id:
+    :param str worker_id: String identifying the worker holding the lease.
+    :return: True if a lease was released
+    """
+    worker_id = get_worker_id() if worker_id is None else worker_id
+    with queue_lock():
+        submissions = _locked_state()
+        bundle = submissions[queue_id][submission_id]
+        lease = bundle.get('lease')
+        if lease is None or lease['owner'] != worker_id:
+            return False
+        del bundle['lease']
+        _save(submissions,
+              [journal.event('updated', queue_id, submission_id,
+                             unset=['lease'])])
+    return True
+
+
+@QUEUE_SECONDS.time(backend='local', operation='find_run')
+def find_run(fingerprint, wes_id, status='COMPLETE'):
+    """
+    Find a submission in any queue whose run had the given request
+    fingerprint on the given WES. Runs record the WES they were sent to;
+    for older runs, the submission's WES is used.
+
+    :param str fingerprint: Request fingerprint recorded in the run log.
+    :param str wes_id: String identifying the workflow service.
+    :param str status: Run state the prior run must have reached.
+    :return: tuple of queue ID, submission ID and run log, or None
+    """
+    submissions = _load()
+    for queue_id, queue_submissions in submissions.items():
+        for submission_id, bundle in queue_submissions.items():
+            run_log = bundle.get('run_log') or {}
+            if (run_log.get('fingerprint') == fingerprint
+                    and run_log.get('wes_id', bundle.get('wes_id')) == wes_id
+                    and run_log.get('status') == status):
+                return queue_id, submission_id, run_log
+    return None
+
+
+def _queue_index(queue_id):
+    """
+    Return the sorted submission IDs of a queue, each ID's position in
+    that order, and the sorted IDs not created by
+    :func:`wfinterop.ids.new_id` (i.e., legacy IDs, which carry no
+    creation time). The index is rebuilt only when the queue changes.
+    """
+    stat = os.stat(submission_queue)
+    stamp = (submission_queue, stat.st_mtime_ns, stat.st_size,
+             journal.size(journal_path()))
+    if _index['stamp'] != stamp:
+        # read after stat, so a write in between only forces a rebuild
+        submissions = _load()
+        queues = {}
+        for index_queue_id, queue_submissions in submissions.items():
+            ids = sorted(sub_id for sub_id in queue_submissions
+                         if is_id(sub_id))
+            legacy_ids = sorted(sub_id for sub_id in queue_submissions
+                                if not is_id(sub_id))
+            queues[index_queue_id] = (ids, {sub_id: position for position,
+                                            sub_id in enumerate(ids)},
+                                      legacy_ids)
+        _index.update(stamp=stamp, queues=queues)
+    return _index['queues'].get(queue_id, ([], {}, []))
+
+
+@QUEUE_SECONDS.time(backend='local', operation='get_submissions_since')
+def get_submissions_since(queue_id, since, status=None):
+    """
+    Return IDs of submissions created after a point in time, oldest
+    first.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param since: Submission ID (only later submissions are returned) or
+        epoch seconds (submissions created at or after that time).
+    :param list status: Only return submissions with these statuses.
+    """
+    ids, positions, _ = _queue_index(queue_id)
+    if isinstance(since, str):
+        start = positions.get(since)
+        start = (bisect.bisect_right(ids, since) if start is None
+                 else start + 1)
+    else:
+        start = bisect.bisect_left(ids, min_id(since))
+    ids = ids[start:]
+    if status is not None:
+        queue_submissions = _load().get(queue_id, {})
+        ids = [sub_id for sub_id in ids
+               if queue_submissions.get(sub_id, {}).get('status') in status]
+    return ids
+
+
+def query_submissions(queue_id, status=None, wes_id=None, since=None,
+                      until=None, cursor=None, offset=0, limit=None):
+    """
+    Iterate over the submissions of a queue that match all of the given
+    filters, oldest first (legacy IDs, which carry no creation time, come
+    last in ID order). Submissions are produced one at a time, so large
+    queues can be paged through without building lists, e.g.:
+
+        page = list(query_submissions(queue_id, status={'RECEIVED'},
+                                      cursor=last_id, limit=100))
+        last_id = page[-1][0] if page else last_id
+
+    Paging bounds what the caller holds and the work done per page, not
+    the memory used to read it: the queue is a single JSON document, so
+    each call still loads all of it. Use :func:`archive_submissions` to
+    keep the live queue small. Archived submissions are not included.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param status: Status or collection of statuses to include.
+    :param str wes_id: Only include submissions for this WES.
+    :param float since: Only include submissions created at or after
+        this time (epoch seconds); excludes legacy IDs.
+    :param float until: Only include submissions created before this
+        time (epoch seconds); excludes legacy IDs.
+    :param str cursor: Submission ID to resume after, usually the last
+        one of the previous page.
+    :param int offset: Number of matching submissions to skip.
+    :param int limit: Maximum number of submissions to produce.
+    :return: generator of ``(submission_id, bundle)`` tuples
+    """
+    if isinstance(status, str):
+        status = {status}
+    ids, positions, legacy_ids = _queue_index(queue_id)
+    start = 0
+    if since is not None:
+        start = bisect.bisect_left(ids, min_id(since))
+    stop = len(ids)
+    if until is not None:
+        stop = bisect.bisect_left(ids, min_id(until))
+    if since is not None or until is not None:
+        legacy_ids = []
+    if cursor is not None:
+        if is_id(cursor):
+            start = max(start, bisect.bisect_right(ids, cursor))
+        else:
+            start = stop
+            legacy_ids = legacy_ids[bisect.bisect_right(legacy_ids,
+                                                        cursor):]
+    queue_submissions = _load().get(queue_id, {})
+    candidates = itertools.chain(itertools.islice(ids, start, stop),
+                                 legacy_ids)
+    matches = ((sub_id, queue_submissions[sub_id]) for sub_id in candidates
+               if sub_id in queue_submissions
+               and (status is None
+                    or queue_submissions[sub_id].get('status') in status)
+               and (wes_id is None
+                    or queue_submissions[sub_id].get('wes_id') == wes_id))
+    stop = None if limit is None else offset + limit
+    for sub_id, bundle in itertools.islice(matches, offset, stop):
+        yield sub_id, bundle
+
+
+def archive_dir():
+    """
+    Return the folder holding archived submissions, next to the
+    submission queue file.
+    """
+    return os.path.splitext(submission_queue)[0] + '_archive'
+
+
+def _finished_time(submission_id, bundle):
+    """
+    Return when a submission's run finished in epoch seconds, falling
+    back to when the run started or the submission was created, or None
+    if unknown.
+    """
+    run_log = bundle.get('run_log') or {}
+    try:
+        start = to_timestamp(run_log.get('start_time'))
+    except ValueError:
+        start = None
+    if start is not None:
+        return start + to_seconds(run_log.get('elapsed_time'))
+    return id_timestamp(submission_id)
+
+
+@tracing.traced('archive_submissions', 'queue_id')
+@QUEUE_SECONDS.time(backend='local', operation='archive_submissions')
+def archive_submissions(queue_id=None, max_age=None, now=None):
+    """
+    Move finished submissions older than ``max_age`` out of the live
+    queue into archive segments (see :mod:`wfinterop.archive`). Archived
+    submissions are still returned by :func:`get_submission_bundle`, but
+    no longer by :func:`get_submissions`. Submissions that are leased, or
+    whose age cannot be told, stay in the live queue.
+
+    :param str queue_id: Queue to archive; defaults to all queues.
+    :param float max_age: Seconds since a submission finished before it
+        is archived; defaults to ``ARCHIVE_AFTER``.
+    :param float now: Current time in epoch seconds, for testing.
+    :return: dict mapping queue IDs to the number of archived submissions
+    """
+    max_age = ARCHIVE_AFTER if max_age is None else max_age
+    cutoff = (time.time() if now is None else now) - max_age
+    archived = {}
+    with queue_lock():
+        submissions = _locked_state()
+        queue_ids = list(submissions) if queue_id is None else [queue_id]
+        events = []
+        for archive_queue_id in queue_ids:
+            queue_submissions = submissions.get(archive_queue_id, {})
+            old = []
+            for submission_id, bundle in queue_submissions.items():
+                finished = _finished_time(submission_id, bundle)
+                if (archive.is_terminal(bundle)
+                        and 'lease' not in bundle
+                        and finished is not None and finished < cutoff):
+                    old.append((submission_id, bundle))
+            if not old:
+                continue
+            # segments are written before the live queue shrinks, so a
+            # failure in between leaves duplicates rather than losses
+            archive.write_segments(archive_dir(), archive_queue_id, old)
+            for submission_id, _ in old:
+                del queue_submissions[submission_id]
+                events.append(journal.event('removed', archive_queue_id,
+                                            submission_id))
+            archived[archive_queue_id] = len(old)
+        if archived:
+            _save(submissions, events)
+    for archive_queue_id, count in archived.items():
+        logger.info(" Archived {} submissions from queue '{}'"
+                    .format(count, archive_queue_id))
+    return archived
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Optional process pool for preparing WES run requests. Building a request
+(packing CWL with cwltool, parsing WDL, resolving parameter paths) is
+CPU-bound and holds the GIL, so it is moved into worker processes. Workers
+return the multipart parts as plain descriptors, i.e., ``(name, value)``
+or ``(name, (filename, text))`` tuples, which are cheap to pickle and are
+turned back into file-like parts in the parent. The pool is kept alive
+between submissions and each worker memoizes descriptor packing and WDL
+input parsing, so repeated submissions of the same workflow skip that
+work.
+"""
+import functools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+
+from wfinterop import trs2wes
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+def freeze_parts(parts):
+    """
+    Convert request parts into picklable descriptors.
+
+    Args:
+        parts (:obj:`list` of :obj:`tuple`): parts as returned by
+            :func:`wfinterop.trs2wes.build_wes_request`
+
+    Returns:
+        list: parts with file-like values replaced by their text
+    """
+    frozen = []
+    for name, value in parts:
+        if isinstance(value, tuple):
+            filename, f = value
+            value = (filename, f.getvalue() if hasattr(f, 'getvalue')
+                     else f.read())
+        frozen.append((name, value))
+    return frozen
+
+
+def thaw_parts(descriptors):
+    """
+    Convert descriptors from :func:`freeze_parts` back into request
+    parts.
+    """
+    return [(name, (value[0], StringIO(value[1]))
+             if isinstance(value, (tuple, list)) else value)
+            for name, value in descriptors]
+
+
+def _local_mtime(path):
+    path = path[7:] if path.startswith('file://') else path
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _init_worker(cache_size):
+    """
+    Install per-process caches in front of the expensive steps of
+    :func:`wfinterop.trs2wes.build_wes_request`.
+    """
+    get_packed_cwl = trs2wes.get_packed_cwl
+    # local descriptors are keyed by mtime so edits are picked up
+    packed_cwl = functools.lru_cache(maxsize=cache_size)(
+        lambda workflow_url, mtime: get_packed_cwl(workflow_url)
+    )
+    trs2wes.get_packed_cwl = (
+        lambda workflow_url: packed_cwl(workflow_url,
+                                        _local_mtime(workflow_url))
+    )
+    trs2wes.get_wdl_inputs = functools.lru_cache(maxsize=cache_size)(
+        trs2wes.get_wdl_inputs
+    )
+
+
+def _prepare(build_kwargs):
+    return freeze_parts(trs2wes.build_wes_request(**build_kwargs))
+
+
+class RequestPool(object):
+    """
+    Prepare WES request parts in worker processes.
+
+    Args:
+        processes (int): number of worker processes; defaults to the
+            number of CPUs
+        cache_size (int): workflows remembered by each worker
+    """
+    def __init__(self, processes=None, cache_size=128):
+        self.processes = processes
+        self._executor = ProcessPoolExecutor(max_workers=processes,
+                                             initializer=_init_worker,
+                                             initargs=(cache_size,))
+
+    def prepare(self, **build_kwargs):
+        """
+        Schedule :func:`wfinterop.trs2wes.build_wes_request` in a worker.
+
+        Returns:
+            :class:`concurrent.futures.Future`: future resolving to part
+            descriptors; pass them through :func:`thaw_parts` before use
+        """
+        return self._executor.submit(_prepare, build_kwargs)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def get_request_pool(processes=None):
+    """
+    Return the shared request pool, starting it on first use. The pool
+    is restarted if a different number of processes is requested.
+    """
+    global _pool
+    if _pool is not None and _pool.processes != processes:
+        _pool.shutdown()
+        _pool = None
+    if _pool is None:
+        logger.info("Starting request preparation pool ({} processes)"
+                    .format(processes or os.cpu_count()))
+        _pool = RequestPool(processes=processes)
+    return _pool
+
+
+def shutdown_request_pool():
+    """Stop the shared request pool, if running."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+"""
+Columnar table of run states for monitor loops. Each submission is one
+row; its state, WES, queue, start time and elapsed time are stored in
+NumPy arrays and updated in place as monitor sweeps report changes, so
+summaries (counts per state or WES, elapsed-time percentiles) are
+computed with vectorized operations rather than by rebuilding a
+DataFrame of every run log on every tick.
+"""
+import logging
+import time
+
+import numpy as np
+
+from wfinterop.util import convert_timedelta, to_timestamp
+
+logger = logging.getLogger(__name__)
+
+STATES = ['UNKNOWN', 'PENDING', 'RECEIVED', 'QUEUED', 'INITIALIZING',
+          'RUNNING', 'PAUSED', 'CANCELING', 'COMPLETE', 'VALIDATED',
+          'EXECUTOR_ERROR', 'SYSTEM_ERROR', 'CANCELED', 'CANCELLED',
+          'FAILED']
+TERMINAL_STATES = ['COMPLETE', 'VALIDATED', 'EXECUTOR_ERROR',
+                   'SYSTEM_ERROR', 'CANCELED', 'CANCELLED', 'FAILED']
+
+
+def _parse_start_time(start_time):
+    try:
+        timestamp = to_timestamp(start_time)
+    except (TypeError, ValueError):
+        return np.nan
+    return np.nan if timestamp is None else timestamp
+
+
+class _Labels(object):
+    """Map labels (state names, WES IDs, queue IDs) to small ints."""
+    __slots__ = ('labels', 'codes')
+
+    def __init__(self, labels=()):
+        self.labels = []
+        self.codes = {}
+        for label in labels:
+            self.code(label)
+
+    def code(self, label):
+        if label not in self.codes:
+            self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return self.codes[label]
+
+
+class RunTable(object):
+    """
+    Incrementally updated table of run states.
+
+    :param int capacity: Initial number of rows to allocate; the table
+        grows as needed.
+    """
+    def __init__(self, capacity=1024):
+        self.states = _Labels(STATES)
+        self.services = _Labels([None])
+        self.queues = _Labels()
+        self._terminal = np.zeros(len(STATES), dtype=bool)
+        self._terminal[[self.states.code(s) for s in TERMINAL_STATES]] = True
+        self._rows = {}
+        self._size = 0
+        self.status = np.zeros(capacity, dtype=np.int16)
+        self.wes = np.zeros(capacity, dtype=np.int32)
+        self.queue = np.zeros(capacity, dtype=np.int32)
+        self.start = np.full(capacity, np.nan)
+        self.end = np.full(capacity, np.nan)
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self):
+        capacity = len(self.status) * 2
+        for name, fill in [('status', 0), ('wes', 0), ('queue', 0),
+                           ('start', np.nan), ('end', np.nan)]:
+            column = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _row(self, queue_id, submission_id):
+        key = (queue_id, submission_id)
+        row = self._rows.get(key)
+        if row is None:
+            if self._size == len(self.status):
+                self._grow()
+            row = self._rows[key] = self._size
+            self.queue[row] = self.queues.code(queue_id)
+            self._size += 1
+        return row
+
+    def _state_code(self, state):
+        code = self.states.code(state)
+        if code >= len(self._terminal):
+            self._terminal = np.append(self._terminal, False)
+        return code
+
+    def update(self, queue_id, submission_id, status, wes_id=None,
+               start_time=None, now=None):
+        """
+        Record the latest state of a submission's run.
+
+        :param str queue_id: String identifying the workflow queue.
+        :param str submission_id:
+        :param str status: Run (or submission) state.
+        :param str wes_id: String identifying the workflow service.
+        :param start_time: Run start as epoch seconds (or a legacy ctime
+            string).
+        :param float now: Time of the observation; defaults to now.
+        """
+        row = self._row(queue_id, submission_id)
+        code = self._state_code(status)
+        self.status[row] = code
+        if wes_id is not None:
+            self.wes[row] = self.services.code(wes_id)
+        if start_time is not None and np.isnan(self.start[row]):
+            self.start[row] = _parse_start_time(start_time)
+        if self._terminal[code]:
+            if np.isnan(self.end[row]):
+                self.end[row] = time.time() if now is None else now
+        else:
+            self.end[row] = np.nan
+
+    def update_queue_log(self, queue_id, queue_log, now=None):
+        """
+        Record the output of a ``monitor_queue`` sweep.
+
+        :param str queue_id: String identifying the workflow queue.
+        :param dict queue_log: Submission IDs mapped to run logs.
+        """
+        now = time.time() if now is None else now
+        for submission_id, run_log in queue_log.items():
+            self.update(queue_id, submission_id,
+                        status=run_log.get('status') or 'UNKNOWN',
+                        wes_id=run_log.get('wes_id'),
+                        start_time=run_log.get('start_time'),
+                        now=now)
+
+    def _mask(self, queue_id=None):
+        if queue_id is None:
+            return np.ones(self._size, dtype=bool)
+        queue_ids = [queue_id] if isinstance(queue_id, str) else queue_id
+        codes = [self.queues.codes[q] for q in queue_ids
+                 if q in self.queues.codes]
+        return np.isin(self.queue[:self._size], codes)
+
+    def state_counts(self, queue_id=None):
+        """
+        Count runs in each state.
+
+        :param queue_id: Only count runs in this queue (or list of
+            queues).
+        :return: dict of state -> count (states with no runs omitted)
+        """
+        counts = np.bincount(self.status[:self._size][self._mask(queue_id)],
+                             minlength=len(self.states.labels))
+        return {self.states.labels[code]: int(n)
+                for code, n in enumerate(counts) if n}
+
+    def wes_state_counts(self, queue_id=None):
+        """
+        Count runs in each state on each WES.
+
+        :param str queue_id: Only count runs in this queue.
+        :return: dict of wes_id -> dict of state -> count
+        """
+        mask = self._mask(queue_id)
+        n_states = len(self.states.labels)
+        combined = (self.wes[:self._size][mask].astype(np.int64) * n_states
+                    + self.status[:self._size][mask])
+        counts = np.bincount(combined,
+                             minlength=len(self.services.labels) * n_states)
+        counts = counts.reshape(-1, n_states)
+        return {self.services.labels[wes]: {self.states.labels[code]: int(n)
+                                            for code, n in enumerate(row) if n}
+                for wes, row in enumerate(counts) if row.any()}
+
+    def elapsed(self, queue_id=None, now=None):
+        """
+        Seconds each run has been going (up to when it was first seen in
+        a terminal state); NaN where the start time is unknown.
+        """
+        now = time.time() if now is None else now
+        mask = self._mask(queue_id)
+        start = self.start[:self._size][mask]
+        end = self.end[:self._size][mask]
+        return np.where(np.isnan(end), now, end) - start
+
+    def elapsed_percentiles(self, percentiles=(50, 90, 99), queue_id=None,
+                            active=False, now=None):
+        """
+        Percentiles of elapsed run time in seconds.
+
+        :param tuple percentiles: Percentiles to compute.
+        :param str queue_id: Only include runs in this queue.
+        :param bool active: Only include runs not in a terminal state.
+        :return: dict of percentile -> seconds, or empty if no run has a
+            known start time
+        """
+        elapsed = self.elapsed(queue_id, now)
+        if active:
+            mask = self._mask(queue_id)
+            elapsed = elapsed[~self._terminal[self.status[:self._size][mask]]]
+        elapsed = elapsed[~np.isnan(elapsed)]
+        if not len(elapsed):
+            return {}
+        return dict(zip(percentiles,
+                        np.percentile(elapsed, percentiles).tolist()))
+
+    def all_terminal(self, queue_ids=None):
+        """
+        Return True if no run is still in progress.
+
+        :param list queue_ids: Only consider runs in these queues.
+        """
+        status = self.status[:self._size][self._mask(queue_ids)]
+        return bool(self._terminal[status].all())
+
+    def summary(self, queue_ids=None, now=None):
+        """
+        Format per-queue state counts and elapsed-time percentiles for
+        display.
+
+        :param list queue_ids: Queues to include; defaults to all.
+        """
+        lines = []
+        for queue_id in self.queues.labels:
+            if queue_ids is not None and queue_id not in queue_ids:
+                continue
+            counts = self.state_counts(queue_id)
+            if not counts:
+                continue
+            lines.append("\nWorkflow queue: {} ({} runs)"
+                         .format(queue_id, sum(counts.values())))
+            lines.append("  " + ", ".join("{}: {}".format(state, n)
+                                          for state, n in counts.items()))
+            for wes_id, wes_counts in self.wes_state_counts(queue_id).items():
+                if wes_id is not None:
+                    lines.append("  {}: {}".format(
+                        wes_id, ", ".join("{}: {}".format(state, n)
+                                          for state, n in wes_counts.items())
+                    ))
+            elapsed = self.elapsed_percentiles(queue_id=queue_id,
+                                               active=True, now=now)
+            if elapsed:
+                lines.append("  active elapsed: " + ", ".join(
+                    "p{}={}".format(p, convert_timedelta(v))
+                    for p, v in elapsed.items()
+                ))
+        return "\n".join(lines)
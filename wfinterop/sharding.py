@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+Spread workflow queues across several orchestrator worker processes.
+Queue IDs are placed on a consistent-hash ring of the live workers, so each
+queue is monitored by exactly one worker and, when a worker joins or
+leaves, only the queues on its arc of the ring move. Workers announce
+themselves by heartbeating into a membership file next to the submission
+queue; members whose heartbeat expires drop out of the ring on the next
+sweep, and the ring is rebuilt whenever membership changes. Each worker
+also records metrics about its shard in its membership entry so any
+worker can report on the whole pool.
+"""
+import bisect
+import hashlib
+import logging
+import os
+import time
+
+from wfinterop.lease import DEFAULT_LEASE_TTL
+from wfinterop.lease import get_worker_id, lease_active, new_lease
+from wfinterop.util import file_lock, get_json, save_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLICAS = 64
+
+membership_path = os.path.join(os.path.dirname(__file__), 'workers.json')
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """
+    Consistent-hash ring mapping keys onto a set of members.
+
+    Args:
+        members (list): strings identifying ring members
+        replicas (int): virtual nodes per member; more replicas give a
+            more even spread of keys
+    """
+    def __init__(self, members=(), replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self.members = sorted(set(members))
+        self._points = sorted(
+            (_hash('{}#{}'.format(member, i)), member)
+            for member in self.members
+            for i in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._points]
+
+    def owner(self, key):
+        """
+        Return the member responsible for ``key``, or None if the ring
+        is empty.
+        """
+        if not self._points:
+            return None
+        idx = bisect.bisect(self._hashes, _hash(key)) % len(self._points)
+        return self._points[idx][1]
+
+    def assign(self, keys):
+        """
+        Group keys by owner.
+
+        Returns:
+            dict: member -> list of keys (members owning no keys are
+            included with an empty list)
+        """
+        shards = {member: [] for member in self.members}
+        for key in keys:
+            owner = self.owner(key)
+            if owner is not None:
+                shards[owner].append(key)
+        return shards
+
+
+def _read_members():
+    if not os.path.exists(membership_path):
+        return {}
+    return get_json(membership_path)
+
+
+def join(worker_id=None, ttl=DEFAULT_LEASE_TTL, metrics=None):
+    """
+    Add or refresh a worker's entry in the membership file.
+
+    Args:
+        worker_id (str): worker identifier; defaults to
+            :func:`wfinterop.lease.get_worker_id`
+        ttl (float): seconds before the entry expires without another
+            heartbeat
+        metrics (dict): shard metrics to publish with the heartbeat
+
+    Returns:
+        dict: the worker's membership entry
+    """
+    worker_id = worker_id or get_worker_id()
+    with file_lock(membership_path):
+        members = _read_members()
+        entry = members.get(worker_id, {})
+        if not lease_active(entry):
+            logger.info("Worker '{}' joining shard ring".format(worker_id))
+            entry = {'joined': time.time()}
+        entry.update(new_lease(worker_id, ttl))
+        if metrics is not None:
+            entry['metrics'] = metrics
+        members[worker_id] = entry
+        # drop long-dead entries so the file does not grow without bound
+        cutoff = time.time() - 10 * ttl
+        members = {member_id: member for member_id, member in members.items()
+                   if float(member.get('expires') or 0) > cutoff}
+        save_json(membership_path, members)
+    return entry
+
+
+def leave(worker_id=None):
+    """
+    Remove a worker from the membership file, handing its queues to the
+    remaining workers on their next sweep.
+    """
+    worker_id = worker_id or get_worker_id()
+    with file_lock(membership_path):
+        members = _read_members()
+        if members.pop(worker_id, None) is not None:
+            logger.info("Worker '{}' leaving shard ring".format(worker_id))
+            save_json(membership_path, members)
+
+
+def get_members():
+    """
+    Return the workers with a live heartbeat. The membership file is read
+    under the same lock its writers hold, so other workers joining,
+    leaving or heartbeating never hand a reader a partial file.
+
+    Returns:
+        dict: worker_id -> membership entry
+    """
+    with file_lock(membership_path):
+        members = _read_members()
+    now = time.time()
+    return {worker_id: member for worker_id, member in members.items()
+            if lease_active(member, now)}
+
+
+def shard_metrics():
+    """
+    Collect the metrics published by each live worker.
+
+    Returns:
+        dict: worker_id -> metrics dict
+    """
+    return {worker_id: member.get('metrics', {})
+            for worker_id, member in get_members().items()}
+
+
+class ShardedWorker(object):
+    """
+    Track this worker's share of the queues across membership changes.
+
+    Call :meth:`heartbeat` once per sweep; it refreshes membership,
+    rebuilds the ring if workers joined or left, and returns the queue IDs
+    this worker should handle. Pass the sweep's results to
+    :meth:`record` so they are published with the next heartbeat.
+
+    Args:
+        worker_id (str): worker identifier; defaults to
+            :func:`wfinterop.lease.get_worker_id`
+        ttl (float): seconds before a silent worker is dropped from the
+            ring; should comfortably exceed the sweep interval
+        replicas (int): virtual nodes per worker on the ring
+    """
+    def __init__(self, worker_id=None, ttl=60, replicas=DEFAULT_REPLICAS):
+        self.worker_id = worker_id or get_worker_id()
+        self.ttl = ttl
+        self.replicas = replicas
+        self.ring = HashRing(replicas=replicas)
+        self.queues = []
+        self.metrics = {}
+
+    def heartbeat(self, queue_ids):
+        """
+        Refresh membership and return the queues owned by this worker.
+
+        Args:
+            queue_ids (list): every queue ID in the config
+
+        Returns:
+            list: queue IDs assigned to this worker
+        """
+        join(self.worker_id, ttl=self.ttl, metrics=self.metrics)
+        members = sorted(get_members())
+        if members != self.ring.members:
+            logger.info("Rebalancing {} queues across {} workers"
+                        .format(len(queue_ids), len(members)))
+            self.ring = HashRing(members, replicas=self.replicas)
+        queues = [queue_id for queue_id in queue_ids
+                  if self.ring.owner(queue_id) == self.worker_id]
+        if queues != self.queues:
+            logger.info("Worker '{}' now owns queues: {}"
+                        .format(self.worker_id, queues))
+            self.queues = queues
+        return queues
+
+    def record(self, statuses, duration):
+        """
+        Summarize a sweep over this worker's queues.
+
+        Args:
+            statuses (dict): queue_id -> queue log returned by
+                ``monitor_queue``
+            duration (float): seconds the sweep took
+        """
+        self.metrics = {
+            'queues': len(self.queues),
+            'submissions': sum(len(queue_log)
+                               for queue_log in statuses.values()),
+            'sweep_seconds': round(duration, 4),
+            'workers': len(self.ring.members),
+            'updated': time.time()
+        }
+
+    def leave(self):
+        leave(self.worker_id)
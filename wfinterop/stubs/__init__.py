@@ -0,0 +1,2 @@
+from .synapse import SynapseStub
+from .wes import WESStub
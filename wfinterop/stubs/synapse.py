@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+In-process stand-in for the parts of the Synapse evaluation API used by
+the Synapse orchestrator and queue. Submissions, statuses, etags and
+annotations are held in memory; every call is counted so benchmarks can
+report requests per submission, and 412/429 responses can be injected to
+exercise contention and throttling paths.
+"""
+import copy
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+import requests
+from synapseclient import Submission, SubmissionStatus
+from synapseclient.core.exceptions import SynapseHTTPError
+
+logger = logging.getLogger(__name__)
+
+
+def _http_error(status_code: int, reason: str) -> SynapseHTTPError:
+    """Build a :class:`SynapseHTTPError` carrying a real response object.
+
+    Args:
+        status_code: HTTP status code of the simulated response
+        reason: Message placed in the JSON body of the response
+
+    Returns:
+        Exception matching what synapseclient raises for the same code
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers['content-type'] = 'application/json'
+    response._content = json.dumps({'reason': reason}).encode('utf-8')
+    return SynapseHTTPError(reason, response=response)
+
+
+class SynapseStub(object):
+    """
+    Fake :class:`synapseclient.Synapse` connection backed by an in-memory
+    evaluation service.
+
+    Args:
+        latency: Seconds to sleep on every simulated request
+        conflict_rate: Probability that a status update is rejected with
+            412 because another writer changed the etag first
+        throttle_rate: Probability that any request is rejected with 429
+        page_size: Number of bundles returned per paginated request
+        retries: Number of times a throttled request is retried before
+            the 429 is raised to the caller
+        seed: Seed for the random number generator driving failures
+    """
+    def __init__(self, latency=0.0, conflict_rate=0.0, throttle_rate=0.0,
+                 page_size=20, retries=5, seed=None):
+        self.latency = latency
+        self.conflict_rate = conflict_rate
+        self.throttle_rate = throttle_rate
+        self.page_size = page_size
+        self.retries = retries
+        self.requests = Counter()
+        self.throttled = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._submissions = {}
+        self._statuses = {}
+        self._next_id = 9600000
+
+    def _request(self, method: str):
+        """
+        Record a request and apply the latency and throttling knobs.
+        Throttled requests are retried in place, as synapseclient does for
+        429 responses, and every rejected attempt is counted.
+        """
+        for _ in range(self.retries + 1):
+            with self._lock:
+                self.requests[method] += 1
+                throttled = self._random.random() < self.throttle_rate
+                if throttled:
+                    self.throttled[method] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            if not throttled:
+                return
+        raise _http_error(429, 'Too many requests.  Please slow down.')
+
+    def add_submission(self, evaluation, file_path='params.json',
+                       docker_repository=None, docker_digest=None,
+                       status='RECEIVED'):
+        """
+        Seed a submission directly into the store without counting it as
+        an API request.
+
+        Args:
+            evaluation: Evaluation queue id
+            file_path: Local path reported as the submission file
+            docker_repository: Docker repository name, for docker
+                submissions
+            docker_digest: Docker digest, for docker submissions
+            status: Initial submission status
+
+        Returns:
+            str: id of the new submission
+        """
+        with self._lock:
+            self._next_id += 1
+            submission_id = str(self._next_id)
+            sub = Submission(id=submission_id,
+                             evaluationId=str(evaluation),
+                             entityId='syn{}'.format(submission_id),
+                             versionNumber=1,
+                             createdOn=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                             filePath=file_path)
+            if docker_repository is not None:
+                sub['dockerRepositoryName'] = docker_repository
+                sub['dockerDigest'] = docker_digest
+            self._submissions[submission_id] = sub
+            self._statuses[submission_id] = {'id': submission_id,
+                                             'etag': str(uuid.uuid4()),
+                                             'status': status,
+                                             'annotations': {}}
+        return submission_id
+
+    def _submission_object(self, submission_id):
+        return Submission(**copy.deepcopy(
+            dict(self._submissions[submission_id])
+        ))
+
+    def _status_object(self, submission_id):
+        return SubmissionStatus(**copy.deepcopy(
+            self._statuses[submission_id]
+        ))
+
+    def submit(self, evaluation, entity, name=None, team=None):
+        """Submit an entity (``POST /evaluation/submission``)."""
+        self._request('submit')
+        entity_id = getattr(entity, 'id', entity)
+        submission_id = self.add_submission(
+            evaluation, file_path='{}.json'.format(entity_id)
+        )
+        with self._lock:
+            return self._submission_object(submission_id)
+
+    def getSubmission(self, id):
+        """Return a copy of the stored :class:`Submission`."""
+        self._request('getSubmission')
+        with self._lock:
+            return self._submission_object(str(id))
+
+    def getSubmissionStatus(self, submission):
+        """Return the current :class:`SubmissionStatus`, etag included."""
+        self._request('getSubmissionStatus')
+        submission_id = str(getattr(submission, 'id', submission))
+        with self._lock:
+            return self._status_object(submission_id)
+
+    def getSubmissionBundles(self, evaluation, status=None, myOwn=False,
+                             limit=None, offset=0):
+        """
+        Yield ``(Submission, SubmissionStatus)`` tuples using the same
+        offset pagination as the real client: one request per page and
+        a final request that returns an empty page.
+        """
+        limit = self.page_size if limit is None else limit
+        while True:
+            self._request('getSubmissionBundles')
+            with self._lock:
+                matches = [sub_id for sub_id, sub in self._submissions.items()
+                           if sub['evaluationId'] == str(evaluation) and
+                           (status is None or
+                            self._statuses[sub_id]['status'] == status)]
+                page = [(self._submission_object(sub_id),
+                         self._status_object(sub_id))
+                        for sub_id in matches[offset:offset + limit]]
+            if not page:
+                return
+            for bundle in page:
+                offset += 1
+                yield bundle
+
+    def store(self, obj):
+        """
+        Store a :class:`SubmissionStatus`. Stale etags are rejected with
+        412, mirroring Synapse's optimistic concurrency control.
+        """
+        self._request('store')
+        if not isinstance(obj, SubmissionStatus):
+            raise TypeError("SynapseStub can only store SubmissionStatus "
+                            "objects, got {}".format(type(obj).__name__))
+        with self._lock:
+            current = self._statuses[str(obj.id)]
+            if self._random.random() < self.conflict_rate:
+                current['etag'] = str(uuid.uuid4())
+            if obj.etag != current['etag']:
+                raise _http_error(412, 'Object has been updated since last '
+                                       'retrieval.')
+            current['status'] = obj.status
+            current['annotations'] = copy.deepcopy(
+                dict(obj.get('annotations', {}))
+            )
+            current['etag'] = str(uuid.uuid4())
+            return self._status_object(str(obj.id))
+
+    def reset_counts(self):
+        """Clear the request counters."""
+        with self._lock:
+            self.requests.clear()
+            self.throttled.clear()
+
+    def status_counts(self, evaluation=None):
+        """
+        Return the number of submissions in each status without counting
+        a request.
+        """
+        with self._lock:
+            return Counter(
+                status['status'] for sub_id, status in self._statuses.items()
+                if evaluation is None or
+                self._submissions[sub_id]['evaluationId'] == str(evaluation)
+            )
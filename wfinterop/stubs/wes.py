@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+"""
+Lightweight stand-in for a GA4GH Workflow Execution Service, serving the
+endpoints in the bundled swagger spec (service-info, runs, run log, run
+status and cancel) from memory over real HTTP. Runs do not execute
+anything; they move through QUEUED and RUNNING to a terminal state on a
+schedule drawn from configurable distributions, and latency and failures
+can be injected per request.
+
+The stub can also be started from the command line:
+
+    python -m wfinterop.stubs.wes --port 8080 --latency 0.05
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+BASE_PATH = '/ga4gh/wes/v1'
+
+_routes = [
+    ('GET', re.compile(r'^/service-info$'), 'GetServiceInfo'),
+    ('GET', re.compile(r'^/runs$'), 'ListRuns'),
+    ('POST', re.compile(r'^/runs$'), 'RunWorkflow'),
+    ('GET', re.compile(r'^/runs/(?P<run_id>[^/]+)$'), 'GetRunLog'),
+    ('GET', re.compile(r'^/runs/(?P<run_id>[^/]+)/status$'), 'GetRunStatus'),
+    ('POST', re.compile(r'^/runs/(?P<run_id>[^/]+)/cancel$'), 'CancelRun'),
+    ('GET',
+     re.compile(r'^/runs/(?P<run_id>[^/]+)/logs/(?P<stream>stdout|stderr)$'),
+     'GetRunStream'),
+]
+
+
+def _sampler(spec):
+    """
+    Turn a latency or duration setting into a function of a random
+    number generator.
+
+    Args:
+        spec: a number of seconds, a ``(low, high)`` tuple for a uniform
+            distribution, or a callable taking a :class:`random.Random`
+
+    Returns:
+        function: callable returning a number of seconds
+    """
+    if callable(spec):
+        return spec
+    if isinstance(spec, (tuple, list)):
+        low, high = spec
+        return lambda rng: rng.uniform(low, high)
+    return lambda rng: float(spec)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _WESRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        self.server.stub._handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.stub._handle(self, 'POST')
+
+    def send_json(self, status_code, body):
+        self.send_text(status_code, json.dumps(body), 'application/json')
+
+    def send_text(self, status_code, text, content_type='text/plain'):
+        payload = text.encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class WESStub(object):
+    """
+    In-memory WES server with injectable latency, failures and run
+    durations.
+
+    Args:
+        host: interface to bind
+        port: port to bind; 0 picks a free port
+        latency: seconds added to every request (number, ``(low, high)``
+            tuple or callable taking a :class:`random.Random`)
+        failure_rate: probability that any request fails with HTTP 500
+        queue_time: seconds a new run stays QUEUED (same forms as
+            ``latency``)
+        run_duration: seconds a run stays RUNNING before reaching a
+            terminal state (same forms as ``latency``)
+        error_rate: probability that a run finishes as EXECUTOR_ERROR
+            instead of COMPLETE
+        log_size: number of bytes served for each stdout/stderr log
+        ranges: whether log downloads honour HTTP Range headers
+        seed: seed for the random number generator
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0,
+                 failure_rate=0.0, queue_time=0.0, run_duration=0.0,
+                 error_rate=0.0, log_size=1024, ranges=True, seed=None):
+        self.latency = _sampler(latency)
+        self.failure_rate = failure_rate
+        self.queue_time = _sampler(queue_time)
+        self.run_duration = _sampler(run_duration)
+        self.error_rate = error_rate
+        self.log_size = log_size
+        self.ranges = ranges
+        self.requests = Counter()
+        self.runs = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer((host, port), _WESRequestHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def host(self):
+        """``host:port`` string, as stored in the WES config."""
+        host, port = self._server.server_address[:2]
+        return '{}:{}'.format(host, port)
+
+    @property
+    def url(self):
+        return 'http://{}{}'.format(self.host, BASE_PATH)
+
+    def config(self):
+        """
+        Return a service entry suitable for
+        :func:`wfinterop.config.add_workflowservice`.
+
+        Returns:
+            dict: dict with 'auth', 'host' and 'proto' keys
+        """
+        return {'auth': {'Authorization': ''},
+                'host': self.host,
+                'proto': 'http'}
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='wes-stub', daemon=True)
+        self._thread.start()
+        logger.info("WES stub listening on {}".format(self.url))
+        return self
+
+    def stop(self):
+        """Stop serving and release the port."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests.clear()
+
+    def state_counts(self):
+        """Return the number of runs in each state right now."""
+        now = time.time()
+        with self._lock:
+            return Counter(self._state(run, now) for run in self.runs.values())
+
+    def _state(self, run, now):
+        if run['canceled'] is not None:
+            return 'CANCELED'
+        elapsed = now - run['submitted']
+        if elapsed < run['queue_time']:
+            return 'QUEUED'
+        if elapsed < run['queue_time'] + run['duration']:
+            return 'RUNNING'
+        return run['outcome']
+
+    def _handle(self, handler, method):
+        url = urlparse(handler.path)
+        path = None
+        if url.path.startswith(BASE_PATH):
+            path = url.path[len(BASE_PATH):]
+        body = b''
+        length = int(handler.headers.get('Content-Length') or 0)
+        if length:
+            body = handler.rfile.read(length)
+
+        for route_method, pattern, operation in _routes:
+            match = pattern.match(path or '')
+            if route_method == method and match:
+                break
+        else:
+            handler.send_json(404, {'msg': 'Not found: {}'
+                                           .format(handler.path),
+                                    'status_code': 404})
+            return
+
+        with self._lock:
+            self.requests[operation] += 1
+            delay = self.latency(self._random)
+            failed = self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            handler.send_json(500, {'msg': 'Injected failure',
+                                    'status_code': 500})
+            return
+
+        kwargs = match.groupdict()
+        if 'run_id' in kwargs and kwargs['run_id'] not in self.runs:
+            handler.send_json(404, {'msg': 'Run not found: {}'
+                                           .format(kwargs['run_id']),
+                                    'status_code': 404})
+            return
+        getattr(self, '_' + operation)(handler, query=parse_qs(url.query),
+                                       body=body, **kwargs)
+
+    def _GetServiceInfo(self, handler, **kwargs):
+        handler.send_json(200, {
+            'workflow_type_versions': {
+                'CWL': {'workflow_type_version': ['v1.0']},
+                'WDL': {'workflow_type_version': ['draft-2', '1.0']}
+            },
+            'supported_wes_versions': ['0.3.0'],
+            'supported_filesystem_protocols': ['file', 'http', 'https'],
+            'workflow_engine_versions': {'wes-stub': '0.1'},
+            'default_workflow_engine_parameters': [],
+            'system_state_counts': dict(self.state_counts()),
+            'auth_instructions_url': '',
+            'tags': {}
+        })
+
+    def _ListRuns(self, handler, query, **kwargs):
+        page_size = int(query.get('page_size', [0])[0]) or len(self.runs)
+        offset = int(query.get('page_token', [0])[0] or 0)
+        now = time.time()
+        with self._lock:
+            run_ids = list(self.runs)[offset:offset + page_size]
+            runs = [{'run_id': run_id,
+                     'state': self._state(self.runs[run_id], now)}
+                    for run_id in run_ids]
+        next_token = offset + len(runs)
+        handler.send_json(200, {
+            'runs': runs,
+            'next_page_token': (str(next_token)
+                                if next_token < len(self.runs) else '')
+        })
+
+    def add_run(self, run_id=None, request=None):
+        """
+        Start a run as if it had just been submitted, e.g., to serve runs
+        already recorded in a submission queue.
+
+        Args:
+            run_id: ID of the run; a new one is generated if not given
+            request: summary of the request, served in the run log
+
+        Returns:
+            str: the run ID
+        """
+        with self._lock:
+            run_id = run_id or uuid.uuid4().hex
+            self.runs[run_id] = {
+                'submitted': time.time(),
+                'queue_time': self.queue_time(self._random),
+                'duration': self.run_duration(self._random),
+                'outcome': ('EXECUTOR_ERROR'
+                            if self._random.random() < self.error_rate
+                            else 'COMPLETE'),
+                'canceled': None,
+                'request': request or {'fields': [], 'size': 0}
+            }
+        return run_id
+
+    def _RunWorkflow(self, handler, body, **kwargs):
+        fields = re.findall(rb'; name="([^"]+)"', body)
+        run_id = self.add_run(request={
+            'fields': sorted(set(f.decode('utf-8') for f in fields)),
+            'size': len(body)
+        })
+        handler.send_json(200, {'run_id': run_id})
+
+    def _GetRunStatus(self, handler, run_id, **kwargs):
+        with self._lock:
+            state = self._state(self.runs[run_id], time.time())
+        handler.send_json(200, {'run_id': run_id, 'state': state})
+
+    def _GetRunLog(self, handler, run_id, **kwargs):
+        with self._lock:
+            run = self.runs[run_id]
+            state = self._state(run, time.time())
+        start = run['submitted'] + run['queue_time']
+        end = start + run['duration']
+        terminal = state in ('COMPLETE', 'EXECUTOR_ERROR', 'CANCELED')
+        log_url = 'http://{}{}/runs/{}/logs/'.format(self.host, BASE_PATH,
+                                                     run_id)
+        handler.send_json(200, {
+            'run_id': run_id,
+            'request': run['request'],
+            'state': state,
+            'run_log': {
+                'name': 'wes-stub',
+                'cmd': [],
+                'start_time': time.ctime(start),
+                'end_time': time.ctime(end) if terminal else '',
+                'stdout': log_url + 'stdout',
+                'stderr': log_url + 'stderr',
+                'exit_code': (0 if state == 'COMPLETE' else
+                              1 if terminal else None)
+            },
+            'task_logs': [],
+            'outputs': {}
+        })
+
+    def _GetRunStream(self, handler, run_id, stream, **kwargs):
+        line = '{} {} line\n'.format(run_id, stream)
+        text = (line * (self.log_size // len(line) + 1))[:self.log_size]
+        byte_range = re.match(r'^bytes=(\d*)-(\d*)$',
+                              handler.headers.get('Range') or '')
+        if not self.ranges or byte_range is None:
+            handler.send_text(200, text)
+            return
+        start, end = byte_range.groups()
+        if not start:
+            start, end = max(len(text) - int(end), 0), len(text) - 1
+        start = int(start)
+        end = min(int(end), len(text) - 1) if end else len(text) - 1
+        if start >= len(text):
+            handler.send_json(416, {'msg': 'Range not satisfiable',
+                                    'status_code': 416})
+            return
+        handler.send_text(206, text[start:end + 1])
+
+    def _CancelRun(self, handler, run_id, **kwargs):
+        with self._lock:
+            run = self.runs[run_id]
+            if self._state(run, time.time()) in ('QUEUED', 'RUNNING'):
+                run['canceled'] = time.time()
+        handler.send_json(200, {'run_id': run_id})
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='WES stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--queue-time', type=float, default=0.0)
+    parser.add_argument('--run-duration', type=float, nargs='+',
+                        default=[30.0],
+                        help='constant duration, or low and high bounds '
+                             'of a uniform distribution')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    run_duration = (args.run_duration[0] if len(args.run_duration) == 1
+                    else tuple(args.run_duration[:2]))
+    stub = WESStub(host=args.host,
+                   port=args.port,
+                   latency=args.latency,
+                   failure_rate=args.failure_rate,
+                   queue_time=args.queue_time,
+                   run_duration=run_duration,
+                   error_rate=args.error_rate)
+    print("Serving WES stub at {} (CTRL+C to quit)".format(stub.url))
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub._server.server_close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
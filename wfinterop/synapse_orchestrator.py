@@ -6,7 +6,6 @@ retrieval and formatting of parameters, if not provided; post
 the workflow run request to a given WES implementation;
 monitor and report results of the workflow run.
 """
-import datetime as dt
 import json
 import logging
 import os
@@ -15,14 +14,18 @@ import sys
 import time
 
 import chevron
-from IPython.display import display, clear_output
+from IPython.display import clear_output
 from synapseclient import Synapse, Submission, SubmissionStatus
 from synapseclient.core.exceptions import SynapseHTTPError
 from synapseclient.annotations import from_submission_status_annotations
 
+from wfinterop import health, metrics, tracing
 from wfinterop.config import add_queue, queue_config, wes_config
-from wfinterop.util import ctime2datetime, convert_timedelta
+from wfinterop.lease import LeaseKeeper, get_worker_id
+from wfinterop.run_table import RunTable
+from wfinterop.util import to_seconds, to_timestamp
 from wfinterop.wes import WES
+from wfinterop.wes.logs import truncate_log
 # from wfinterop.trs2wes import store_verification
 from wfinterop.trs2wes import build_wes_request
 from wfinterop.trs2wes import fetch_queue_workflow
@@ -31,6 +34,10 @@ from wfinterop.synapse_queue import get_submission_bundle
 from wfinterop.synapse_queue import get_submissions
 # from wfinterop.synapse_queue import create_submission
 from wfinterop.synapse_queue import update_submission
+from wfinterop.synapse_queue import apply_updates
+from wfinterop.synapse_queue import claim_submission
+from wfinterop.synapse_queue import renew_lease
+from wfinterop.synapse_queue import release_submission
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -45,6 +52,13 @@ WORKFLOW_TEMPLATE = os.path.join(
 VALIDATE_AND_SCORE = os.path.join(
     SCRIPT_PATH, '../testdata/validate_and_score.cwl',
 )
+# Synapse rejects string annotations longer than this; only the end of
+# each log (where errors usually are) is fetched and stored
+LOG_ANNOTATION_CHARS = 500
+LOG_TRUNCATION_POLICY = 'tail'
+# WES every submission is run on, whatever ``wes_id`` is passed
+# TODO: Fix hard coded wes_id
+DISPATCH_WES_ID = 'local'
 
 
 def _get_docker_runjob_inputs(sub: Submission) -> dict:
@@ -239,8 +253,10 @@ def _set_in_progress(syn: Synapse, status: SubmissionStatus) -> SubmissionStatus
     return status
 
 
+@tracing.traced('run_submission', 'queue_id', 'submission_id')
 def run_submission(syn: Synapse, queue_id: str, submission_id: str,
-                   wes_id: str = None, opts: dict = None) -> dict:
+                   wes_id: str = None, opts: dict = None,
+                   claimed: bool = False) -> dict:
     """For a single submission to a single evaluation queue, run
     the workflow in a single environment.
 
@@ -250,6 +266,8 @@ def run_submission(syn: Synapse, queue_id: str, submission_id: str,
         submission_id: String identifying the submission.
         wes_id: String identifying the WES id.
         opts: run_job parameters
+        claimed: True if the caller already holds a lease on the
+                 submission, so it is not set in progress again.
 
     Returns:
         Run information of submission
@@ -261,14 +279,14 @@ def run_submission(syn: Synapse, queue_id: str, submission_id: str,
     sub = submission['submission']
     status = submission['submissionStatus']
 
-    status = _set_in_progress(syn, status)
-    # Don't run submission if status is None
-    if status is None:
-        return None
+    if not claimed:
+        status = _set_in_progress(syn, status)
+        # Don't run submission if status is None
+        if status is None:
+            return None
     # if submission['wes_id'] is not None:
     #     wes_id = submission['wes_id']
-    # TODO: Fix hard coded wes_id
-    wes_id = 'local'
+    wes_id = DISPATCH_WES_ID
 
     logger.info(" Submitting to WES endpoint '{}':"
                 " \n - submission ID: {}"
@@ -295,15 +313,29 @@ def run_submission(syn: Synapse, queue_id: str, submission_id: str,
 
 
 def run_queue(syn: Synapse, queue_id: str, wes_id: str = None,
-              opts: dict = None) -> dict:
+              opts: dict = None, lease_ttl: float = None,
+              worker_id: str = None) -> dict:
     """
     Run all submissions in a queue in a single environment.
 
+    When ``lease_ttl`` is set, submissions are claimed with a renewable
+    lease instead of the bare EVALUATION_IN_PROGRESS status update, and
+    in-progress submissions whose lease expired before a run was recorded
+    are reclaimed, so several workers can share the queue.
+
+    Nothing is dispatched if the WES that submissions run on
+    (``DISPATCH_WES_ID``) is down (see :mod:`wfinterop.health`). Without
+    a recent health probe, e.g., in a standalone worker, it is probed
+    first.
+
     Args:
         syn: Synapse connection
         queue_id: String identifying the workflow queue.
         wes_id: String identifying the WES id.
         opts: run_submission parameters
+        lease_ttl: Seconds each claim lasts without renewal; None keeps
+                   the single-worker behavior.
+        worker_id: String identifying this worker in leases.
 
     Returns:
         Run information for each submission started
@@ -313,22 +345,53 @@ def run_queue(syn: Synapse, queue_id: str, wes_id: str = None,
 
     """
     queue_log = {}
-    for submission_id in get_submissions(syn=syn, queue_id=queue_id,
-                                         status='RECEIVED'):
-        # submission = get_submission_bundle(syn, submission_id)
-        # TODO: Add back in
-        # if submission['wes_id'] is not None:
-        #     wes_id = submission['wes_id']
-        run_log = run_submission(syn=syn,
-                                 queue_id=queue_id,
-                                 submission_id=submission_id,
-                                 wes_id=wes_id,
-                                 opts=opts)
-        if run_log is not None:
-            run_log['wes_id'] = wes_id
-            queue_log[submission_id] = run_log
-        else:
-            continue
+    keeper = None
+    if health.is_down(health.WORKFLOW_SERVICES, DISPATCH_WES_ID,
+                      check=True):
+        logger.info("WES '{}' is down; leaving queue {} for a later run"
+                    .format(DISPATCH_WES_ID, queue_id))
+        return queue_log
+    submission_ids = get_submissions(syn=syn, queue_id=queue_id,
+                                     status='RECEIVED')
+    if lease_ttl is not None:
+        worker_id = get_worker_id() if worker_id is None else worker_id
+        keeper = LeaseKeeper(
+            renew=lambda sub_id, ttl: renew_lease(syn, sub_id,
+                                                  worker_id, ttl),
+            ttl=lease_ttl
+        ).start()
+        submission_ids += get_submissions(syn=syn, queue_id=queue_id,
+                                          status='EVALUATION_IN_PROGRESS')
+    try:
+        for submission_id in submission_ids:
+            # submission = get_submission_bundle(syn, submission_id)
+            # TODO: Add back in
+            # if submission['wes_id'] is not None:
+            #     wes_id = submission['wes_id']
+            if keeper is not None:
+                if claim_submission(syn, submission_id, worker_id=worker_id,
+                                    ttl=lease_ttl) is None:
+                    continue
+                keeper.hold(submission_id)
+            try:
+                run_log = run_submission(syn=syn,
+                                         queue_id=queue_id,
+                                         submission_id=submission_id,
+                                         wes_id=wes_id,
+                                         opts=opts,
+                                         claimed=keeper is not None)
+            finally:
+                if keeper is not None:
+                    keeper.release(submission_id)
+                    release_submission(syn, submission_id, worker_id)
+            if run_log is not None:
+                run_log['wes_id'] = wes_id
+                queue_log[submission_id] = run_log
+            else:
+                continue
+    finally:
+        if keeper is not None:
+            keeper.stop()
 
     return queue_log
 
@@ -350,96 +413,113 @@ def monitor_queue(syn: Synapse, queue_id: str) -> dict:
                           'elapsed_time':...},
          ...}
     """
-    current = dt.datetime.now()
+    current = time.time()
     queue_log = {}
+    updates = []
     # TODO: limitation of get_submissions of only being to get submission of
     # one status or all submissions (not combination)
     # TODO: Synapse submission status doesn't map directly into WES defined
-    for sub_id in get_submissions(syn=syn, queue_id=queue_id,
-                                  status="EVALUATION_IN_PROGRESS"):
-        submission = get_submission_bundle(syn=syn, submission_id=sub_id)
-        sub_status = submission['submissionStatus']
-        sub = submission['submission']
-        # TODO: add test for this
-        sub_type = determine_submission_type(sub)
-        if sub_type in ['cwl', 'docker']:
-            queue_id = sub.id
-
-        run_log = from_submission_status_annotations(sub_status.annotations)
-        # if sub_status.status == 'RECEIVED':
-        #     queue_log[sub_id] = {'status': 'PENDING'}
-        #     continue
-
-        # if run_log['run_id'] == 'failed':
-        #     queue_log[sub_id] = {'status': 'FAILED'}
-        #     continue
-        # run_log['wes_id'] = submission['wes_id']
-        # TODO: this shouldn't be hard coded
-        run_log['wes_id'] = 'local'
-
-        # TODO: SWITCH THIS TO INVALID, ACCEPTED...
-        # if run_log['status'] in ['COMPLETE', 'CANCELLED', 'EXECUTOR_ERROR']:
-        #     queue_log[sub_id] = run_log
-        #     continue
-
-        wes_instance = WES(run_log['wes_id'])
-        run_status = wes_instance.get_run_status(run_log['run_id'])
-
-        if run_status['state'] in ['QUEUED', 'INITIALIZING', 'RUNNING']:
-            etime = convert_timedelta(
-                current - ctime2datetime(run_log['start_time'])
-            )
-        elif 'elapsed_time' not in run_log:
-            etime = 0
-        else:
-            etime = run_log['elapsed_time']
-
-        run_log['status'] = run_status['state']
-        run_log['elapsed_time'] = etime
-
-        update_submission(syn=syn, submission_id=sub_id, value=run_log)
-
-        if run_log['status'] == 'COMPLETE':
-            wf_config = queue_config()[queue_id]
-            # sub_status = run_log['status']
-            sub_status = "ACCEPTED"
-            if wf_config['target_queue']:
-                # store_verification(wf_config['target_queue'],
-                #                    submission['wes_id'])
-                sub_status = 'VALIDATED'
-            update_submission(syn=syn, submission_id=sub_id, value=run_log,
-                              status=sub_status)
-
-        if run_log['status'] in ['CANCELLED', 'EXECUTOR_ERROR']:
-            wf_config = queue_config()[queue_id]
-            # Differentiate between CANCELLED and EXECUTOR_ERROR
-            if run_log['status'] == "CANCELLED":
-                sub_status = "CLOSED"
-            else:
-                sub_status = "INVALID"
-                # TODO: put into own function
-                stderr = ''
-                stdout = ''
-                try:
-                    stderr = wes_instance.get_run_stderr(run_log['run_id'])
-                except Exception as err:
-                    stderr = str(err)
-                try:
-                    stdout = wes_instance.get_run_stdout(run_log['run_id'])
-                except Exception as err:
-                    stdout = str(err)
-
-                run_log['stderr'] = stderr
-                run_log['stdout'] = stdout
-
-            if wf_config['target_queue']:
-                # store_verification(wf_config['target_queue'],
-                #                    submission['wes_id'])
-                sub_status = 'VALIDATED'
-            update_submission(syn=syn, submission_id=sub_id, value=run_log,
-                              status=sub_status)
-
-        queue_log[sub_id] = run_log
+    try:
+        for sub_id in get_submissions(syn=syn, queue_id=queue_id,
+                                      status="EVALUATION_IN_PROGRESS"):
+            with tracing.span('poll_submission', submission_id=sub_id):
+                submission = get_submission_bundle(syn=syn,
+                                                   submission_id=sub_id)
+                sub_status = submission['submissionStatus']
+                sub = submission['submission']
+                # TODO: add test for this
+                sub_type = determine_submission_type(sub)
+                if sub_type in ['cwl', 'docker']:
+                    queue_id = sub.id
+
+                run_log = from_submission_status_annotations(
+                    sub_status.annotations
+                )
+                # Claimed by a worker but not dispatched yet
+                if 'run_id' not in run_log:
+                    continue
+                run_log.pop('lease_owner', None)
+                run_log.pop('lease_expires', None)
+                # if sub_status.status == 'RECEIVED':
+                #     queue_log[sub_id] = {'status': 'PENDING'}
+                #     continue
+
+                # if run_log['run_id'] == 'failed':
+                #     queue_log[sub_id] = {'status': 'FAILED'}
+                #     continue
+                # run_log['wes_id'] = submission['wes_id']
+                # TODO: this shouldn't be hard coded
+                run_log['wes_id'] = 'local'
+
+                # TODO: SWITCH THIS TO INVALID, ACCEPTED...
+                # if run_log['status'] in ['COMPLETE', 'CANCELLED',
+                #                          'EXECUTOR_ERROR']:
+                #     queue_log[sub_id] = run_log
+                #     continue
+
+                wes_instance = WES(run_log['wes_id'])
+                run_status = wes_instance.get_run_status(run_log['run_id'])
+
+                if run_status['state'] in ['QUEUED', 'INITIALIZING',
+                                           'RUNNING']:
+                    etime = int(current - to_timestamp(run_log['start_time']))
+                else:
+                    etime = to_seconds(run_log.get('elapsed_time'))
+
+                run_log['status'] = run_status['state']
+                run_log['elapsed_time'] = etime
+
+                sub_status = None
+                if run_log['status'] == 'COMPLETE':
+                    wf_config = queue_config()[queue_id]
+                    # sub_status = run_log['status']
+                    sub_status = "ACCEPTED"
+                    if wf_config['target_queue']:
+                        # store_verification(wf_config['target_queue'],
+                        #                    submission['wes_id'])
+                        sub_status = 'VALIDATED'
+
+                if run_log['status'] in ['CANCELLED', 'EXECUTOR_ERROR']:
+                    wf_config = queue_config()[queue_id]
+                    # Differentiate between CANCELLED and EXECUTOR_ERROR
+                    if run_log['status'] == "CANCELLED":
+                        sub_status = "CLOSED"
+                    else:
+                        sub_status = "INVALID"
+                        # TODO: put into own function
+                        # fetch a few bytes per character in case of
+                        # multi-byte text
+                        tail = None
+                        if LOG_TRUNCATION_POLICY == 'tail':
+                            tail = LOG_ANNOTATION_CHARS * 4
+                        try:
+                            run_logs = wes_instance.get_run_logs(
+                                run_log['run_id'], tail=tail
+                            )
+                            stderr = run_logs['stderr']
+                            stdout = run_logs['stdout']
+                        except Exception as err:
+                            stderr = stdout = str(err)
+
+                        run_log['stderr'] = truncate_log(
+                            stderr, LOG_ANNOTATION_CHARS,
+                            policy=LOG_TRUNCATION_POLICY
+                        )
+                        run_log['stdout'] = truncate_log(
+                            stdout, LOG_ANNOTATION_CHARS,
+                            policy=LOG_TRUNCATION_POLICY
+                        )
+
+                    if wf_config['target_queue']:
+                        # store_verification(wf_config['target_queue'],
+                        #                    submission['wes_id'])
+                        sub_status = 'VALIDATED'
+                updates.append((sub_id, run_log, sub_status))
+
+                queue_log[sub_id] = run_log
+    finally:
+        # annotations and status together, one write per submission
+        apply_updates(syn, updates)
 
     return queue_log
 
@@ -449,35 +529,21 @@ def monitor():
     Monitor progress of workflow jobs.
     # TODO: This currently doesn't work
     """
-    import pandas as pd
-    pd.set_option('display.width', 1000)
-    pd.set_option('display.max_columns', 10)
-    pd.set_option('display.expand_frame_repr', False)
-
+    run_table = RunTable()
     try:
         while True:
-            statuses = []
-
             clear_output(wait=True)
 
-            for queue_id in queue_config():
-                queue_status = monitor_queue(queue_id)
-                if queue_status:
-                    statuses.append(queue_status)
-                    print("\nWorkflow queue: {}".format(queue_id))
-                    status_tracker = pd.DataFrame.from_dict(
-                        queue_status,
-                        orient='index')
-
-                    display(status_tracker)
-
-            terminal_statuses = ['FAILED',
-                                 'COMPLETE',
-                                 'CANCELED',
-                                 'EXECUTOR_ERROR']
-            if all([sub['status'] in terminal_statuses
-                    for queue in statuses
-                    for sub in queue.values()]):
+            queue_ids = list(queue_config())
+            for queue_id in queue_ids:
+                with metrics.SWEEP_SECONDS.time(queue_id=queue_id):
+                    queue_status = monitor_queue(queue_id)
+                run_table.update_queue_log(queue_id, queue_status)
+                metrics.record_runs(queue_id,
+                                    run_table.state_counts(queue_id))
+            print(run_table.summary(queue_ids))
+
+            if run_table.all_terminal(queue_ids):
                 print("\nNo jobs running...")
             print("\n(Press CTRL+C to quit)")
             time.sleep(2)
@@ -2,17 +2,28 @@
 """
 Synapse Queue
 """
+import datetime
+import itertools
 import logging
+import time
 
-from synapseclient import Synapse
+from challengeutils.utils import update_single_submission_status
+from synapseclient import Synapse, SubmissionStatus
+from synapseclient.annotations import from_submission_status_annotations
+from synapseclient.core.exceptions import SynapseHTTPError
 from synapseclient.core.retry import with_retry
 
+from .lease import DEFAULT_LEASE_TTL, get_worker_id, lease_active
+from . import tracing
+from .metrics import QUEUE_SECONDS
 from .util import annotate_submission
 
 logger = logging.getLogger(__name__)
 # TODO: Create OrchestratorQueue and possibly extend submissions
 
 
+@tracing.traced('create_submission', 'queue_id')
+@QUEUE_SECONDS.time(backend='synapse', operation='create_submission')
 def create_submission(syn: Synapse, queue_id: str, entity_id: str) -> str:
     """
     Submit a new job request to an evaluation queue.
@@ -35,6 +46,8 @@ def create_submission(syn: Synapse, queue_id: str, entity_id: str) -> str:
     return submission.id
 
 
+@tracing.traced('get_submissions', 'queue_id', 'status')
+@QUEUE_SECONDS.time(backend='synapse', operation='get_submissions')
 def get_submissions(syn: Synapse, queue_id: str,
                     status: str = None) -> list:
     """Return all ids with the requested status.
@@ -59,6 +72,85 @@ def get_submissions(syn: Synapse, queue_id: str,
         return []
 
 
+def _created_time(submission) -> float:
+    """Read a submission's ``createdOn`` (ISO 8601, UTC) as epoch seconds."""
+    created = datetime.datetime.fromisoformat(
+        submission['createdOn'].rstrip('Z')
+    )
+    return created.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def query_submissions(syn: Synapse, queue_id: str, status=None,
+                      wes_id: str = None, since: float = None,
+                      until: float = None, offset: int = 0,
+                      limit: int = None, page_size: int = 100):
+    """Iterate over the submission bundles of a queue that match all of
+    the given filters, in the order Synapse returns them. Bundles are
+    fetched one page at a time as they are consumed, so large queues can
+    be paged through without building lists.
+
+    A single status is filtered by Synapse; other filters are applied to
+    each page. Without them, ``offset`` is passed to Synapse, so skipped
+    submissions are not fetched at all.
+
+    Args:
+        syn: Synapse connection
+        queue_id: String identifying the workflow queue.
+        status: Submission status or collection of statuses to include.
+        wes_id: Only include submissions annotated with this WES.
+        since: Only include submissions created at or after this time
+               (epoch seconds).
+        until: Only include submissions created before this time
+               (epoch seconds).
+        offset: Number of matching submissions to skip.
+        limit: Maximum number of submissions to produce.
+        page_size: Number of bundles fetched per request.
+
+    Yields:
+        (Submission, SubmissionStatus) tuples
+
+    """
+    if isinstance(status, str):
+        status = {status}
+    server_status = None
+    if status is not None and len(status) == 1:
+        server_status = next(iter(status))
+        status = None
+    filtered = (status is not None or wes_id is not None
+                or since is not None or until is not None)
+    bundles = syn.getSubmissionBundles(queue_id, status=server_status,
+                                       limit=page_size,
+                                       offset=0 if filtered else offset)
+
+    def matches(bundle):
+        sub, sub_status = bundle
+        if status is not None and sub_status.status not in status:
+            return False
+        if wes_id is not None:
+            annotations = from_submission_status_annotations(
+                sub_status.get('annotations') or {}
+            )
+            if annotations.get('wes_id') != wes_id:
+                return False
+        if since is not None or until is not None:
+            created = _created_time(sub)
+            if since is not None and created < since:
+                return False
+            if until is not None and created >= until:
+                return False
+        return True
+
+    if filtered:
+        bundles = filter(matches, bundles)
+        start = offset
+    else:
+        start = 0
+    stop = None if limit is None else start + limit
+    yield from itertools.islice(bundles, start, stop)
+
+
+@tracing.traced('get_submission_bundle', 'submission_id')
+@QUEUE_SECONDS.time(backend='synapse', operation='get_submission_bundle')
 def get_submission_bundle(syn: Synapse, submission_id: str) -> dict:
     """Return the submission's info.
     # TODO: Expose this as an API call?
@@ -81,6 +173,8 @@ def get_submission_bundle(syn: Synapse, submission_id: str) -> dict:
     return bundle
 
 
+@tracing.traced('update_submission', 'submission_id', 'status')
+@QUEUE_SECONDS.time(backend='synapse', operation='update_submission')
 def update_submission(syn: Synapse, submission_id: str, value: dict,
                       status: str = None):
     """
@@ -102,3 +196,150 @@ def update_submission(syn: Synapse, submission_id: str, value: dict,
                 retries=10,
                 retry_status_codes=[412, 429, 500, 502, 503, 504],
                 verbose=True)
+
+
+def apply_updates(syn: Synapse, updates: list):
+    """
+    Apply annotation and status updates with one write per submission.
+    Updates to the same submission are merged in order: later annotation
+    values win, and the last status given is used.
+
+    Args:
+        syn: Synapse connection
+        updates: (submission_id, annotation values, status) tuples;
+                 status may be None to leave it unchanged
+
+    """
+    merged = {}
+    for submission_id, value, status in updates:
+        entry = merged.setdefault(submission_id, [{}, None])
+        entry[0].update(value or {})
+        if status is not None:
+            entry[1] = status
+    for submission_id, (value, status) in merged.items():
+        update_submission(syn, submission_id, value, status=status)
+
+
+def _get_lease(status: SubmissionStatus) -> dict:
+    """Read the lease stored in a submission status's annotations."""
+    annotations = from_submission_status_annotations(
+        status.get('annotations') or {}
+    )
+    return {'owner': annotations.get('lease_owner'),
+            'expires': annotations.get('lease_expires'),
+            'dispatched': 'run_id' in annotations}
+
+
+def _store_lease(syn: Synapse, status: SubmissionStatus, owner: str,
+                 expires: float, new_status: str = None) -> SubmissionStatus:
+    """Write lease annotations and store the status, checking its etag.
+
+    Leases are stored as private annotations, so worker identities are
+    not visible to participants; ``force`` moves leases stored publicly
+    by earlier versions.
+    """
+    if new_status is not None:
+        status.status = new_status
+    status = update_single_submission_status(
+        status, {'lease_owner': owner, 'lease_expires': expires},
+        is_private=True, force=True
+    )
+    return syn.store(status)
+
+
+@tracing.traced('claim_submission', 'submission_id')
+@QUEUE_SECONDS.time(backend='synapse', operation='claim_submission')
+def claim_submission(syn: Synapse, submission_id: str,
+                     worker_id: str = None,
+                     ttl: float = DEFAULT_LEASE_TTL) -> SubmissionStatus:
+    """Take a lease on a submission so that no other worker dispatches it.
+
+    RECEIVED submissions can always be claimed. EVALUATION_IN_PROGRESS
+    submissions can be reclaimed once their lease has expired, as long as
+    no run was recorded for them (the previous worker died before
+    dispatching). Concurrent claims are resolved by Synapse's etag check:
+    the loser gets a 412 and the claim returns None.
+
+    Args:
+        syn: Synapse connection
+        submission_id: Submission id
+        worker_id: String identifying the claiming worker; defaults to
+                   the current host and process.
+        ttl: Seconds until the lease expires unless renewed.
+
+    Returns:
+        Stored submission status, or None if the submission was not claimed
+
+    """
+    worker_id = get_worker_id() if worker_id is None else worker_id
+    status = syn.getSubmissionStatus(submission_id)
+    lease = _get_lease(status)
+    if status.status == 'EVALUATION_IN_PROGRESS':
+        if lease['dispatched'] or lease_active(lease):
+            return None
+        logger.info(" Reclaiming submission {} from expired lease held "
+                    "by '{}'".format(submission_id, lease['owner']))
+    elif status.status != 'RECEIVED':
+        return None
+    try:
+        return _store_lease(syn, status, worker_id, time.time() + ttl,
+                            new_status='EVALUATION_IN_PROGRESS')
+    except SynapseHTTPError as err:
+        if err.response.status_code != 412:
+            raise err
+        return None
+
+
+def _update_lease(syn: Synapse, submission_id: str, worker_id: str,
+                  expires: float, retries: int = 3) -> bool:
+    """Rewrite a lease owned by ``worker_id``, retrying etag conflicts."""
+    for _ in range(retries):
+        status = syn.getSubmissionStatus(submission_id)
+        if _get_lease(status)['owner'] != worker_id:
+            return False
+        try:
+            _store_lease(syn, status, worker_id, expires)
+            return True
+        except SynapseHTTPError as err:
+            if err.response.status_code != 412:
+                raise err
+    return False
+
+
+@tracing.traced('renew_lease', 'submission_id')
+@QUEUE_SECONDS.time(backend='synapse', operation='renew_lease')
+def renew_lease(syn: Synapse, submission_id: str, worker_id: str = None,
+                ttl: float = DEFAULT_LEASE_TTL) -> bool:
+    """Extend a lease held by this worker.
+
+    Args:
+        syn: Synapse connection
+        submission_id: Submission id
+        worker_id: String identifying the worker holding the lease.
+        ttl: Seconds from now until the lease expires.
+
+    Returns:
+        True if the lease was renewed
+
+    """
+    worker_id = get_worker_id() if worker_id is None else worker_id
+    return _update_lease(syn, submission_id, worker_id, time.time() + ttl)
+
+
+@tracing.traced('release_submission', 'submission_id')
+@QUEUE_SECONDS.time(backend='synapse', operation='release_submission')
+def release_submission(syn: Synapse, submission_id: str,
+                       worker_id: str = None) -> bool:
+    """Give up a lease held by this worker by expiring it immediately.
+
+    Args:
+        syn: Synapse connection
+        submission_id: Submission id
+        worker_id: String identifying the worker holding the lease.
+
+    Returns:
+        True if the lease was released
+
+    """
+    worker_id = get_worker_id() if worker_id is None else worker_id
+    return _update_lease(syn, submission_id, worker_id, 0.0)
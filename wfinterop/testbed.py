@@ -7,17 +7,19 @@ import urllib
 import re
 import time
 import shutil
+import threading
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from IPython.display import display
-from itertools import combinations_with_replacement
-from requests.exceptions import ConnectionError
+from itertools import product
 
+from wfinterop import health
 from wfinterop.config import add_queue
 from wfinterop.config import queue_config, set_yaml
 from wfinterop.trs import TRS
-from wfinterop.wes import WES
 from wfinterop.queue import create_submission
 from wfinterop.orchestrator import run_submission, monitor_queue
+from wfinterop.trs2wes import fetch_queue_workflow
 from wfinterop.util import get_json, save_json
 
 logging.basicConfig(level=logging.DEBUG)
@@ -28,11 +30,17 @@ testbed_log = os.path.join(os.path.dirname(__file__),
                            'testbed_log.json')
 if not os.path.exists(testbed_log):
     save_json(testbed_log, {})
+_log_lock = threading.Lock()
 
 
-def poll_services():
+def poll_services(timeout=health.PROBE_TIMEOUT):
     """
-    Check connection to services in testbed.
+    Check connection to services in testbed. Services are probed in
+    parallel, and any that do not answer within ``timeout`` seconds are
+    reported as down; results are cached for dispatch (see
+    :mod:`wfinterop.health`).
+
+    :param float timeout: Seconds to wait for all services.
     """
     trs_opts = []
     wes_opts = []
@@ -40,25 +48,9 @@ def poll_services():
         trs_opts.append(wf_config['trs_id'])
         wes_opts += wf_config['wes_opts']
 
-    trs_status = {}
-    for trs_id in list(set(trs_opts)):
-        trs_instance = TRS(trs_id=trs_id)
-        trs_status[trs_id] = True
-        try:
-            trs_instance.get_metadata()
-        except ConnectionError:
-            trs_status[trs_id] = False
-
-    wes_status = {}
-    for wes_id in list(set(wes_opts)):
-        wes_instance = WES(wes_id=wes_id)
-        wes_status[wes_id] = True
-        try:
-            wes_instance.get_service_info()
-        except ConnectionError:
-            wes_status[wes_id] = False
-
-    return {'toolregistries': trs_status, 'workflowservices': wes_status}
+    return health.check_services({health.TOOL_REGISTRIES: trs_opts,
+                                  health.WORKFLOW_SERVICES: wes_opts},
+                                 timeout=timeout)
 
 
 def get_checker_id(trs, workflow_id):
@@ -75,26 +67,15 @@ def get_checker_id(trs, workflow_id):
     return checker_id
 
 
-def check_workflow(queue_id, wes_id, opts=None, force=False):
+def get_checker_job(queue_id):
     """
-    Run checker workflow in a single environment.
+    Resolve the checker workflow queue and test job for a workflow queue,
+    adding the checker queue to the config if needed.
 
     :param str queue_id: String identifying the workflow queue.
-    :param str wes_id:
-    :param dict opts:
-    :param bool force:
+    :return: tuple of checker queue ID and the URL of its test job
     """
-    if opts is None:
-        opts = get_opts()
-    if not isinstance(opts, list):
-        opts = [opts]
     wf_config = queue_config()[queue_id]
-    testbed_status = get_json(testbed_log)
-
-    if wes_id in wf_config.get('wes_verified', []) and not force:
-        logger.info("Workflow for '{}' already verified on '{}'"
-                    .format(queue_id, wes_id))
-        return testbed_status
     logger.info("Preparing checker workflow run request for '{}' from  '{}'"
                 .format(wf_config['workflow_id'], wf_config['trs_id']))
     trs_instance = TRS(wf_config['trs_id'])
@@ -121,47 +102,241 @@ def check_workflow(queue_id, wes_id, opts=None, force=False):
     checker_config = queue_config()[checker_queue_id]
     checker_config['test'] = checker_job['url']
     set_yaml('queues', checker_queue_id, checker_config)
+    return checker_queue_id, checker_job['url']
+
+
+class CheckerCache(object):
+    """
+    Resolve each queue's checker workflow once and share it between
+    testbed cells running in different threads. The checker queue's
+    workflow URL and attachments are fetched from TRS here too, so cells
+    only read the queues config.
+    """
+    def __init__(self):
+        self._checkers = {}
+        # resolution also rewrites the queues config, so do one at a time
+        self._lock = threading.Lock()
+
+    def get(self, queue_id):
+        with self._lock:
+            if queue_id not in self._checkers:
+                checker_queue_id, checker_job_url = get_checker_job(queue_id)
+                checker_config = queue_config()[checker_queue_id]
+                if checker_config['workflow_url'] is None:
+                    fetch_queue_workflow(checker_queue_id)
+                self._checkers[queue_id] = (checker_queue_id,
+                                            checker_job_url)
+            return self._checkers[queue_id]
+
+
+def _save_cells(checker_queue_id, wes_id, cells):
+    """
+    Merge the records for one testbed cell into the testbed log, leaving
+    records written concurrently by other cells in place.
+    """
+    with _log_lock:
+        testbed_status = get_json(testbed_log)
+        queue_cells = testbed_status.setdefault(checker_queue_id, {})
+        queue_cells.setdefault(wes_id, {}).update(cells)
+        save_json(testbed_log, testbed_status)
+
+
+def check_workflow(queue_id, wes_id, opts=None, force=False, checkers=None):
+    """
+    Run checker workflow in a single environment.
+
+    :param str queue_id: String identifying the workflow queue.
+    :param str wes_id:
+    :param dict opts:
+    :param bool force:
+    :param CheckerCache checkers: Cache of resolved checker workflows
+        shared with other cells of a testbed run.
+    """
+    if opts is None:
+        opts = get_opts()
+    if not isinstance(opts, list):
+        opts = [opts]
+    wf_config = queue_config()[queue_id]
+    with _log_lock:
+        testbed_status = get_json(testbed_log)
+
+    if wes_id in wf_config.get('wes_verified', []) and not force:
+        logger.info("Workflow for '{}' already verified on '{}'"
+                    .format(queue_id, wes_id))
+        return testbed_status
+    if checkers is None:
+        checker_queue_id, checker_job_url = get_checker_job(queue_id)
+    else:
+        checker_queue_id, checker_job_url = checkers.get(queue_id)
+
+    queue_cells = testbed_status.setdefault(checker_queue_id, {})
+    cells = queue_cells.setdefault(wes_id, {})
     for opt in opts:
         if 'run_id' in opt:
             opt.pop('run_id')
         submission_id = create_submission(queue_id=checker_queue_id,
-                                          submission_data=checker_job['url'],
+                                          submission_data=checker_job_url,
                                           wes_id=wes_id)
         logger.info("Created submission '{}' for queue '{}'; running in '{}'"
                     "with options: {}"
                     .format(submission_id, checker_queue_id, wes_id, opt))
-        testbed_status.setdefault(checker_queue_id, {}).setdefault(wes_id, {})[submission_id] = opt
-        save_json(testbed_log, testbed_status)
+        cells[submission_id] = opt
+        _save_cells(checker_queue_id, wes_id, {submission_id: opt})
         logger.info("Requesting new workflow run for '{}' in '{}'"
                     .format(checker_queue_id, wes_id))
         run_log = run_submission(queue_id=checker_queue_id,
                                  submission_id=submission_id,
                                  opts=opt)
-        testbed_status[checker_queue_id][wes_id][submission_id]['run_id'] = run_log['run_id']
-        save_json(testbed_log, testbed_status)
+        cells[submission_id]['run_id'] = run_log['run_id']
+        _save_cells(checker_queue_id, wes_id, {submission_id: opt})
 
     return testbed_status
 
 
-def get_opts(permute=False):
+def run_matrix(testbed_plan, opts_list, force=False, max_per_wes=1,
+               max_workers=None):
+    """
+    Run every (workflow, WES, options) cell of a testbed plan
+    concurrently. Checker workflows and test jobs are resolved once per
+    workflow and shared across cells; results are written to the testbed
+    log as each cell finishes.
+
+    :param dict testbed_plan: Workflow queue IDs mapped to lists of WES IDs.
+    :param list opts_list: Request option sets to run in each
+        environment, or a dict of option sets for each workflow queue.
+    :param bool force:
+    :param int max_per_wes: Maximum cells running at once on any one WES.
+    :param int max_workers: Maximum cells running at once overall;
+        defaults to the number of cells.
+    :return: list of cells that raised, as (queue_id, wes_id, opts, error)
+    """
+    if not isinstance(opts_list, dict):
+        opts_list = dict.fromkeys(testbed_plan, opts_list)
+    cells = [(queue_id, wes_id, dict(opts))
+             for queue_id in testbed_plan
+             for wes_id in testbed_plan[queue_id]
+             for opts in opts_list[queue_id]]
+    if not cells:
+        return []
+    checkers = CheckerCache()
+    # resolve checkers up front so cells running at once never write to
+    # the queues config
+    for queue_id in testbed_plan:
+        if testbed_plan[queue_id] and opts_list[queue_id]:
+            checkers.get(queue_id)
+    wes_slots = {wes_id: threading.BoundedSemaphore(max_per_wes)
+                 for _, wes_id, _ in cells}
+
+    def run_cell(queue_id, wes_id, opts):
+        with wes_slots[wes_id]:
+            return check_workflow(queue_id=queue_id,
+                                  wes_id=wes_id,
+                                  opts=[opts],
+                                  force=force,
+                                  checkers=checkers)
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers or len(cells)) as pool:
+        futures = {pool.submit(run_cell, *cell): cell for cell in cells}
+        for done, future in enumerate(as_completed(futures), 1):
+            queue_id, wes_id, opts = futures[future]
+            try:
+                future.result()
+            except Exception as err:
+                logger.warning("Testbed cell '{}' on '{}' with options {} "
+                               "failed: {}".format(queue_id, wes_id, opts,
+                                                   err))
+                errors.append((queue_id, wes_id, opts, err))
+            logger.info("Finished testbed cell {}/{}: '{}' on '{}'"
+                        .format(done, len(cells), queue_id, wes_id))
+    return errors
+
+
+# Boolean ``build_wes_request`` flags explored by the testbed; add new
+# flags here (and any rules about them below) to include them in the matrix.
+OPT_NAMES = [
+    "attach_descriptor",
+    "resolve_params",
+    "attach_imports",
+    "pack_descriptor"
+]
+
+
+def _packed_attached(opts, **context):
+    # packed descriptors must be attached and already contain imports
+    return not (opts['pack_descriptor'] and
+                (opts['attach_imports'] or not opts['attach_descriptor']))
+
+
+# Predicates that every option combination run by the testbed must pass.
+OPT_CONSTRAINTS = [_packed_attached]
+
+
+def _ignore_wdl_packing(opts, workflow_type=None, **context):
+    # build_wes_request turns packing off for WDL
+    if workflow_type == 'WDL':
+        opts['pack_descriptor'] = False
+    return opts
+
+
+def _ignore_missing_imports(opts, workflow_type=None, attachments=None,
+                            **context):
+    # attach_imports only filters attachments with the workflow's extension
+    if workflow_type and attachments is not None:
+        ext = '.{}'.format(workflow_type.lower())
+        if not any(attachment.lower().endswith(ext)
+                   for attachment in attachments):
+            opts['attach_imports'] = False
+    return opts
+
+
+# Functions mapping an option combination to the canonical member of its
+# equivalence class, i.e., the combination that builds the same request.
+OPT_REDUCERS = [_ignore_wdl_packing, _ignore_missing_imports]
+
+
+def iter_opts(names=None, constraints=None, reducers=None, **context):
+    """
+    Generate the distinct option combinations worth running, in a stable
+    order. Combinations failing a constraint are pruned, and combinations
+    that reduce to one already generated (because they would produce the
+    same request) are skipped.
+
+    :param list names: Flag names; defaults to ``OPT_NAMES``.
+    :param list constraints: Predicates ``f(opts, **context)``; defaults
+        to ``OPT_CONSTRAINTS``.
+    :param list reducers: Functions ``f(opts, **context)`` returning a
+        canonical combination; defaults to ``OPT_REDUCERS``.
+    :param context: Details about the workflow used by constraints and
+        reducers (e.g., ``workflow_type``, ``attachments``).
+    """
+    names = OPT_NAMES if names is None else names
+    constraints = OPT_CONSTRAINTS if constraints is None else constraints
+    reducers = OPT_REDUCERS if reducers is None else reducers
+    seen = set()
+    for state in product([False, True], repeat=len(names)):
+        opts = dict(zip(names, state))
+        if not all(constraint(opts, **context) for constraint in constraints):
+            continue
+        canonical = dict(opts)
+        for reducer in reducers:
+            canonical = reducer(canonical, **context)
+        key = tuple(canonical[name] for name in names)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield canonical
+
+
+def get_opts(permute=False, **context):
     """
     :param bool permute:
+    :param context: Workflow details passed to :func:`iter_opts` to skip
+        redundant combinations.
     """
-    opts = [
-        "attach_descriptor",
-        "resolve_params",
-        "attach_imports",
-        "pack_descriptor"
-    ]
-    n = len(opts)
     if not permute:
-        return [dict(zip(opts, [False] * n))]
-    else:
-        states = set(combinations_with_replacement([True, False] * (n - 1), n))
-        return filter(lambda x: not (x['pack_descriptor'] and
-                                     (x['attach_imports'] or not
-                                      x['attach_descriptor'])),
-                      [dict(zip(opts, state)) for state in states])
+        return [dict.fromkeys(OPT_NAMES, False)]
+    return list(iter_opts(**context))
 
 
 def collect_logs(testbed_status):
@@ -192,7 +367,9 @@ def monitor_testbed():
                           for queue_id in testbed_status
                           for wes_log in testbed_status[queue_id].values()
                           for sub_log in wes_log.values()]
-        testbed_statuses = filter(lambda x: x[1] not in terminal_statuses, queue_statuses)
+        testbed_statuses = list(filter(
+            lambda x: x[1] not in terminal_statuses, queue_statuses
+        ))
         if not len(testbed_statuses):
             collect_logs(testbed_status)
             break
@@ -201,21 +378,40 @@ def monitor_testbed():
             logger.info("Checking status of runs in queue '{}'"
                         .format(queue_id))
             queue_logs = monitor_queue(queue_id)
-            queue_statuses = map(lambda x: x['status'], queue_logs.values())
-            live_statuses = [s for s in queue_statuses if s not in terminal_statuses]
-            logger.info("... {} jobs still remaining".format(len(live_statuses)))
+            queue_statuses = list(map(lambda x: x['status'],
+                                      queue_logs.values()))
+            live_statuses = [s for s in queue_statuses
+                             if s not in terminal_statuses]
+            logger.info("... {} jobs still remaining"
+                        .format(len(live_statuses)))
             sub_statuses = dict(zip(queue_logs.keys(), queue_statuses))
             for wes_id in testbed_status[queue_id]:
                 logger.debug("Recording statuses for queue '{}'\n > '{}'"
                              .format(queue_id, wes_id))
-                for sub_id in testbed_status[queue_id][wes_id]:
-                    testbed_status[queue_id][wes_id][sub_id]['status'] = sub_statuses[sub_id]
+                wes_cells = testbed_status[queue_id][wes_id]
+                for sub_id in wes_cells:
+                    wes_cells[sub_id]['status'] = sub_statuses[sub_id]
         save_json(testbed_log, testbed_status)
         time.sleep(2)
     return testbed_status
 
 
-def check_all(testbed_plan, permute_opts=False, force=False):
+def _opts_context(queue_id):
+    """
+    Collect what is known up front about a queue's checker workflow for
+    pruning redundant option combinations.
+    """
+    wf_config = queue_config()[queue_id]
+    context = {'workflow_type': wf_config.get('workflow_type')}
+    checker_config = queue_config().get('{}_checker'.format(queue_id))
+    if checker_config and checker_config.get('workflow_url') is not None:
+        context['attachments'] = (checker_config.get('workflow_attachments')
+                                  or [])
+    return context
+
+
+def check_all(testbed_plan, permute_opts=False, force=False,
+              max_per_wes=1):
     """
     Check workflows for multiple workflows in multiple environments
     (cross product of workflows, workflow service endpoints).
@@ -223,14 +419,12 @@ def check_all(testbed_plan, permute_opts=False, force=False):
     :param dict testbed_plan:
     :param bool permute_opts:
     :param bool force:
+    :param int max_per_wes: Maximum runs submitted at once to each WES.
     """
-    opts_list = get_opts(permute_opts)
-    testbed_status = [check_workflow(queue_id=workflow_id,
-                                     wes_id=wes_id,
-                                     opts=opts_list,
-                                     force=force)
-                      for workflow_id in testbed_plan
-                      for wes_id in testbed_plan[workflow_id]][-1]
+    opts_list = {queue_id: get_opts(permute_opts,
+                                    **_opts_context(queue_id))
+                 for queue_id in testbed_plan}
+    run_matrix(testbed_plan, opts_list, force=force, max_per_wes=max_per_wes)
     testbed_status = monitor_testbed()
     return testbed_status
 
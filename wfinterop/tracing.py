@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+Tracing spans around the stages of a submission's lifecycle (fetching the
+workflow, building the request, dispatching to WES, waiting, polling and
+updating the queue). Spans are created with the OpenTelemetry API when it
+is installed, so they can be sent to any OpenTelemetry exporter; without
+it, or until :func:`configure` (or another tracer provider) is set up,
+spans are no-ops. Every span opened while a submission is being handled
+carries the submission ID as the ``submission.id`` attribute, e.g.:
+
+    from wfinterop import tracing
+    tracing.configure('file', path='spans.jsonl')
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import sys
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+TRACER_NAME = 'wfinterop'
+SUBMISSION_ATTRIBUTE = 'submission.id'
+
+_submission_id = contextvars.ContextVar('submission_id', default=None)
+_tracer_provider = None
+_span_file = None
+
+
+class _NoopSpan(object):
+    """Stand-in span used when OpenTelemetry is not installed."""
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def record_exception(self, exception, attributes=None):
+        pass
+
+    def is_recording(self):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _attributes(attributes):
+    # OpenTelemetry only accepts primitive attribute values
+    return {key: value if isinstance(value, (str, bool, int, float))
+            else str(value)
+            for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name, submission_id=None, **attributes):
+    """
+    Open a span as a child of the current span.
+
+    :param str name: Span name, e.g., the stage of the submission
+        lifecycle.
+    :param str submission_id: Submission being handled; recorded on this
+        span and on every span opened inside it.
+    :param attributes: Further span attributes; None values are dropped.
+    """
+    token = _submission_id.set(submission_id or _submission_id.get())
+    try:
+        if trace is None:
+            yield _NOOP_SPAN
+            return
+        attributes[SUBMISSION_ATTRIBUTE] = _submission_id.get()
+        tracer = trace.get_tracer(TRACER_NAME,
+                                  tracer_provider=_tracer_provider)
+        with tracer.start_as_current_span(
+                name, attributes=_attributes(attributes)) as current:
+            yield current
+    finally:
+        _submission_id.reset(token)
+
+
+def set_submission_id(submission_id):
+    """
+    Record the submission handled by the current span (and spans opened
+    after it within the same enclosing :func:`span`), for stages where the
+    submission is only created partway through.
+    """
+    _submission_id.set(submission_id)
+    if trace is not None:
+        trace.get_current_span().set_attribute(SUBMISSION_ATTRIBUTE,
+                                               submission_id)
+
+
+def traced(name, *arg_names, **attributes):
+    """
+    Decorator wrapping each call in a :func:`span`.
+
+    :param str name: Span name.
+    :param arg_names: Names of the wrapped function's arguments to record
+        as span attributes (a 'submission_id' argument marks the
+        submission being handled).
+    :param attributes: Attribute values, or callables taking the wrapped
+        function's arguments and returning a value.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            values = {key: (value(*args, **kwargs) if callable(value)
+                            else value)
+                      for key, value in attributes.items()}
+            if arg_names:
+                bound = signature.bind_partial(*args, **kwargs).arguments
+                values.update((arg, bound.get(arg)) for arg in arg_names)
+            with span(name, **values):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _span_line(finished_span):
+    return json.dumps(json.loads(finished_span.to_json()),
+                      separators=(',', ':')) + '\n'
+
+
+def configure(exporter='console', path=None, service_name='wfinterop'):
+    """
+    Install a tracer provider exporting finished spans. The provider is
+    used for wfinterop spans only; if an application already configured a
+    global OpenTelemetry provider, leave this uncalled and spans go there.
+
+    Requires the ``opentelemetry-sdk`` package.
+
+    :param str exporter: 'console' to print spans to stdout, or 'file' to
+        append one JSON span per line to ``path``.
+    :param str path: Output file for the 'file' exporter.
+    :param str service_name: Service name recorded with every span.
+    :return: the :class:`opentelemetry.sdk.trace.TracerProvider`
+    """
+    global _tracer_provider, _span_file
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    except ImportError:
+        raise ImportError("Exporting spans requires the "
+                          "'opentelemetry-sdk' package")
+    reset()
+    if exporter == 'console':
+        span_exporter = ConsoleSpanExporter(out=sys.stdout)
+    elif exporter == 'file':
+        if path is None:
+            raise ValueError("The 'file' exporter requires a path")
+        _span_file = open(path, 'a')
+        span_exporter = ConsoleSpanExporter(out=_span_file,
+                                            formatter=_span_line)
+    else:
+        raise ValueError("Unknown span exporter: {}".format(exporter))
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': service_name})
+    )
+    provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    _tracer_provider = provider
+    logger.info("Exporting spans to {}".format(path or exporter))
+    return provider
+
+
+def reset():
+    """Stop exporting spans set up by :func:`configure`."""
+    global _tracer_provider, _span_file
+    if _tracer_provider is not None:
+        _tracer_provider.shutdown()
+        _tracer_provider = None
+    if _span_file is not None:
+        _span_file.close()
+        _span_file = None
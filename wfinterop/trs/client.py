@@ -6,6 +6,7 @@ from bravado.swagger_model import Loader
 from bravado.client import SwaggerClient
 
 from wfinterop.config import trs_config
+from wfinterop.credentials import AuthHeaders
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +31,8 @@ def _init_http_client(service_id=None, opts=None):
     http_client = RequestsClient()
 
     http_client.set_api_key(host=opts['host'],
-                            api_key=opts['auth'],
+                            # headers are filled in again for each request
+                            api_key=AuthHeaders(opts['auth']),
                             param_in='header')
     return http_client
 
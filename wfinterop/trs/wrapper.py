@@ -4,12 +4,25 @@ import logging
 import urllib
 import re
 
+from wfinterop import metrics, tracing
 from wfinterop.trs.client import load_trs_client
 from wfinterop.util import response_handler
 
 logger = logging.getLogger(__name__)
 
 
+def _instrument(endpoint):
+    """Count, time and trace calls to a TRS endpoint, per service."""
+    def decorator(func):
+        service_id = lambda self, *args, **kwargs: self.id  # noqa: E731
+        func = metrics.instrument(metrics.TRS_REQUESTS,
+                                  metrics.TRS_REQUEST_SECONDS,
+                                  trs_id=service_id,
+                                  endpoint=endpoint)(func)
+        return tracing.traced('TRS.' + endpoint, trs_id=service_id)(func)
+    return decorator
+
+
 def _format_workflow_id(id):
     """
     Add workflow prefix to and quote a tool ID.
@@ -32,10 +45,12 @@ class TRS(object):
     :param api_client:
     """
     def __init__(self, trs_id, api_client=None):
+        self.id = trs_id
         if api_client is None:
             api_client = load_trs_client(service_id=trs_id)
         self.api_client = api_client
 
+    @_instrument('metadataGet')
     def get_metadata(self):
         """
         Return some metadata that is useful for describing the service.
@@ -43,6 +58,7 @@ class TRS(object):
         res = self.api_client.metadataGet()
         return res.response().result
 
+    @_instrument('toolsIdGet')
     def get_workflow(self, id):
         """
         Return one specific tool of class "workflow" (which has
@@ -54,6 +70,7 @@ class TRS(object):
         res = self.api_client.toolsIdGet(id=id)
         return response_handler(res)
 
+    @_instrument('toolsIdVersionsGet')
     def get_workflow_versions(self, id):
         """
         Return all versions of the specified workflow.
@@ -64,6 +81,7 @@ class TRS(object):
         res = self.api_client.toolsIdVersionsGet(id=id)
         return response_handler(res)
 
+    @_instrument('toolsIdVersionsVersionIdTypeDescriptorGet')
     def get_workflow_descriptor(self, id, version_id, type):
         """
         Return the descriptor for the specified workflow (examples
@@ -81,6 +99,7 @@ class TRS(object):
         )
         return response_handler(res)
 
+    @_instrument('toolsIdVersionsVersionIdTypeDescriptorRelativePathGet')
     def get_workflow_descriptor_relative(self,
                                          id,
                                          version_id,
@@ -103,6 +122,7 @@ class TRS(object):
         )
         return response_handler(res)
 
+    @_instrument('toolsIdVersionsVersionIdTypeTestsGet')
     def get_workflow_tests(self, id, version_id, type):
         """
         Return a list of test JSONs (these allow you to execute the
@@ -120,6 +140,7 @@ class TRS(object):
         )
         return response_handler(res)
 
+    @_instrument('toolsIdVersionsVersionIdTypeFilesGet')
     def get_workflow_files(self, id, version_id, type):
         """
         Return a list of files associated with the workflow based
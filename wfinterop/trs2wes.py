@@ -8,9 +8,11 @@ descriptors, parameters, and inputs to include with request.
 import logging
 import os
 import urllib
+import urllib.request
 import json
 import re
 import glob
+import hashlib
 from io import StringIO
 import subprocess
 
@@ -19,6 +21,7 @@ import schema_salad.ref_resolver
 from wdlparse.draft2 import wdl_parser
 from wes_service.util import visit
 
+from wfinterop import tracing
 from wfinterop.util import open_file, get_yaml, get_json
 from wfinterop.config import queue_config
 from wfinterop.config import set_yaml
@@ -27,7 +30,12 @@ from wfinterop.trs import TRS
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# seconds to wait for a remote descriptor or parameters file when
+# fingerprinting a request
+FETCH_TIMEOUT = 10
 
+
+@tracing.traced('fetch_queue_workflow', 'queue_id')
 def fetch_queue_workflow(queue_id):
     """
     Collect details for the workflow associated with a queue from the
@@ -160,6 +168,7 @@ def get_wf_info(workflow_path):
     return version, file_type.upper()
 
 
+@tracing.traced('get_packed_cwl')
 def get_packed_cwl(workflow_url):
     """
     Create 'packed' version of CWL workflow descriptor.
@@ -294,6 +303,7 @@ def modify_jsonyaml_paths(jsonyaml_file, path_keys=None):
     return json.dumps(input_dict)
 
 
+@tracing.traced('get_wf_descriptor')
 def get_wf_descriptor(workflow_file,
                       parts=None,
                       attach_descriptor=False,
@@ -335,6 +345,7 @@ def get_wf_descriptor(workflow_file,
     return parts
 
 
+@tracing.traced('get_wf_params')
 def get_wf_params(workflow_file,
                   workflow_type,
                   jsonyaml,
@@ -371,6 +382,7 @@ def get_wf_params(workflow_file,
     return parts
 
 
+@tracing.traced('get_wf_attachments')
 def get_wf_attachments(workflow_file, attachments, parts=None):
     """
     Retrieve and attach any additional files needed to run
@@ -424,6 +436,7 @@ def expand_globs(attachments):
     return set(expanded_list)
 
 
+@tracing.traced('build_wes_request')
 def build_wes_request(workflow_file,
                       jsonyaml,
                       attachments=None,
@@ -490,3 +503,77 @@ def build_wes_request(workflow_file,
                                    parts=parts)
 
     return parts
+
+
+def _content_digest(location):
+    """
+    Hash the content of a local file or remote (HTTP) document, so edits
+    behind an unchanged location (e.g., a mutable TRS version) change the
+    hash, falling back to the location string for missing or unreachable
+    files.
+    """
+    if isinstance(location, str):
+        path = location[7:] if location.startswith('file://') else location
+        if path.startswith('http'):
+            try:
+                with urllib.request.urlopen(path,
+                                            timeout=FETCH_TIMEOUT) as f:
+                    return hashlib.sha256(f.read()).hexdigest()
+            except (OSError, ValueError) as err:
+                logger.debug("Could not fetch '{}' to fingerprint: {}"
+                             .format(path, err))
+        elif ':' not in path and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+    return hashlib.sha256(json.dumps(location, sort_keys=True,
+                                     default=str).encode('utf-8')).hexdigest()
+
+
+@tracing.traced('fingerprint_request')
+def fingerprint_request(parts=None, request=None):
+    """
+    Compute a stable fingerprint for a WES run request. Requests with the
+    same fingerprint send the same descriptor, parameters, attachments
+    and engine parameters, whatever order the parts are in.
+
+    Args:
+        parts (:obj:`list` of :obj:`tuple`): parts as returned by
+            :func:`build_wes_request`, including file contents
+        request (dict): request dict with 'workflow_url',
+            'workflow_params' and 'attachment' keys, used when the
+            client builds the parts itself (no ``parts``)
+
+    Returns:
+        str: hex digest identifying the request
+    """
+    entries = []
+    if parts:
+        for name, value in parts:
+            if isinstance(value, (tuple, list)):
+                filename, f = value[:2]
+                if hasattr(f, 'getvalue'):
+                    content = f.getvalue()
+                else:
+                    content = f.read()
+                    f.seek(0)
+                if isinstance(content, str):
+                    content = content.encode('utf-8')
+                entries.append((name, filename,
+                                hashlib.sha256(content).hexdigest()))
+            elif name in ('workflow_url', 'workflow_params'):
+                # a path or URL rather than the file itself
+                entries.append((name, _content_digest(value)))
+            else:
+                entries.append((name, str(value)))
+    elif request:
+        attachments = request.get('attachment') or []
+        entries.append(('workflow_url',
+                        _content_digest(request.get('workflow_url'))))
+        entries.append(('workflow_params',
+                        _content_digest(request.get('workflow_params'))))
+        entries.extend(('workflow_attachment', _content_digest(attachment))
+                       for attachment in attachments)
+    digest = hashlib.sha256()
+    for entry in sorted(entries):
+        digest.update(json.dumps(entry).encode('utf-8'))
+    return digest.hexdigest()
@@ -8,8 +8,13 @@ import logging
 import os
 import re
 import json
+import uuid
 import yaml
-import subprocess
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import datetime as dt
 from challengeutils.utils import update_single_submission_status
@@ -17,6 +22,8 @@ from challengeutils.utils import update_single_submission_status
 from contextlib import contextmanager
 from urllib.request import urlopen
 
+from wfinterop import credentials
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -37,35 +44,30 @@ def open_file(path, mode):
     f.close()
 
 
-def _replace_env_var(match):
+@contextmanager
+def file_lock(path):
     """
-    For a matched environment variable, return the appropriate value
-    based on pre-defined mapping.
-
-    Args:
-        match (SRE_Match): :class:`SRE_Match` object returned from
-            searching a string for environment variables matching pattern
-            '${ENV_VAR}'
-
-    Returns:
-        str: string with the value of the matched environment variable
+    Hold an exclusive lock on a sidecar ``<path>.lock`` file so that
+    read-modify-write cycles on ``path`` from several processes do not
+    interleave. Without ``fcntl`` (e.g., on Windows) this is a no-op.
     """
-    env_var, default = match.groups()
-    if env_var == 'GCLOUD_TOKEN':
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
-            return subprocess.check_output(
-                ['gcloud', 'auth', 'print-access-token']
-            ).rstrip()
-        except OSError:
-            return '!! gcloud not installed !!'
-    else:
-        return os.environ.get(env_var, default)
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 def _env_var_constructor(loader, node):
     """
     Replace a parsed environment variable with the value during YAML
-    parsing.
+    parsing. Values come from :mod:`wfinterop.credentials`: registered
+    credential providers (e.g., 'GCLOUD_TOKEN'), which are cached until
+    they expire, or else environment variables.
 
     Args:
         loader (Constructor): YAML :class:`Constructor` to use for
@@ -74,11 +76,11 @@ def _env_var_constructor(loader, node):
 
     Returns:
         str: string with matched environment variable replaced with
-            the corresponding value of the environment variable.
+            the corresponding value, which remembers the original string
+            (see :class:`wfinterop.credentials.ResolvedValue`)
     """
-    var = re.compile(r"\$\{([^}:\s]+):?([^}]+)?\}", re.VERBOSE)
     value = loader.construct_scalar(node)
-    return var.sub(_replace_env_var, value)
+    return credentials.expand(value)
 
 
 def setup_yaml_parser():
@@ -162,14 +164,22 @@ def get_json(filepath):
 
 def save_json(filepath, app_config):
     """
-    Write JSON data from a dict to a file.
+    Write JSON data from a dict to a file. The data is written to a
+    temporary file next to ``filepath`` that then replaces it, so readers
+    never see a partly written file.
 
     Args:
         filepath (str): local filepath of the JSON file
         app_config (dict): dict containing the data to write
     """
-    with open_file(filepath, 'w') as f:
-        json.dump(app_config, f, indent=4, default=str)
+    tmp_path = '{}.{}.tmp'.format(filepath, uuid.uuid4().hex)
+    try:
+        with open_file(tmp_path, 'w') as f:
+            json.dump(app_config, f, indent=4, default=str)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 
 def response_handler(response):
@@ -205,18 +215,70 @@ def convert_timedelta(duration):
 
     Args:
         duration (timedelta): :class:`timedelta` object representing
-            the difference between two :class:`datetime` objects
+            the difference between two :class:`datetime` objects, or a
+            number of seconds
 
     Returns:
         str: string representation of the duration
     """
-    _, seconds = duration.days, duration.seconds
+    if isinstance(duration, dt.timedelta):
+        duration = duration.total_seconds()
+    seconds = int(duration)
     hours = seconds // 3600
     minutes = (seconds % 3600) // 60
     seconds = (seconds % 60)
     return '{}h:{}m:{}s'.format(hours, minutes, seconds)
 
 
+def to_timestamp(value):
+    """
+    Read a stored timestamp as epoch seconds. Run records store epoch
+    seconds; older records stored `ctime()` style strings, which are
+    parsed for compatibility.
+
+    Args:
+        value: epoch seconds (number or numeric string), :class:`datetime`
+            object, or `ctime()` style string
+
+    Returns:
+        float: seconds since the epoch, or None if ``value`` is empty
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dt.datetime):
+        return value.timestamp()
+    try:
+        return float(value)
+    except ValueError:
+        return ctime2datetime(value).timestamp()
+
+
+def to_seconds(value):
+    """
+    Read a stored duration as seconds. Older records stored durations
+    formatted by :func:`convert_timedelta`, which are parsed for
+    compatibility.
+
+    Args:
+        value: number of seconds, or string like '1h:2m:3s'
+
+    Returns:
+        int: number of seconds (0 if ``value`` is empty)
+    """
+    if not value:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(float(value))
+    except ValueError:
+        hours, minutes, seconds = re.match(r'^(\d+)h:(\d+)m:(\d+)s$',
+                                           value).groups()
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
 class mock_response:
     """Mocked status code to return"""
     status_code = 200
@@ -8,6 +8,7 @@ from bravado.swagger_model import Loader
 from bravado.client import SwaggerClient
 
 from wfinterop.config import wes_config
+from wfinterop.credentials import AuthHeaders
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +34,8 @@ def _init_http_client(service_id=None, opts=None):
 
     http_client = RequestsClient()
     http_client.set_api_key(host=opts['host'],
-                            api_key=opts['auth'],
+                            # headers are filled in again for each request
+                            api_key=AuthHeaders(opts['auth']),
                             # param_name=auth_header[opts['auth_type']],
                             param_in='header')
     return http_client
@@ -102,7 +104,9 @@ def load_wes_client(service_id, http_client=None, client_library=None):
 
     if client_library is not None:
         from wes_client.util import WESClient
-        wes_client = WESClient(service=_get_wes_opts(service_id))
+        opts = _get_wes_opts(service_id)
+        wes_client = WESClient(service=dict(opts,
+                                            auth=AuthHeaders(opts['auth'])))
         return WESAdapter(wes_client)
 
     spec_path = os.path.join(os.path.dirname(os.path.dirname(__file__)),
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Incremental access to workflow run logs (stdout/stderr) served by a
+WES over HTTP. Logs are read with HTTP Range requests where the server
+supports them, so the tail of a large log, or only what was appended
+since the last read, can be fetched without downloading the whole file.
+Servers that ignore Range are handled by streaming the response and
+discarding what is not needed. Logs can also be spooled straight to disk,
+and truncated to fit size limits (e.g., Synapse annotations).
+"""
+import codecs
+import logging
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+TRUNCATION_MARKER = '\n[... {} characters truncated ...]\n'
+
+_session = None
+
+
+def get_session():
+    """
+    Return a process-wide :class:`requests.Session`, so log downloads
+    reuse pooled connections.
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+class LogStream(object):
+    """
+    Reader for a single run log URL.
+
+    :param str url: URL of the log file.
+    :param dict headers: Request headers (e.g., WES auth).
+    :param session: :class:`requests.Session` to use; defaults to the
+        shared session.
+    """
+    def __init__(self, url, headers=None, session=None):
+        self.url = url
+        self.headers = headers or {}
+        self.session = session or get_session()
+        self.offset = 0
+
+    def _get(self, byte_range=None):
+        headers = dict(self.headers)
+        if byte_range is not None:
+            headers['Range'] = 'bytes={}'.format(byte_range)
+        res = self.session.get(self.url, headers=headers, stream=True)
+        if res.status_code == 416:
+            # nothing at or beyond the requested offset
+            res.close()
+            return None
+        res.raise_for_status()
+        return res
+
+    def read_bytes(self, offset=0, limit=None):
+        """
+        Read raw bytes starting at ``offset``.
+
+        :param int offset: Byte offset to start from.
+        :param int limit: Maximum number of bytes to read.
+        :return: bytes read
+        """
+        if limit is not None and limit <= 0:
+            return b''
+        end = '' if limit is None else offset + limit - 1
+        res = self._get('{}-{}'.format(offset, end)
+                        if offset or limit is not None else None)
+        if res is None:
+            return b''
+        skip = offset if res.status_code == 200 else 0
+        data = bytearray()
+        with res:
+            for chunk in res.iter_content(CHUNK_SIZE):
+                if skip:
+                    dropped = min(skip, len(chunk))
+                    chunk = chunk[dropped:]
+                    skip -= dropped
+                data.extend(chunk)
+                if limit is not None and len(data) >= limit:
+                    break
+        return bytes(data if limit is None else data[:limit])
+
+    def read(self, offset=None, limit=None):
+        """
+        Read text from ``offset`` (default: where the last read stopped)
+        and advance the stream's offset.
+
+        :param int offset: Byte offset to start from.
+        :param int limit: Maximum number of bytes to read.
+        :return: decoded text
+        """
+        offset = self.offset if offset is None else offset
+        data = self.read_bytes(offset, limit)
+        self.offset = offset + len(data)
+        return data.decode('utf-8', errors='replace')
+
+    def tail(self, nbytes):
+        """
+        Read the last ``nbytes`` bytes of the log.
+
+        :param int nbytes: Number of bytes to read from the end.
+        :return: decoded text
+        """
+        res = self._get('-{}'.format(nbytes))
+        if res is None:
+            return ''
+        data = bytearray()
+        with res:
+            for chunk in res.iter_content(CHUNK_SIZE):
+                data.extend(chunk)
+                if res.status_code == 200 and len(data) > nbytes:
+                    del data[:len(data) - nbytes]
+        # skip a partial multi-byte character at the cut
+        return bytes(data[-nbytes:]).decode('utf-8', errors='ignore')
+
+    def follow(self, offset=None, interval=2, stop=None):
+        """
+        Yield text as it is appended to the log, starting at ``offset``
+        (default: the stream's current offset).
+
+        :param int offset: Byte offset to start from.
+        :param float interval: Seconds to wait between polls when no new
+            data is available.
+        :param stop: Callable returning True once following should end
+            (e.g., when the run reaches a terminal state); the log is read
+            once more after it returns True.
+        """
+        if offset is not None:
+            self.offset = offset
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            done = stop is not None and stop()
+            data = self.read_bytes(self.offset)
+            self.offset += len(data)
+            text = decoder.decode(data, final=done)
+            if text:
+                yield text
+            if done:
+                return
+            if not data:
+                time.sleep(interval)
+
+    def spool(self, path, offset=0):
+        """
+        Write the log to a local file without holding it in memory.
+
+        :param str path: Destination file path.
+        :param int offset: Byte offset to start from; if non-zero, data
+            is appended to ``path``.
+        :return: number of bytes written
+        """
+        res = self._get('{}-'.format(offset) if offset else None)
+        if res is None:
+            return 0
+        skip = offset if res.status_code == 200 else 0
+        written = 0
+        with res, open(path, 'ab' if offset else 'wb') as f:
+            for chunk in res.iter_content(CHUNK_SIZE):
+                if skip:
+                    dropped = min(skip, len(chunk))
+                    chunk = chunk[dropped:]
+                    skip -= dropped
+                f.write(chunk)
+                written += len(chunk)
+        self.offset = offset + written
+        return written
+
+
+def truncate_log(text, max_chars, policy='tail', marker=TRUNCATION_MARKER):
+    """
+    Shorten log text to at most ``max_chars`` characters.
+
+    :param str text: Log text.
+    :param int max_chars: Maximum length of the result.
+    :param str policy: Which part to keep: 'tail' (the end, where errors
+        usually are), 'head', or 'head_tail' (both ends).
+    :param str marker: Format string noting how much was cut; formatted
+        with the number of characters removed.
+    :return: text no longer than ``max_chars``
+    """
+    if text is None or len(text) <= max_chars:
+        return text
+    keep = max(max_chars - len(marker.format(len(text))), 0)
+    note = marker.format(len(text) - keep)
+    if keep == 0:
+        return text[-max_chars:] if policy != 'head' else text[:max_chars]
+    if policy == 'head':
+        return text[:keep] + note
+    if policy == 'head_tail':
+        head = keep // 2
+        return text[:head] + note + text[len(text) - (keep - head):]
+    if policy == 'tail':
+        return note + text[len(text) - keep:]
+    raise ValueError("Unknown truncation policy: {}".format(policy))
@@ -2,9 +2,11 @@
 """
 """
 import logging
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
+from wfinterop import metrics, tracing
 from wfinterop.wes.client import load_wes_client
+from wfinterop.wes.logs import LogStream
 from wfinterop.util import response_handler
 from wfinterop.config import wes_config
 
@@ -13,6 +15,18 @@ logger = logging.getLogger(__name__)
 wes_client = 'workflow-service'
 
 
+def _instrument(endpoint):
+    """Count, time and trace calls to a WES endpoint, per service."""
+    def decorator(func):
+        service_id = lambda self, *args, **kwargs: self.id  # noqa: E731
+        func = metrics.instrument(metrics.WES_REQUESTS,
+                                  metrics.WES_REQUEST_SECONDS,
+                                  wes_id=service_id,
+                                  endpoint=endpoint)(func)
+        return tracing.traced('WES.' + endpoint, wes_id=service_id)(func)
+    return decorator
+
+
 class WES(object):
     """
     Build a :class:`WES` instance for interacting with a server via
@@ -28,6 +42,7 @@ class WES(object):
                                          client_library=wes_client)
         self.api_client = api_client
 
+    @_instrument('GetServiceInfo')
     def get_service_info(self):
         """
         Get information about Workflow Execution Service.
@@ -35,6 +50,7 @@ class WES(object):
         res = self.api_client.GetServiceInfo()
         return response_handler(res)
 
+    @_instrument('ListRuns')
     def list_runs(self):
         """
         List all the workflow runs in order of oldest to newest.
@@ -42,6 +58,7 @@ class WES(object):
         res = self.api_client.ListRuns()
         return response_handler(res)
 
+    @_instrument('RunWorkflow')
     def run_workflow(self, request, parts=None):
         """
         Create a new workflow run and retrieve its tracking ID
@@ -53,6 +70,7 @@ class WES(object):
         res = self.api_client.RunWorkflow(request, parts)
         return response_handler(res)
 
+    @_instrument('CancelRun')
     def cancel_run(self, id):
         """
         Cancel a running workflow.
@@ -62,6 +80,7 @@ class WES(object):
         res = self.api_client.CancelRun(id)
         return response_handler(res)
 
+    @_instrument('GetRunLog')
     def get_run(self, id):
         """
         Get detailed info about a workflow run.
@@ -71,6 +90,7 @@ class WES(object):
         res = self.api_client.GetRunLog(id)
         return response_handler(res)
 
+    @_instrument('GetRunStatus')
     def get_run_status(self, id):
         """
         Get quick status info about a workflow run.
@@ -80,24 +100,80 @@ class WES(object):
         res = self.api_client.GetRunStatus(id)
         return response_handler(res)
 
-    def get_run_stderr(self, id):
+    def get_run_stream(self, id, stream='stderr'):
         """
-        Get stderr from workflow run log.
+        Get a reader for stdout or stderr from workflow run log, for
+        ranged, tail, follow or spooled access.
 
         :param str id:
+        :param str stream: 'stdout' or 'stderr'
+        :rtype: :class:`wfinterop.wes.logs.LogStream`
         """
-        stderr_url = self.get_run(id)['run_log']['stderr']
+        log_url = self.get_run(id)['run_log'][stream]
         auth = wes_config()[self.id]['auth']
-        res = requests.get(stderr_url, headers=auth)
-        return res.text
+        return LogStream(log_url, headers=auth)
 
-    def get_run_stdout(self, id):
+    def get_run_stderr(self, id, tail=None):
+        """
+        Get stderr from workflow run log.
+
+        :param str id:
+        :param int tail: If set, only get the last ``tail`` bytes.
+        """
+        log_stream = self.get_run_stream(id, 'stderr')
+        return log_stream.read() if tail is None else log_stream.tail(tail)
+
+    def get_run_stdout(self, id, tail=None):
         """
         Get stdout from workflow run log.
 
         :param str id:
+        :param int tail: If set, only get the last ``tail`` bytes.
+        """
+        log_stream = self.get_run_stream(id, 'stdout')
+        return log_stream.read() if tail is None else log_stream.tail(tail)
+
+    def get_run_logs(self, id, tail=None, task_logs=False):
         """
-        stdout_url = self.get_run(id)['run_log']['stdout']
+        Get stdout and stderr from workflow run log with a single
+        GetRunLog request, downloading the streams concurrently. If a
+        stream cannot be downloaded, its text is the error message.
+
+        :param str id:
+        :param int tail: If set, only get the last ``tail`` bytes of
+            each stream.
+        :param bool task_logs: If True, also get stdout and stderr for
+            each task in the run.
+        :return: dict with 'stdout' and 'stderr' keys, plus 'task_logs'
+            (list of dicts with 'name', 'stdout' and 'stderr') if requested
+        """
+        run = self.get_run(id)
         auth = wes_config()[self.id]['auth']
-        res = requests.get(stdout_url, headers=auth)
-        return res.text
+        logs = [run['run_log']]
+        if task_logs:
+            logs += run.get('task_logs') or []
+
+        def download(log_url):
+            if not log_url:
+                return ''
+            log_stream = LogStream(log_url, headers=auth)
+            try:
+                return (log_stream.read() if tail is None
+                        else log_stream.tail(tail))
+            except Exception as err:
+                return str(err)
+
+        urls = [log.get(stream) for log in logs
+                for stream in ('stdout', 'stderr')]
+        with ThreadPoolExecutor(max_workers=min(len(urls), 8)) as pool:
+            texts = list(pool.map(download, urls))
+
+        run_logs = {'stdout': texts[0], 'stderr': texts[1]}
+        if task_logs:
+            run_logs['task_logs'] = [
+                {'name': log.get('name'),
+                 'stdout': texts[2 * i],
+                 'stderr': texts[2 * i + 1]}
+                for i, log in enumerate(logs) if i > 0
+            ]
+        return run_logs